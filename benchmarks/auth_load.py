@@ -0,0 +1,40 @@
+import argparse
+import asyncio
+
+from benchmarks.common import api_client, login, report, run_clients
+
+
+async def main(args: argparse.Namespace):
+    """
+    The main function loads an authenticated endpoint of a running API from many concurrent clients
+    sharing one access token, so every request goes through get_current_user, and prints the throughput
+    and the latency. Run it against the API before and after a change of the auth path.
+
+    Usage: python -m benchmarks.auth_load --email EMAIL --password PASSWORD
+           [--url http://localhost:8000] [--path /api/posts/?limit=1] [--clients 500] [--duration 30]
+
+    :param args: argparse.Namespace: The command line arguments
+    :return: None
+    """
+    async with api_client(args.url, args.clients) as client:
+        headers = await login(client, args.email, args.password)
+
+        async def call():
+            response = await client.get(args.path, headers=headers)
+            return response.status_code == 200
+
+        # open the connections before measuring
+        await run_clients(args.clients, 2, call)
+        samples, errors, elapsed = await run_clients(args.clients, args.duration, call)
+        report(f"{args.clients} clients GET {args.path}", samples, elapsed, errors)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput of authenticated requests")
+    parser.add_argument("--url", default="http://localhost:8000", help="the base url of the API")
+    parser.add_argument("--email", required=True, help="the email of a confirmed user")
+    parser.add_argument("--password", required=True, help="the password of the user")
+    parser.add_argument("--path", default="/api/posts/?limit=1", help="the authenticated endpoint")
+    parser.add_argument("--clients", type=int, default=500, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    asyncio.run(main(parser.parse_args()))
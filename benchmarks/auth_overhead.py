@@ -0,0 +1,79 @@
+import argparse
+import asyncio
+import time
+import uuid
+
+import fakeredis
+from jose import jwt
+
+from src.schemas.user import Principal
+from src.services.auth import auth_service
+from src.services.principals import principal_cache
+
+
+def per_call(count: int, call) -> float:
+    """
+    The per_call function runs call count times and returns the average time of a call in microseconds.
+
+    :param count: int: The number of calls
+    :param call: A function of the call number
+    :return: Microseconds per call
+    """
+    start = time.perf_counter()
+    for i in range(count):
+        call(i)
+    return (time.perf_counter() - start) / count * 1e6
+
+
+async def per_await(count: int, call) -> float:
+    """
+    The per_await function is per_call for a coroutine function.
+
+    :param count: int: The number of calls
+    :param call: A coroutine function of the call number
+    :return: Microseconds per call
+    """
+    start = time.perf_counter()
+    for i in range(count):
+        await call(i)
+    return (time.perf_counter() - start) / count * 1e6
+
+
+async def main(args: argparse.Namespace):
+    """
+    The main function measures the time the auth dependency spends on a request in this process:
+    verifying a token from scratch, as every request did before the token cache, a token cache hit,
+    and the whole get_current_user with the principal in the local tier of the principal cache.
+    Redis is faked, with the principal cached locally the dependency does not call it.
+
+    Usage: python -m benchmarks.auth_overhead [--count 20000]
+
+    :param args: argparse.Namespace: The command line arguments
+    :return: None
+    """
+    email = "benchmark@example.com"
+    principal = Principal(id=uuid.uuid4(), email=email, username="benchmark", user_type_id=1)
+    principal_cache.init(fakeredis.FakeAsyncRedis())
+
+    async def load():
+        return principal
+
+    await principal_cache.get(email, load)
+    token = await auth_service.create_access_token(data={"sub": email, "ver": 0})
+    tokens = [await auth_service.create_access_token(data={"sub": email, "ver": 0}) for _ in range(args.count)]
+
+    decode = per_call(args.count, lambda i: jwt.decode(token, auth_service.SECRET_KEY,
+                                                       algorithms=[auth_service.ALGORITHM]))
+    print(f"jwt.decode: {decode:.1f} us/call")
+    auth_service.decode_token(token)
+    print(f"decode_token, cache hit: {per_call(args.count, lambda i: auth_service.decode_token(token)):.1f} us/call")
+    print(f"decode_token, cache miss: {per_call(args.count, lambda i: auth_service.decode_token(tokens[i])):.1f} "
+          f"us/call")
+    overhead = await per_await(args.count, lambda i: auth_service.get_current_user(token, None))
+    print(f"get_current_user, cached principal: {overhead:.1f} us/call")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Overhead of the auth dependency per request")
+    parser.add_argument("--count", type=int, default=20000, help="calls per measurement")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,91 @@
+import asyncio
+import math
+import time
+from typing import Awaitable, Callable, List
+
+import httpx
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """
+    The percentile function returns the q-th percentile of samples by the nearest rank.
+
+    :param samples: List[float]: The measurements
+    :param q: float: The percentile, between 0 and 100
+    :return: The percentile or nan if there are no samples
+    """
+    if not samples:
+        return math.nan
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def report(name: str, samples: List[float], elapsed: float | None = None, errors: int = 0):
+    """
+    The report function prints the number, the rate and the p50, p99 and max of latencies in milliseconds.
+
+    :param name: str: What was measured
+    :param samples: List[float]: The latencies in seconds
+    :param elapsed: float | None: The duration of the run in seconds, to print the rate
+    :param errors: int: The number of failed operations
+    :return: None
+    """
+    rate = f", {len(samples) / elapsed:.1f}/s" if elapsed else ""
+    print(f"{name}: {len(samples)} ok, {errors} errors{rate}, p50 {percentile(samples, 50) * 1000:.1f} ms, "
+          f"p99 {percentile(samples, 99) * 1000:.1f} ms, max {max(samples, default=math.nan) * 1000:.1f} ms")
+
+
+async def login(client: httpx.AsyncClient, email: str, password: str) -> dict:
+    """
+    The login function logs a confirmed user in and returns the headers of authenticated requests.
+
+    :param client: httpx.AsyncClient: The client of the API
+    :param email: str: The email of the user
+    :param password: str: The password of the user
+    :return: The headers with the access token
+    """
+    response = await client.post("/api/auth/login", data={"username": email, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def run_clients(clients: int, duration: float, call: Callable[[], Awaitable[bool]]) -> tuple:
+    """
+    The run_clients function runs call in a loop from clients concurrent clients for duration seconds.
+
+    :param clients: int: The number of concurrent clients
+    :param duration: float: Seconds to run
+    :param call: Callable[[], Awaitable[bool]]: One operation, returns False or raises if it failed
+    :return: The latencies of the successful calls in seconds, the number of failures and the elapsed time
+    """
+    samples, errors = [], 0
+    deadline = time.monotonic() + duration
+
+    async def client():
+        nonlocal errors
+        while time.monotonic() < deadline:
+            start = time.monotonic()
+            try:
+                ok = await call()
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                samples.append(time.monotonic() - start)
+            else:
+                errors += 1
+
+    start = time.monotonic()
+    await asyncio.gather(*[client() for _ in range(clients)])
+    return samples, errors, time.monotonic() - start
+
+
+def api_client(url: str, connections: int) -> httpx.AsyncClient:
+    """
+    The api_client function creates a client of the API with enough connections for every concurrent client.
+
+    :param url: str: The base url of the API
+    :param connections: int: The number of concurrent requests
+    :return: The client
+    """
+    return httpx.AsyncClient(base_url=url, timeout=60,
+                             limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections))
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import re
+import sys
+import time
+
+PUBLIC_ID = re.compile(rb'name="public_id"\r\n\r\n([^\r]*)\r\n')
+
+
+class FakeCloudinary:
+    """
+    A local HTTP server that answers the upload, destroy, resource and ping calls of the Cloudinary SDK
+    after a fixed delay, without storing anything. It stands in for a slow provider when measuring how
+    uploads affect the other requests of the API. Run the API against it with
+    CLOUDINARY_CLOUD_NAME=admin CLOUDINARY_UPLOAD_PREFIX=http://localhost:8765 MEDIA_BACKEND=cloudinary.
+    """
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.requests = 0
+        self.started = time.monotonic()
+
+    async def read_body(self, reader: asyncio.StreamReader, headers: dict) -> bytes:
+        """
+        The read_body function reads the body of a request with a Content-Length or chunked encoding.
+
+        :param self: Represent the instance of the class
+        :param reader: asyncio.StreamReader: The incoming stream
+        :param headers: dict: The headers of the request, lowercase names
+        :return: The body
+        """
+        if headers.get("transfer-encoding") == "chunked":
+            body = b""
+            while size := int((await reader.readline()).strip() or b"0", 16):
+                body += await reader.readexactly(size)
+                await reader.readline()
+            await reader.readline()
+            return body
+        return await reader.readexactly(int(headers.get("content-length", 0)))
+
+    def answer(self, path: str, body: bytes) -> dict:
+        """
+        The answer function builds the JSON Cloudinary would return for a call.
+
+        :param self: Represent the instance of the class
+        :param path: str: The path of the request
+        :param body: bytes: The body of the request
+        :return: The response payload
+        """
+        if path.endswith("/ping"):
+            return {"status": "ok"}
+        if path.endswith("/destroy"):
+            return {"result": "ok"}
+        match = PUBLIC_ID.search(body)
+        public_id = match.group(1).decode() if match else path.split("/upload/", 1)[-1]
+        version = int(time.time())
+        url = f"https://res.cloudinary.com/admin/image/upload/v{version}/{public_id}.png"
+        return {"public_id": public_id, "version": version, "width": 1000, "height": 1000, "format": "png",
+                "resource_type": "image", "bytes": len(body), "url": url, "secure_url": url}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        The handle function serves the requests of one keep-alive connection.
+
+        :param self: Represent the instance of the class
+        :param reader: asyncio.StreamReader: The incoming stream
+        :param writer: asyncio.StreamWriter: The outgoing stream
+        :return: None
+        """
+        try:
+            while request_line := await reader.readline():
+                method, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b""):
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await self.read_body(reader, headers)
+                if method == "POST" or "/resources/" in path:
+                    await asyncio.sleep(self.delay)
+                payload = json.dumps(self.answer(path.split("?", 1)[0], body)).encode()
+                self.requests += 1
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: %d\r\n\r\n%s" % (len(payload), payload))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def report(self, interval: float = 5):
+        """
+        The report function prints the number of answered calls and the rate since the start.
+
+        :param self: Represent the instance of the class
+        :param interval: float: Seconds between reports
+        :return: None
+        """
+        while True:
+            await asyncio.sleep(interval)
+            elapsed = time.monotonic() - self.started
+            print(f"{self.requests} calls, {self.requests / elapsed:.1f} calls/s")
+
+
+async def main(port: int, delay: float):
+    """
+    The main function serves the fake on localhost until the process is stopped.
+
+    Usage: python -m benchmarks.fake_cloudinary [port] [delay]
+
+    :param port: int: The port, 8765 by default
+    :param delay: float: Seconds every upload, destroy and resource call takes, 0.5 by default
+    :return: None
+    """
+    fake = FakeCloudinary(delay)
+    server = await asyncio.start_server(fake.handle, "localhost", port)
+    print(f"Fake Cloudinary listening on localhost:{port}, calls take {delay}s")
+    async with server:
+        await asyncio.gather(server.serve_forever(), fake.report())
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 8765,
+                         float(sys.argv[2]) if len(sys.argv) > 2 else 0.5))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,86 @@
+import argparse
+import asyncio
+import io
+import json
+import time
+import uuid
+import zipfile
+from collections import Counter
+
+from PIL import Image
+
+from benchmarks.common import api_client, login, report
+
+
+def archive(names: list, size: int) -> bytes:
+    """
+    The archive function packs one distinct PNG per name into a zip archive, stored without compression.
+
+    :param names: list: The names of the posts, the files are named after them
+    :param size: int: The width and height of the images in pixels
+    :return: The zip bytes
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as zip_file:
+        for number, name in enumerate(names):
+            image = io.BytesIO()
+            Image.new("RGB", (size, size), (number % 256, number // 256 % 256, 128)).save(image, "PNG")
+            zip_file.writestr(f"{name}.png", image.getvalue())
+    return buffer.getvalue()
+
+
+async def main(args: argparse.Namespace):
+    """
+    The main function imports args.posts new posts into a running API through the batch ingest endpoint,
+    args.batch posts per request and args.concurrency requests at a time, and prints the posts per second.
+    The archives are built before the clock starts.
+
+    Usage: python -m benchmarks.ingest --email EMAIL --password PASSWORD
+           [--url http://localhost:8000] [--posts 5000] [--batch 500] [--concurrency 2] [--size 256]
+
+    :param args: argparse.Namespace: The command line arguments
+    :return: None
+    """
+    run = uuid.uuid4().hex[:8]
+    names = [f"ingest {run} {number}" for number in range(args.posts)]
+    batches = [names[start:start + args.batch] for start in range(0, len(names), args.batch)]
+    archives = [archive(batch, args.size) for batch in batches]
+    statuses = Counter()
+    samples = []
+    slots = asyncio.Semaphore(args.concurrency)
+
+    async with api_client(args.url, args.concurrency) as client:
+        headers = await login(client, args.email, args.password)
+
+        async def ingest(batch: list, data: bytes):
+            manifest = {"items": [{"name": name, "content": "benchmark", "tags": ["benchmark"], "file": f"{name}.png"}
+                                  for name in batch]}
+            async with slots:
+                start = time.monotonic()
+                response = await client.post("/api/posts/ingest", headers=headers,
+                                             data={"manifest": json.dumps(manifest)},
+                                             files={"archive": ("posts.zip", data, "application/zip")})
+                samples.append(time.monotonic() - start)
+            if response.status_code != 200:
+                statuses[f"HTTP {response.status_code}"] += len(batch)
+                return
+            statuses.update(result["status"] for result in response.json())
+
+        start = time.monotonic()
+        await asyncio.gather(*[ingest(batch, data) for batch, data in zip(batches, archives)])
+        elapsed = time.monotonic() - start
+    report(f"ingest requests of {args.batch} posts", samples, elapsed)
+    print(f"{statuses['created'] / elapsed:.1f} posts/s,",
+          ", ".join(f"{status}: {count}" for status, count in sorted(statuses.items())))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput of the batch ingest endpoint")
+    parser.add_argument("--url", default="http://localhost:8000", help="the base url of the API")
+    parser.add_argument("--email", required=True, help="the email of a confirmed user")
+    parser.add_argument("--password", required=True, help="the password of the user")
+    parser.add_argument("--posts", type=int, default=5000, help="the number of posts to import")
+    parser.add_argument("--batch", type=int, default=500, help="posts per request, at most INGEST_BATCH_SIZE")
+    parser.add_argument("--concurrency", type=int, default=2, help="requests at a time")
+    parser.add_argument("--size", type=int, default=256, help="the width and height of the images")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,50 @@
+import argparse
+import asyncio
+from collections import Counter
+
+from benchmarks.common import api_client, login, report, run_clients
+
+
+async def main(args: argparse.Namespace):
+    """
+    The main function measures p50 and p99 of the posts feed of a running API, first alone and then
+    during a storm of logins that all have to check a password, and counts how the logins were answered.
+    With the password pool saturated, logins over the queue limit are answered with 503 right away.
+
+    Usage: python -m benchmarks.login_storm --email EMAIL --password PASSWORD
+           [--url http://localhost:8000] [--logins 200] [--readers 10] [--duration 20]
+
+    :param args: argparse.Namespace: The command line arguments
+    :return: None
+    """
+    statuses = Counter()
+    async with api_client(args.url, args.readers + args.logins) as client:
+        headers = await login(client, args.email, args.password)
+
+        async def read():
+            response = await client.get("/api/posts/", params={"limit": 20}, headers=headers)
+            return response.status_code == 200
+
+        async def log_in():
+            response = await client.post("/api/auth/login", data={"username": args.email, "password": args.password})
+            statuses[response.status_code] += 1
+            return response.status_code == 200
+
+        samples, errors, elapsed = await run_clients(args.readers, args.duration, read)
+        report("feed alone", samples, elapsed, errors)
+        (samples, errors, elapsed), (logins, failed, _) = await asyncio.gather(
+            run_clients(args.readers, args.duration, read), run_clients(args.logins, args.duration, log_in))
+        report(f"feed during {args.logins} concurrent logins", samples, elapsed, errors)
+        report("logins", logins, elapsed, failed)
+        print("login responses:", ", ".join(f"{code}: {count}" for code, count in sorted(statuses.items())))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency of the feed during a login storm")
+    parser.add_argument("--url", default="http://localhost:8000", help="the base url of the API")
+    parser.add_argument("--email", required=True, help="the email of a confirmed user")
+    parser.add_argument("--password", required=True, help="the password of the user")
+    parser.add_argument("--logins", type=int, default=200, help="concurrent logins")
+    parser.add_argument("--readers", type=int, default=10, help="concurrent readers of the feed")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of every phase")
+    asyncio.run(main(parser.parse_args()))
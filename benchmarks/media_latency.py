@@ -0,0 +1,66 @@
+import argparse
+import asyncio
+import io
+import json
+import uuid
+
+from PIL import Image
+
+from benchmarks.common import api_client, login, report, run_clients
+
+
+def image(size: int = 512) -> bytes:
+    """
+    The image function makes a PNG to upload.
+
+    :param size: int: The width and height in pixels
+    :return: The PNG bytes
+    """
+    buffer = io.BytesIO()
+    Image.new("RGB", (size, size), "teal").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+async def main(args: argparse.Namespace):
+    """
+    The main function measures the latency of the posts feed of a running API, first alone and then
+    while uploads keep args.uploads create_post requests in flight. Run the API against
+    benchmarks.fake_cloudinary, so every upload waits for the fake provider and no real account is used.
+
+    Usage: python -m benchmarks.media_latency --email EMAIL --password PASSWORD
+           [--url http://localhost:8000] [--uploads 50] [--readers 10] [--duration 20]
+
+    :param args: argparse.Namespace: The command line arguments
+    :return: None
+    """
+    png = image()
+    async with api_client(args.url, args.readers + args.uploads) as client:
+        headers = await login(client, args.email, args.password)
+
+        async def read():
+            response = await client.get("/api/posts/", params={"limit": 20}, headers=headers)
+            return response.status_code == 200
+
+        async def upload():
+            data = {"data": json.dumps({"name": f"benchmark {uuid.uuid4()}", "content": "benchmark", "tags": []})}
+            response = await client.post("/api/posts/create", data=data, headers=headers,
+                                         files={"file": ("image.png", png, "image/png")})
+            return response.status_code == 200
+
+        samples, errors, elapsed = await run_clients(args.readers, args.duration, read)
+        report("feed alone", samples, elapsed, errors)
+        (samples, errors, elapsed), (uploaded, failed, _) = await asyncio.gather(
+            run_clients(args.readers, args.duration, read), run_clients(args.uploads, args.duration, upload))
+        report(f"feed during {args.uploads} uploads", samples, elapsed, errors)
+        report("uploads", uploaded, elapsed, failed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency of the feed while uploads are running")
+    parser.add_argument("--url", default="http://localhost:8000", help="the base url of the API")
+    parser.add_argument("--email", required=True, help="the email of a confirmed user")
+    parser.add_argument("--password", required=True, help="the password of the user")
+    parser.add_argument("--uploads", type=int, default=50, help="concurrent uploads")
+    parser.add_argument("--readers", type=int, default=10, help="concurrent readers of the feed")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of every phase")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,113 @@
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import select, text
+
+from benchmarks.common import report
+from src.database.db import sessionmanager
+from src.entity.models import Post
+from src.repository.loaders import POST_RESPONSE
+from src.repository.pagination import POSTS_BY_DATE, encode_cursor, keyset, paginate
+
+DEPTHS = (10, 1000, 100000)
+
+SEED_POSTS = text("""
+    INSERT INTO posts (name, content, image_url, image_id, user_id, created_at, updated_at)
+    SELECT 'benchmark ' || i, 'post ' || i, 'url', 'image', (SELECT id FROM users ORDER BY created_at LIMIT 1),
+           now() - make_interval(secs => i), now()
+    FROM generate_series(1, :rows) AS i
+""")
+
+
+async def seed(rows: int):
+    """
+    The seed function adds rows posts of the oldest user, one second apart, and refreshes the statistics.
+
+    :param rows: int: The number of posts
+    :return: None
+    """
+    async with sessionmanager.session() as db:
+        await db.execute(SEED_POSTS, {"rows": rows})
+        await db.commit()
+        await db.execute(text("ANALYZE posts"))
+
+
+async def offset_page(depth: int, limit: int) -> list:
+    """
+    The offset_page function reads a page of the feed the way the listing did before cursors, skipping depth rows.
+
+    :param depth: int: The number of rows before the page
+    :param limit: int: The page size
+    :return: The posts of the page
+    """
+    async with sessionmanager.session() as db:
+        stmt = keyset(select(Post).options(*POST_RESPONSE), POSTS_BY_DATE, None).offset(depth).limit(limit)
+        return (await db.execute(stmt)).scalars().all()
+
+
+async def keyset_page(cursor: str, limit: int) -> list:
+    """
+    The keyset_page function reads the same page of the feed after the cursor of the row before it.
+
+    :param cursor: str: The cursor of the row before the page
+    :param limit: int: The page size
+    :return: The posts of the page
+    """
+    async with sessionmanager.session() as db:
+        posts, _ = await paginate(select(Post).options(*POST_RESPONSE), POSTS_BY_DATE, cursor, limit, db)
+        return posts
+
+
+async def cursor_at(depth: int) -> str | None:
+    """
+    The cursor_at function returns the cursor of the depth-th row of the feed.
+
+    :param depth: int: The position of the row, from 1
+    :return: The cursor or None if the feed is shorter
+    """
+    async with sessionmanager.session() as db:
+        stmt = keyset(select(*POSTS_BY_DATE), POSTS_BY_DATE, None).offset(depth - 1).limit(1)
+        row = (await db.execute(stmt)).first()
+    return encode_cursor(row) if row else None
+
+
+async def measure(read, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await read()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def main(args: argparse.Namespace):
+    """
+    The main function compares the latency of an OFFSET page with the keyset page at the same depth
+    of the posts feed, on the database of the settings.
+
+    Usage: python -m benchmarks.pagination [--seed ROWS] [--limit 20] [--repeat 50]
+
+    :param args: argparse.Namespace: The command line arguments
+    :return: None
+    """
+    if args.seed:
+        await seed(args.seed)
+    for depth in DEPTHS:
+        cursor = await cursor_at(depth)
+        if cursor is None:
+            print(f"The feed has fewer than {depth} posts, seed more with --seed")
+            break
+        first = await offset_page(depth, args.limit)
+        assert [post.id for post in first] == [post.id for post in await keyset_page(cursor, args.limit)]
+        report(f"OFFSET {depth}", await measure(lambda: offset_page(depth, args.limit), args.repeat))
+        report(f"keyset {depth}", await measure(lambda: keyset_page(cursor, args.limit), args.repeat))
+    await sessionmanager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OFFSET vs keyset pagination of the posts feed")
+    parser.add_argument("--seed", type=int, default=0, help="add this many posts first")
+    parser.add_argument("--limit", type=int, default=20, help="the page size")
+    parser.add_argument("--repeat", type=int, default=50, help="reads per depth and mode")
+    asyncio.run(main(parser.parse_args()))
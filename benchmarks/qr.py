@@ -0,0 +1,65 @@
+import argparse
+import asyncio
+import os
+import time
+
+from src.services.qr import QrService, render_qr
+
+
+def one_core(count: int) -> float:
+    """
+    The one_core function renders count distinct QR codes one after the other in this process.
+
+    :param count: int: The number of QR codes
+    :return: QR codes per second
+    """
+    start = time.perf_counter()
+    for i in range(count):
+        render_qr(f"https://res.cloudinary.com/admin/image/upload/c_fill,h_250,w_250/v1/post/{i}")
+    return count / (time.perf_counter() - start)
+
+
+async def many_cores(count: int, workers: int) -> tuple:
+    """
+    The many_cores function renders count distinct QR codes with the QR service and workers processes,
+    then the same ones again, which are served from the memo.
+
+    :param count: int: The number of QR codes
+    :param workers: int: The number of worker processes
+    :return: QR codes per second rendered and from the memo
+    """
+    service = QrService(workers=workers, memo_size=count)
+    data = [f"https://res.cloudinary.com/admin/image/upload/c_fill,h_250,w_250/v2/post/{i}" for i in range(count)]
+    try:
+        # start the processes and import qrcode in them before measuring
+        await service.render_many([f"warm up {i}" for i in range(workers)])
+        start = time.perf_counter()
+        await service.render_many(data)
+        rendered = count / (time.perf_counter() - start)
+        start = time.perf_counter()
+        await service.render_many(data)
+        remembered = count / (time.perf_counter() - start)
+    finally:
+        service.shutdown()
+    return rendered, remembered
+
+
+def main(args: argparse.Namespace):
+    """
+    The main function prints how many QR codes per second are rendered on one core and on N cores.
+
+    Usage: python -m benchmarks.qr [--count 2000] [--workers N]
+
+    :param args: argparse.Namespace: The command line arguments
+    :return: None
+    """
+    print(f"1 core: {one_core(args.count):.0f} QR codes/s")
+    rendered, remembered = asyncio.run(many_cores(args.count, args.workers))
+    print(f"{args.workers} processes: {rendered:.0f} QR codes/s, {remembered:.0f} QR codes/s from the memo")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="QR codes per second on one and on N cores")
+    parser.add_argument("--count", type=int, default=2000, help="distinct QR codes per run")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    main(parser.parse_args())
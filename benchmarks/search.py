@@ -0,0 +1,111 @@
+import argparse
+import asyncio
+import random
+import time
+
+from sqlalchemy import String, bindparam, text
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from benchmarks.common import report
+from src.database.db import sessionmanager
+from src.repository.search import fulltext_search, get_post_by_keyword
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "to", "vi", "ze", "po", "da", "fe", "gu", "hi", "jo"]
+
+# every post gets a name of two words and a content of twenty words of the vocabulary
+SEED_POSTS = text("""
+    INSERT INTO posts (name, content, image_url, image_id, user_id, created_at, updated_at)
+    SELECT words[1 + floor(random() * cardinality(words))::int] || ' '
+               || words[1 + floor(random() * cardinality(words))::int],
+           array_to_string(ARRAY(SELECT words[1 + floor(random() * cardinality(words))::int]
+                                 FROM generate_series(1, 20) WHERE i > 0), ' '),
+           'url', 'image', (SELECT id FROM users ORDER BY created_at LIMIT 1),
+           now() - make_interval(secs => i), now()
+    FROM generate_series(1, :rows) AS i, (SELECT :words AS words) AS vocabulary
+""").bindparams(bindparam("words", type_=ARRAY(String)))
+
+
+def vocabulary(size: int) -> list:
+    """
+    The vocabulary function makes up size distinct words of three syllables, the same ones on every run.
+
+    :param size: int: The number of words
+    :return: A list of words
+    """
+    words = [a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES]
+    random.Random(0).shuffle(words)
+    return words[:size]
+
+
+async def seed(rows: int, words: list, batch: int = 100000):
+    """
+    The seed function adds rows synthetic posts of the oldest user in batches and refreshes the statistics.
+
+    :param rows: int: The number of posts
+    :param words: list: The vocabulary of the posts
+    :param batch: int: The number of posts inserted per transaction
+    :return: None
+    """
+    async with sessionmanager.session() as db:
+        for start in range(0, rows, batch):
+            await db.execute(SEED_POSTS, {"rows": min(batch, rows - start), "words": words})
+            await db.commit()
+            print(f"{min(start + batch, rows)} posts added")
+        await db.execute(text("ANALYZE posts"))
+
+
+async def like_search(keyword: str, limit: int):
+    async with sessionmanager.session() as db:
+        return await get_post_by_keyword(False, False, keyword, limit, None, db)
+
+
+async def fulltext(query: str, limit: int, by_date: bool = False):
+    async with sessionmanager.session() as db:
+        return await fulltext_search(query, None, by_date, False, limit, None, db)
+
+
+async def measure(search, queries: list, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            await search(query)
+            samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def main(args: argparse.Namespace):
+    """
+    The main function compares the latency of the LIKE keyword search with the full-text search
+    on the database of the settings. The queries are whole words, prefixes and misspelt words of the vocabulary.
+
+    Usage: python -m benchmarks.search [--seed 1000000] [--words 3000] [--limit 20] [--repeat 5]
+
+    :param args: argparse.Namespace: The command line arguments
+    :return: None
+    """
+    words = vocabulary(args.words)
+    if args.seed:
+        await seed(args.seed, words)
+    picked = random.Random(1).sample(words, 10)
+    cases = {
+        "word": picked,
+        "prefix": [word[:4] for word in picked],
+        "two words": [f"{a} {b}" for a, b in zip(picked, reversed(picked))],
+        "typo": [word[:-1] + ("a" if word[-1] != "a" else "o") for word in picked],
+    }
+    for name, queries in cases.items():
+        report(f"LIKE {name}", await measure(lambda query: like_search(query, args.limit), queries, args.repeat))
+        report(f"full-text {name}", await measure(lambda query: fulltext(query, args.limit), queries, args.repeat))
+        report(f"full-text {name} by date",
+               await measure(lambda query: fulltext(query, args.limit, by_date=True), queries, args.repeat))
+    await sessionmanager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LIKE vs full-text search of posts")
+    parser.add_argument("--seed", type=int, default=0, help="add this many synthetic posts first")
+    parser.add_argument("--words", type=int, default=3000, help="the size of the vocabulary of the posts")
+    parser.add_argument("--limit", type=int, default=20, help="the page size")
+    parser.add_argument("--repeat", type=int, default=5, help="runs of every query")
+    asyncio.run(main(parser.parse_args()))
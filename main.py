@@ -14,9 +14,18 @@ from fastapi.staticfiles import StaticFiles
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 
-from src.database.db import get_db
+from src.database.db import get_db, sessionmanager, track_writes, READ_PRIMARY_COOKIE
+from src.entity.models import User
 from src.routes import auth, users, posts, tags, comments, transformation, rating, search
 from src.conf.config import settings
+from src.services.auth import auth_service
+from src.services.cache import cache_service
+from src.services.media import media_storage
+from src.services.qr import qr_service
+from src.services.principals import principal_cache
+from src.services.jobs import job_queue
+import src.services.tasks  # noqa: F401, registers the jobs
+from src.services.passwords import password_hasher
 
 app = FastAPI()
 
@@ -68,6 +77,26 @@ async def ban_ips(request: Request, call_next: Callable):
     return response
 
 
+@app.middleware("http")
+async def read_your_writes(request: Request, call_next: Callable):
+    """
+    The read_your_writes function is a middleware that marks clients that have just written to the database.
+    Their reads go to the primary for DB_READ_YOUR_WRITES_WINDOW seconds, so they see their own writes
+    even if the replicas lag behind.
+
+    :param request: Request: The incoming request
+    :param call_next: Callable: Pass the next function in the middleware chain
+    :return: The response, with the read primary cookie if the request wrote
+    """
+    if not sessionmanager.replicas:
+        return await call_next(request)
+    writes = track_writes()
+    response = await call_next(request)
+    if writes:
+        response.set_cookie(READ_PRIMARY_COOKIE, "1", max_age=settings.DB_READ_YOUR_WRITES_WINDOW, httponly=True)
+    return response
+
+
 @app.on_event("startup")
 async def startup():
     """
@@ -78,13 +107,40 @@ async def startup():
     :return: A list of functions that are executed when the application starts
     :doc-author: Trelent
     """
-    r = await redis.Redis(
+    pool = redis.BlockingConnectionPool(
         host=settings.REDIS_HOST,
         port=settings.REDIS_PORT,
         db=0,
         password=settings.REDIS_PASSWORD,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        timeout=settings.REDIS_POOL_TIMEOUT,
     )
+    r = await redis.Redis(connection_pool=pool)
     await FastAPILimiter.init(r)
+    cache_service.init(r)
+    sessionmanager.start()
+    auth_service.init(r)
+    principal_cache.init(r)
+    job_queue.init(r)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """
+    The shutdown function is called when the application stops.
+    It waits for the running media storage calls and stops their thread pool,
+    the QR code and password worker processes, then closes the shared Redis connection pool
+    and the database connections.
+
+    :return: None
+    """
+    media_storage.shutdown()
+    qr_service.shutdown()
+    password_hasher.shutdown()
+    await principal_cache.close()
+    if auth_service.cache is not None:
+        await auth_service.cache.aclose()
+    await sessionmanager.close()
 
 
 @app.get("/", response_class=HTMLResponse, description="Main Page")
@@ -126,3 +182,32 @@ async def healthchecker(db: AsyncSession = Depends(get_db)):
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail=messages.MAIN_DB_ERROR_CONNECTION)
+
+
+@app.get("/api/cache/stats")
+async def cache_stats(current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The cache_stats function returns the hit and miss counters of the read-through cache
+    collected by this worker since it started. Only an admin can read them.
+
+    :param current_user: User: Get the current user
+    :return: A dictionary of counters per cached entity
+    """
+    if current_user.user_type_id != 3:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=messages.NO_PERMISSIONS)
+    return cache_service.get_stats()
+
+
+@app.get("/api/db/pool/stats")
+async def db_pool_stats(current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The db_pool_stats function returns the state of the database connection pool of this worker:
+    checked out connections, overflow, the number of checkouts, how long they waited for a connection
+    and how many of them timed out. Only an admin can read them.
+
+    :param current_user: User: Get the current user
+    :return: A dictionary of pool metrics
+    """
+    if current_user.user_type_id != 3:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=messages.NO_PERMISSIONS)
+    return sessionmanager.pool_metrics()
@@ -0,0 +1,36 @@
+"""Keyset pagination indexes
+
+Revision ID: 3c1f9a7d2b84
+Revises: 49b948a6fa7f
+Create Date: 2026-10-17 12:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c1f9a7d2b84'
+down_revision: Union[str, None] = '49b948a6fa7f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # rating takes part in the (rating, id) keyset, NULLs would break the row-value comparison
+    op.execute("UPDATE posts SET rating = 0 WHERE rating IS NULL")
+    op.alter_column('posts', 'rating', existing_type=sa.Float(), nullable=False, server_default='0')
+    op.create_index('ix_posts_created_at_id', 'posts', ['created_at', 'id'], unique=False)
+    op.create_index('ix_posts_rating_id', 'posts', ['rating', 'id'], unique=False)
+    op.create_index('ix_posts_user_id_created_at_id', 'posts', ['user_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_tags_to_posts_tag_id_post_id', 'tags_to_posts', ['tag_id', 'post_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tags_to_posts_tag_id_post_id', table_name='tags_to_posts')
+    op.drop_index('ix_posts_user_id_created_at_id', table_name='posts')
+    op.drop_index('ix_posts_rating_id', table_name='posts')
+    op.drop_index('ix_posts_created_at_id', table_name='posts')
+    op.alter_column('posts', 'rating', existing_type=sa.Float(), nullable=True, server_default=None)
@@ -0,0 +1,37 @@
+"""Post rating counters
+
+Revision ID: 5a7c3e9b1d26
+Revises: 8e2d4b6a1f37
+Create Date: 2026-10-17 15:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a7c3e9b1d26'
+down_revision: Union[str, None] = '8e2d4b6a1f37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('posts', sa.Column('rating_sum', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('posts', sa.Column('rating_count', sa.Integer(), nullable=False, server_default='0'))
+    op.execute("""
+        UPDATE posts
+        SET rating_sum = totals.rating_sum,
+            rating_count = totals.rating_count,
+            rating = totals.rating_sum::float / totals.rating_count
+        FROM (SELECT post_id, sum(value) AS rating_sum, count(*) AS rating_count
+              FROM ratings GROUP BY post_id) AS totals
+        WHERE posts.id = totals.post_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('posts', 'rating_count')
+    op.drop_column('posts', 'rating_sum')
@@ -0,0 +1,38 @@
+"""Derived assets cache index
+
+Revision ID: b41d9e7c2a05
+Revises: 5a7c3e9b1d26
+Create Date: 2026-10-17 18:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b41d9e7c2a05'
+down_revision: Union[str, None] = '5a7c3e9b1d26'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('derived_assets',
+    sa.Column('key', sa.String(length=64), nullable=False),
+    sa.Column('image_id', sa.String(length=255), nullable=False),
+    sa.Column('output_format', sa.String(length=10), nullable=False),
+    sa.Column('url', sa.String(length=500), nullable=False),
+    sa.Column('public_id', sa.String(length=500), nullable=True),
+    sa.Column('size', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('last_used_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index('ix_derived_assets_last_used_at', 'derived_assets', ['last_used_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_derived_assets_last_used_at', table_name='derived_assets')
+    op.drop_table('derived_assets')
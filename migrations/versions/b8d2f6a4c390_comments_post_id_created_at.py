@@ -0,0 +1,38 @@
+"""Comments listing index, drop comments_to_posts
+
+Revision ID: b8d2f6a4c390
+Revises: a6c4e2f8d179
+Create Date: 2026-10-18 00:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8d2f6a4c390'
+down_revision: Union[str, None] = 'a6c4e2f8d179'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_comments_post_id_created_at_id', 'comments', ['post_id', 'created_at', 'id'], unique=False)
+    # comments.post_id already links a comment to its post
+    op.drop_table('comments_to_posts')
+
+
+def downgrade() -> None:
+    op.create_table('comments_to_posts',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('post_id', sa.Integer(), nullable=True),
+    sa.Column('comment_id', sa.UUID(), nullable=True),
+    sa.ForeignKeyConstraint(['comment_id'], ['comments.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("INSERT INTO comments_to_posts (post_id, comment_id) "
+               "SELECT post_id, id FROM comments WHERE post_id IS NOT NULL")
+    op.drop_index('ix_comments_post_id_created_at_id', table_name='comments')
@@ -0,0 +1,26 @@
+"""User token version
+
+Revision ID: c7e3a9f1b264
+Revises: b41d9e7c2a05
+Create Date: 2026-10-17 20:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7e3a9f1b264'
+down_revision: Union[str, None] = 'b41d9e7c2a05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('token_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'token_version')
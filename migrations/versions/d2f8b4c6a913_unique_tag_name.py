@@ -0,0 +1,38 @@
+"""Unique tag name
+
+Revision ID: d2f8b4c6a913
+Revises: c7e3a9f1b264
+Create Date: 2026-10-17 21:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2f8b4c6a913'
+down_revision: Union[str, None] = 'c7e3a9f1b264'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # concurrent creates may have inserted a name twice, keep the oldest tag and move the links to it
+    op.execute("""
+        UPDATE tags_to_posts SET tag_id = keep.id
+        FROM tags, (SELECT name, min(id) AS id FROM tags GROUP BY name) AS keep
+        WHERE tags_to_posts.tag_id = tags.id AND tags.name = keep.name AND tags.id <> keep.id
+    """)
+    op.execute("""
+        DELETE FROM tags_to_posts duplicate USING tags_to_posts original
+        WHERE duplicate.post_id = original.post_id AND duplicate.tag_id = original.tag_id
+          AND duplicate.id > original.id
+    """)
+    op.execute("DELETE FROM tags duplicate USING tags original "
+               "WHERE duplicate.name = original.name AND duplicate.id > original.id")
+    op.create_index('ix_tags_name', 'tags', ['name'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tags_name', table_name='tags')
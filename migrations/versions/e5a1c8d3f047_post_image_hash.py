@@ -0,0 +1,28 @@
+"""Post image hash
+
+Revision ID: e5a1c8d3f047
+Revises: d2f8b4c6a913
+Create Date: 2026-10-17 22:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a1c8d3f047'
+down_revision: Union[str, None] = 'd2f8b4c6a913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('posts', sa.Column('image_hash', sa.String(length=64), nullable=True))
+    op.create_index('ix_posts_user_id_image_hash', 'posts', ['user_id', 'image_hash'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_posts_user_id_image_hash', table_name='posts')
+    op.drop_column('posts', 'image_hash')
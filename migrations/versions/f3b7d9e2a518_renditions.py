@@ -0,0 +1,36 @@
+"""Renditions
+
+Revision ID: f3b7d9e2a518
+Revises: e5a1c8d3f047
+Create Date: 2026-10-17 23:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b7d9e2a518'
+down_revision: Union[str, None] = 'e5a1c8d3f047'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('renditions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('width', sa.Integer(), nullable=False),
+    sa.Column('format', sa.String(length=10), nullable=False),
+    sa.Column('url', sa.String(length=500), nullable=False),
+    sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_renditions_post_id_format_width', 'renditions', ['post_id', 'format', 'width'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_renditions_post_id_format_width', table_name='renditions')
+    op.drop_table('renditions')
@@ -0,0 +1,36 @@
+"""Unique post image hash
+
+Revision ID: f9c2e4a6b813
+Revises: c1e5a7b9d402
+Create Date: 2026-10-18 02:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f9c2e4a6b813'
+down_revision: Union[str, None] = 'c1e5a7b9d402'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # concurrent uploads may have stored an image of a user twice, keep the hash on the oldest post only
+    op.execute("""
+        UPDATE posts SET image_hash = NULL
+        FROM posts original
+        WHERE posts.user_id = original.user_id AND posts.image_hash = original.image_hash
+          AND posts.id > original.id
+    """)
+    op.drop_index('ix_posts_user_id_image_hash', table_name='posts')
+    op.create_index('ix_posts_user_id_image_hash', 'posts', ['user_id', 'image_hash'], unique=True,
+                    postgresql_where=sa.text('image_hash IS NOT NULL'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_posts_user_id_image_hash', table_name='posts')
+    op.create_index('ix_posts_user_id_image_hash', 'posts', ['user_id', 'image_hash'], unique=False)
@@ -0,0 +1,88 @@
+import asyncio
+import sys
+import time
+
+
+class SmtpSink:
+    """
+    A local SMTP server that accepts every login and every email and throws the emails away.
+    It speaks just enough SMTP for the email sender, to try the outbox without a provider
+    and to measure its throughput. Run the worker against it with
+    MAIL_SERVER=localhost MAIL_PORT=1025 MAIL_USE_SSL=false.
+    """
+
+    def __init__(self):
+        self.received = 0
+        self.connections = 0
+        self.started = time.monotonic()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        The handle function serves one SMTP connection until the client quits.
+
+        :param self: Represent the instance of the class
+        :param reader: asyncio.StreamReader: The incoming stream
+        :param writer: asyncio.StreamWriter: The outgoing stream
+        :return: None
+        """
+        self.connections += 1
+        writer.write(b"220 localhost SMTP sink\r\n")
+        try:
+            while line := await reader.readline():
+                command = line.decode(errors="replace").strip().upper()
+                if command.startswith("EHLO"):
+                    writer.write(b"250-localhost\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+                elif command.startswith("AUTH"):
+                    writer.write(b"235 Authentication successful\r\n")
+                elif command == "DATA":
+                    writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                    await writer.drain()
+                    while await reader.readline() not in (b".\r\n", b""):
+                        pass
+                    self.received += 1
+                    writer.write(b"250 OK\r\n")
+                elif command == "QUIT":
+                    writer.write(b"221 Bye\r\n")
+                    break
+                else:
+                    writer.write(b"250 OK\r\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def report(self, interval: float = 5):
+        """
+        The report function prints the number of received emails and the rate since the start.
+
+        :param self: Represent the instance of the class
+        :param interval: float: Seconds between reports
+        :return: None
+        """
+        while True:
+            await asyncio.sleep(interval)
+            elapsed = time.monotonic() - self.started
+            print(f"{self.received} emails over {self.connections} connections, "
+                  f"{self.received / elapsed:.1f} emails/s")
+
+
+async def main(port: int):
+    """
+    The main function serves the sink on localhost until the process is stopped.
+
+    Usage: python smtp_sink.py [port]
+
+    :param port: int: The port, 1025 by default
+    :return: None
+    """
+    sink = SmtpSink()
+    server = await asyncio.start_server(sink.handle, "localhost", port)
+    print(f"SMTP sink listening on localhost:{port}")
+    async with server:
+        await asyncio.gather(server.serve_forever(), sink.report())
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 1025))
+    except KeyboardInterrupt:
+        pass
@@ -1,9 +1,24 @@
+from typing import Dict, List
+
 from pydantic import ConfigDict
 from pydantic_settings import BaseSettings
 
 
 class Settings(BaseSettings):
     SQLALCHEMY_DATABASE_URL: str = "postgresql+asyncpg://admin:$1234567@$name/$name"
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # set to 0 behind pgbouncer in transaction mode
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    DB_STATEMENT_TIMEOUT: int = 30000
+    DB_IDLE_IN_TRANSACTION_TIMEOUT: int = 60000
+    DB_REPLICA_URLS: List[str] = []
+    DB_REPLICA_MAX_LAG: float = 5
+    DB_REPLICA_CHECK_INTERVAL: float = 5
+    DB_READ_YOUR_WRITES_WINDOW: int = 10
     SECRET_KEY_JWT: str = "secret"
     ALGORITHM: str = "HS256"
     MAIL_USERNAME: str = "admin@meta.ua"
@@ -11,15 +26,70 @@ class Settings(BaseSettings):
     MAIL_FROM: str = "example@meta.ua"
     MAIL_PORT: int = 567234
     MAIL_SERVER: str = "example.meta.ua"
+    # the avatar of a new user until its Gravatar is resolved
+    AVATAR_DEFAULT: str = "https://asset.cloudinary.com/dkprmxdfc/cbcb3e506c226483c2be7155f6e3ff7c"
+    GRAVATAR_TTL: int = 604800
+    GRAVATAR_TIMEOUT: float = 5
     MAIL_USE_SSL: bool = True
+    MAIL_STARTTLS: bool = False
+    MAIL_TIMEOUT: float = 30
+    # SMTP connections kept open by each worker process
+    EMAIL_CONNECTIONS: int = 4
+    EMAIL_BATCH_SIZE: int = 50
+    # emails per second of each worker process, the limit of the provider divided by the number of workers
+    EMAIL_RATE_LIMIT: float = 10
+    EMAIL_MAX_ATTEMPTS: int = 5
+    # seconds a claimed email is left to its sender before another sender may try it
+    EMAIL_LEASE: int = 300
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 23131
     REDIS_PASSWORD: str | None = None
+    REDIS_MAX_CONNECTIONS: int = 100
+    REDIS_POOL_TIMEOUT: int = 5
+    PRINCIPAL_TTL: int = 300
+    PRINCIPAL_LOCAL_TTL: int = 30
+    PRINCIPAL_LOCAL_SIZE: int = 10000
+    TOKEN_CACHE_SIZE: int = 10000
+    PASSWORD_WORKERS: int = 2
+    PASSWORD_QUEUE_SIZE: int = 32
     CLOUDINARY_NAME: str = "admin"
     CLOUDINARY_API_KEY: str = "a1221d111d1"
     CLOUDINARY_API_SECRET: str = "secret"
     APP_ENV: str = "dev"
     ADMIN_PASSWORD: str = "password"
+    CACHE_TTL: int = 300
+    CACHE_TTL_JITTER: float = 0.1
+    MEDIA_BACKEND: str = "cloudinary"
+    MEDIA_ROOT: str = "src/static/media"
+    MEDIA_URL: str = "/src/static/media"
+    MEDIA_WORKERS: int = 8
+    MEDIA_QUEUE_SIZE: int = 32
+    MEDIA_TIMEOUT: float = 30
+    TRANSFORM_WORKERS: int = 2
+    UPLOAD_MAX_SIZE: int = 20 * 1024 * 1024
+    UPLOAD_MIME_TYPES: List[str] = ["image/jpeg", "image/png", "image/gif", "image/webp"]
+    # cloudinary takes parts of at least 5 MB, only the last part may be smaller
+    UPLOAD_CHUNK_SIZE: int = 6 * 1024 * 1024
+    UPLOAD_QUEUE_SIZE: int = 16
+    RENDITION_WIDTHS: List[int] = [320, 640, 1080, 1600]
+    # in order of preference, formats the local backend cannot write are skipped
+    RENDITION_FORMATS: List[str] = ["avif", "webp", "jpeg"]
+    # jobs of each queue one worker.py process runs at a time
+    JOB_CONCURRENCY: Dict[str, int] = {"media": 8, "renditions": 2, "email": 4}
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_BACKOFF_BASE: float = 2
+    JOB_BACKOFF_MAX: float = 600
+    JOB_KEY_TTL: int = 86400
+    JOB_POLL_INTERVAL: float = 1
+    JOB_HEARTBEAT_TTL: int = 30
+    # seconds between moves of the jobs stored while Redis was unreachable to their queues
+    JOB_RESTORE_INTERVAL: float = 60
+    DERIVED_CACHE_BYTES: int = 512 * 1024 * 1024
+    QR_WORKERS: int = 2
+    QR_MEMO_SIZE: int = 1024
+    QR_BATCH_SIZE: int = 50
+    INGEST_BATCH_SIZE: int = 500
+    COMMENT_DELETE_BATCH_SIZE: int = 500
 
 
 settings = Settings()
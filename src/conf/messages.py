@@ -26,3 +26,17 @@ EMAIL_EXIST = "User with this email already exists"
 USER_BANNED = "User is banned"
 POST_NOT_FOUND = "Post is not found or you are not the owner"
 NO_PERMISSIONS = "You don't have permissions"
+INVALID_CURSOR = "Invalid pagination cursor"
+MEDIA_BUSY = "Media storage is busy, try again later"
+MEDIA_TIMEOUT = "Media storage did not respond in time"
+PASSWORD_BUSY = "Too many password checks in progress, try again later"
+INGEST_BAD_ARCHIVE = "The archive is not a valid zip file"
+INGEST_FILE_MISSING = "The file of the item was not uploaded"
+INGEST_DUPLICATE_NAME = "The name is used by another item of the batch"
+INGEST_BAD_MEMBER = "The file of the item could not be read from the archive"
+INGEST_UPLOAD_FAILED = "The image of the item could not be stored"
+UPLOAD_LENGTH_REQUIRED = "Content-Length header is required"
+UPLOAD_TOO_LARGE = "The file is too large"
+UPLOAD_UNSUPPORTED_TYPE = "The file type is not supported"
+UPLOAD_DUPLICATE = "You have already posted this image"
+UPLOAD_HASH_MISMATCH = "The content does not match the sha256 of the request"
@@ -1,33 +1,293 @@
+import asyncio
 import contextlib
+import itertools
+import time
+from contextvars import ContextVar
+from typing import List
+
+from fastapi import Request
+from sqlalchemy import event, exc, text
 from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from src.conf import messages
 from src.conf.config import settings
 
 DB_URL = settings.SQLALCHEMY_DATABASE_URL
+# set on responses of requests that wrote, the reads of the client go to the primary while it lives
+READ_PRIMARY_COOKIE = "db_read_primary"
+# replication lag in seconds, 0 when the replica has replayed everything it received
+REPLICA_LAG = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
 
+_request_writes: ContextVar[dict | None] = ContextVar("request_writes", default=None)
+
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    """
+    The default pool of async engines that also records how long checkouts wait for a connection
+    and how many of them time out, so pool starvation shows up in the metrics instead of as slow requests.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            wait = time.perf_counter() - started
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def metrics(self) -> dict:
+        """
+        The metrics function returns the current state and the counters of the pool.
+
+        :param self: Represent the instance of the class
+        :return: A dict with size, checked_out, overflow, checkouts, timeouts and wait times in seconds
+        """
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "overflow": max(self.overflow(), 0),
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_avg": self.wait_total / self.checkouts if self.checkouts else 0.0,
+            "wait_max": self.wait_max,
+        }
+
+
+def engine_options(url: str) -> dict:
+    """
+    The engine_options function builds the pool and connection options of an engine from the settings.
+    Postgres connections get statement_timeout and idle_in_transaction_session_timeout as server settings,
+    so a runaway query or a forgotten transaction cannot hold a connection forever.
+
+    :param url: str: The database url
+    :return: Keyword arguments for create_async_engine
+    """
+    options = {
+        "poolclass": MeteredQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+    if url.startswith("postgresql+asyncpg"):
+        options["connect_args"] = {
+            "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            "server_settings": {
+                "statement_timeout": str(settings.DB_STATEMENT_TIMEOUT),
+                "idle_in_transaction_session_timeout": str(settings.DB_IDLE_IN_TRANSACTION_TIMEOUT),
+            },
+        }
+    return options
+
+
+class PrimarySession(Session):
+    """
+    Session of the primary database. A commit that wrote something is noted for the current request,
+    see track_writes.
+    """
+
+
+@event.listens_for(PrimarySession, "do_orm_execute")
+def _note_statement(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(PrimarySession, "after_flush")
+def _note_flush(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(PrimarySession, "after_commit")
+def _note_commit(session):
+    if session.info.pop("wrote", False):
+        writes = _request_writes.get()
+        if writes is not None:
+            writes["wrote"] = True
+
+
+@event.listens_for(PrimarySession, "after_rollback")
+def _forget_writes(session):
+    session.info.pop("wrote", None)
+
+
+def track_writes() -> dict:
+    """
+    The track_writes function starts recording the commits of the current request.
+    The returned dict gets the key wrote once a primary session commits a write.
+
+    :return: The dict of the current request
+    """
+    writes = {}
+    _request_writes.set(writes)
+    return writes
+
+
+class Replica:
+    """
+    A read replica with its own engine. It is healthy once the monitor has seen it answer
+    with a replication lag of at most DB_REPLICA_MAX_LAG seconds.
+    """
 
-class DatabaseSessionManager:
     def __init__(self, url: str):
-        self._engine: AsyncEngine | None = create_async_engine(url)
+        self.engine: AsyncEngine = create_async_engine(url, **engine_options(url))
+        self.session_maker = async_sessionmaker(autoflush=False, autocommit=False, bind=self.engine)
+        self.healthy = False
+        self.lag: float | None = None
+
+    async def check(self, max_lag: float = settings.DB_REPLICA_MAX_LAG):
+        """
+        The check function measures the replication lag and updates the health of the replica.
+
+        :param self: Represent the instance of the class
+        :param max_lag: float: The largest lag in seconds a healthy replica may have
+        :return: None
+        """
+        try:
+            async with self.engine.connect() as conn:
+                lag = (await asyncio.wait_for(conn.execute(REPLICA_LAG), settings.DB_POOL_TIMEOUT)).scalar()
+        except Exception as err:
+            print(err)
+            self.healthy, self.lag = False, None
+            return
+        self.lag = float(lag) if lag is not None else None
+        self.healthy = self.lag is not None and self.lag <= max_lag
+
+
+class DatabaseSessionManager:
+    def __init__(self, url: str, replica_urls: List[str] = ()):
+        self._engine: AsyncEngine | None = create_async_engine(url, **engine_options(url))
         self._session_maker: async_sessionmaker = async_sessionmaker(autoflush=False, autocommit=False,
-                                                                     bind=self._engine)
+                                                                     bind=self._engine,
+                                                                     sync_session_class=PrimarySession)
+        self.replicas = [Replica(replica_url) for replica_url in replica_urls]
+        self._next_replica = itertools.count()
+        self._monitor: asyncio.Task | None = None
 
     @contextlib.asynccontextmanager
     async def session(self):
         if self._session_maker is None:
-            raise Exception(settings.SESSION_MAKER_ERROR)
+            raise Exception(messages.SESSION_MAKER_ERROR)
         session = self._session_maker()
         try:
             yield session
-        except Exception as err:
-            print(err)
+        except Exception:
             await session.rollback()
+            raise
         finally:
             await session.close()
 
+    def _replica(self) -> Replica | None:
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        return healthy[next(self._next_replica) % len(healthy)] if healthy else None
 
-sessionmanager = DatabaseSessionManager(DB_URL)
+    @contextlib.asynccontextmanager
+    async def read_session(self, primary: bool = False):
+        """
+        The read_session function opens a session for reads. The healthy replicas take turns;
+        without a healthy replica, or when primary is set, the session reads from the primary.
+
+        :param self: Represent the instance of the class
+        :param primary: bool: Read from the primary, e.g. to read the own writes of a client
+        :return: An async context manager of a session
+        """
+        replica = None if primary else self._replica()
+        if replica is None:
+            async with self.session() as session:
+                yield session
+            return
+        session = replica.session_maker()
+        try:
+            yield session
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+
+    async def _monitor_replicas(self):
+        while True:
+            await asyncio.gather(*[replica.check() for replica in self.replicas])
+            await asyncio.sleep(settings.DB_REPLICA_CHECK_INTERVAL)
+
+    def start(self):
+        """
+        The start function starts checking the health and the lag of the replicas in the background.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        if self.replicas and self._monitor is None:
+            self._monitor = asyncio.create_task(self._monitor_replicas())
+
+    async def close(self):
+        """
+        The close function stops the replica checks and closes the connections of all engines.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        if self._monitor is not None:
+            self._monitor.cancel()
+            try:
+                await self._monitor
+            except asyncio.CancelledError:
+                pass
+            self._monitor = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+        await self._engine.dispose()
+
+    def pool_metrics(self) -> dict:
+        """
+        The pool_metrics function returns the metrics of the connection pools of the primary and the replicas.
+
+        :param self: Represent the instance of the class
+        :return: A dict of pool metrics
+        """
+        return {
+            "primary": self._engine.pool.metrics(),
+            "replicas": [{"healthy": replica.healthy, "lag": replica.lag, **replica.engine.pool.metrics()}
+                         for replica in self.replicas],
+        }
+
+
+sessionmanager = DatabaseSessionManager(DB_URL, settings.DB_REPLICA_URLS)
 
 
 async def get_db():
     async with sessionmanager.session() as session:
         yield session
+
+
+async def get_read_db(request: Request):
+    """
+    The get_read_db function is the session dependency of read-only endpoints. It reads from a replica,
+    unless the client wrote something in the last DB_READ_YOUR_WRITES_WINDOW seconds.
+
+    :param request: Request: The incoming request
+    :return: A session
+    """
+    async with sessionmanager.read_session(READ_PRIMARY_COOKIE in request.cookies) as session:
+        yield session
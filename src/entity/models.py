@@ -2,12 +2,17 @@ import uuid
 from datetime import date
 from typing import List
 
-from sqlalchemy.orm import Mapped, mapped_column, relationship, validates, registry
-from sqlalchemy import String, Date, func, DateTime, Enum, Integer, ForeignKey, Boolean, UUID, Table, Column, Float
+from sqlalchemy.orm import Mapped, mapped_column, relationship, validates, registry, query_expression
+from sqlalchemy import String, Date, func, DateTime, Enum, Integer, ForeignKey, Boolean, UUID, Table, Column, Float, Index, \
+    Computed, JSON, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import DeclarativeBase
 
 mapper_registry = registry()
 
+# text search configuration of posts.search_vector, queries must use the same one
+TS_CONFIG = 'simple'
+
 
 class Base(DeclarativeBase):
     pass
@@ -27,6 +32,8 @@ class User(Base):
                                              default=func.now(), onupdate=func.now(), nullable=True)
     confirmed: Mapped[bool] = mapped_column(Boolean, default=False, nullable=True)
     is_banned: Mapped[bool] = mapped_column(Boolean, default=False, nullable=True)
+    # part of the cached principal, tokens issued before the last increment are not accepted
+    token_version: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
     user_type_id: Mapped[int] = mapped_column(ForeignKey('user_type.id'))
     user_type: Mapped["UserType"] = relationship("UserType", backref="users", lazy="joined")
 
@@ -39,6 +46,15 @@ class UserType(Base):
 
 class Post(Base):
     __tablename__ = 'posts'
+    __table_args__ = (
+        Index('ix_posts_created_at_id', 'created_at', 'id'),
+        Index('ix_posts_rating_id', 'rating', 'id'),
+        Index('ix_posts_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        Index('ix_posts_search_vector', 'search_vector', postgresql_using='gin'),
+        Index('ix_posts_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        Index('ix_posts_user_id_image_hash', 'user_id', 'image_hash', unique=True,
+              postgresql_where=text('image_hash IS NOT NULL')),
+    )
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(200), nullable=True)
     content: Mapped[str] = mapped_column(String(5000), nullable=True)
@@ -46,16 +62,37 @@ class Post(Base):
     updated_at: Mapped[date] = mapped_column('updated_at', DateTime, default=func.now(), onupdate=func.now())
     image_id: Mapped[str] = mapped_column(String(255), nullable=True)
     image_url: Mapped[str] = mapped_column(String(255), nullable=True)
+    # sha256 of the uploaded original, hex
+    image_hash: Mapped[str] = mapped_column(String(64), nullable=True)
     user_id: Mapped[uuid] = mapped_column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=True)
-    rating: Mapped[float] = mapped_column(Float(), nullable=True, default=float("0.00"))
-    user: Mapped["User"] = relationship("User", backref="posts", lazy="joined")
-
-    tags: Mapped[List["Tag"]] = relationship("Tag", secondary="tags_to_posts", back_populates="posts", lazy="joined")
-    tags_to_posts: Mapped[List["TagToPost"]] = relationship("TagToPost", back_populates="post", lazy="joined", overlaps="tags")
+    rating: Mapped[float] = mapped_column(Float(), nullable=False, default=float("0.00"), server_default="0")
+    # running totals of ratings.value, rating is kept equal to rating_sum / rating_count
+    rating_sum: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    rating_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    search_vector: Mapped[str] = mapped_column(
+        TSVECTOR, Computed(f"to_tsvector('{TS_CONFIG}', coalesce(name, '') || ' ' || coalesce(content, ''))",
+                           persisted=True),
+        nullable=True, deferred=True, deferred_raiseload=True)
+    search_rank: Mapped[float] = query_expression()
+    user: Mapped["User"] = relationship("User", backref="posts", lazy="raise")
+
+    tags: Mapped[List["Tag"]] = relationship("Tag", secondary="tags_to_posts", back_populates="posts", lazy="raise")
+    tags_to_posts: Mapped[List["TagToPost"]] = relationship("TagToPost", back_populates="post", lazy="raise", overlaps="tags")
     comment: Mapped[List["Comment"]] = relationship("Comment", back_populates="post",
-                                                    lazy="joined", cascade="all, delete")
-    all_images: Mapped[List["PhotoUrl"]] = relationship("PhotoUrl", back_populates="post", lazy="joined",cascade='save-update, merge, delete')
-    ratings: Mapped[List["Rating"]] = relationship("Rating", back_populates="post", lazy="joined")
+                                                    lazy="raise", cascade="all, delete")
+    all_images: Mapped[List["PhotoUrl"]] = relationship("PhotoUrl", back_populates="post", lazy="raise",cascade='save-update, merge, delete')
+    ratings: Mapped[List["Rating"]] = relationship("Rating", back_populates="post", lazy="raise")
+    renditions: Mapped[List["Rendition"]] = relationship("Rendition", back_populates="post", lazy="raise",
+                                                         order_by="Rendition.width", cascade="all, delete",
+                                                         passive_deletes=True)
+
+    @property
+    def srcset(self) -> dict:
+        # the srcset attribute of the renditions of each MIME type, e.g. for the sources of a <picture>
+        srcset = {}
+        for rendition in self.renditions:
+            srcset.setdefault(f"image/{rendition.format}", []).append(f"{rendition.url} {rendition.width}w")
+        return {mime: ", ".join(candidates) for mime, candidates in srcset.items()}
 
     @validates('tags')
     def validate_tags(self, key, tags):
@@ -67,21 +104,24 @@ class Post(Base):
 class Tag(Base):
     __tablename__ = 'tags'
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column(String(50), nullable=False)
+    name: Mapped[str] = mapped_column(String(50), nullable=False, unique=True, index=True)
 
-    tags_to_posts: Mapped[List["TagToPost"]] = relationship("TagToPost", back_populates="tag", lazy="joined",
+    tags_to_posts: Mapped[List["TagToPost"]] = relationship("TagToPost", back_populates="tag", lazy="raise",
                                                             overlaps="posts,tags", cascade="all, delete-orphan")
-    posts: Mapped[List["Post"]] = relationship("Post", secondary="tags_to_posts", back_populates="tags", lazy="joined",
+    posts: Mapped[List["Post"]] = relationship("Post", secondary="tags_to_posts", back_populates="tags", lazy="raise",
                                                overlaps="tags_to_posts")
 
 
 class TagToPost(Base):
     __tablename__ = 'tags_to_posts'
+    __table_args__ = (
+        Index('ix_tags_to_posts_tag_id_post_id', 'tag_id', 'post_id'),
+    )
     id: Mapped[int] = mapped_column(primary_key=True)
     post_id: Mapped[int] = mapped_column(Integer, ForeignKey('posts.id'), nullable=False)
     tag_id: Mapped[int] = mapped_column(Integer, ForeignKey('tags.id'), nullable=False)
-    post: Mapped["Post"] = relationship("Post", back_populates="tags_to_posts", lazy="joined", overlaps="posts,tags")
-    tag: Mapped["Tag"] = relationship("Tag", back_populates="tags_to_posts", lazy="joined", overlaps="posts,tags")
+    post: Mapped["Post"] = relationship("Post", back_populates="tags_to_posts", lazy="raise", overlaps="posts,tags")
+    tag: Mapped["Tag"] = relationship("Tag", back_populates="tags_to_posts", lazy="raise", overlaps="posts,tags")
 
 
 class Rating(Base):
@@ -91,34 +131,25 @@ class Rating(Base):
     user_id: Mapped[uuid] = mapped_column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
     post_id: Mapped[int] = mapped_column(Integer, ForeignKey('posts.id'), nullable=False)
 
-    post: Mapped["Post"] = relationship("Post", back_populates="ratings", lazy="joined")
-    user: Mapped["User"] = relationship("User", backref="ratings", lazy="joined")
+    post: Mapped["Post"] = relationship("Post", back_populates="ratings", lazy="raise")
+    user: Mapped["User"] = relationship("User", backref="ratings", lazy="raise")
 
 
 class Comment(Base):
     __tablename__ = 'comments'
+    __table_args__ = (
+        Index('ix_comments_post_id_created_at_id', 'post_id', 'created_at', 'id'),
+    )
     id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
     content: Mapped[str] = mapped_column(String(500), nullable=False)
     created_at: Mapped[date] = mapped_column('created_at', DateTime, default=func.now())
     updated_at: Mapped[date] = mapped_column('updated_at', DateTime, default=func.now(), onupdate=func.now())
     user_id: Mapped[uuid] = mapped_column(UUID(as_uuid=True), ForeignKey('users.id', ondelete="CASCADE"), nullable=True)
     post_id: Mapped[int] = mapped_column(Integer, ForeignKey('posts.id'), nullable=True)
-    user: Mapped["User"] = relationship("User", backref="comments", lazy="joined")
+    user: Mapped["User"] = relationship("User", backref="comments", lazy="raise")
     # post: Mapped["Post"] = relationship("Post", backref="comments", lazy="joined")
     post: Mapped[List["Post"]] = relationship("Post", back_populates="comment",
-                                              lazy="joined")
-    comments_to_posts: Mapped[List["CommentToPost"]] = relationship("CommentToPost", back_populates="comments",
-                                                                    lazy="joined", cascade="all, delete")
-
-
-class CommentToPost(Base):
-    __tablename__ = 'comments_to_posts'
-    id: Mapped[int] = mapped_column(primary_key=True)
-    post_id: Mapped[int] = mapped_column(Integer, ForeignKey('posts.id', ondelete="CASCADE"), nullable=True)
-    comment_id: Mapped[uuid] = mapped_column(UUID(as_uuid=True), ForeignKey('comments.id', ondelete="CASCADE"),
-                                             nullable=True)
-    comments: Mapped[List["Comment"]] = relationship("Comment", back_populates='comments_to_posts',
-                                                     lazy="joined")
+                                              lazy="raise")
 
 
 class PhotoUrl(Base):
@@ -129,7 +160,77 @@ class PhotoUrl(Base):
     public_id_qrcode: Mapped[str] = mapped_column(String(500), nullable=True)
 
     post_id: Mapped[int] = mapped_column(Integer, ForeignKey('posts.id'), nullable=True)
-    post: Mapped["Post"] = relationship("Post", back_populates="all_images", lazy="joined")
+    post: Mapped["Post"] = relationship("Post", back_populates="all_images", lazy="raise")
+
+
+class Rendition(Base):
+    """
+    A resized copy of the image of a post in a web format, rendered in the background after the upload.
+    """
+    __tablename__ = 'renditions'
+    __table_args__ = (
+        Index('ix_renditions_post_id_format_width', 'post_id', 'format', 'width', unique=True),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    post_id: Mapped[int] = mapped_column(Integer, ForeignKey('posts.id', ondelete="CASCADE"), nullable=False)
+    width: Mapped[int] = mapped_column(Integer, nullable=False)
+    format: Mapped[str] = mapped_column(String(10), nullable=False)
+    url: Mapped[str] = mapped_column(String(500), nullable=False)
+    post: Mapped["Post"] = relationship("Post", back_populates="renditions", lazy="raise")
+
+
+class DerivedAsset(Base):
+    """
+    Index of the derived artefacts (transformed image urls and QR codes) shared by all workers.
+    The key is a hash of the source image, the normalized transformation chain and the output format.
+    """
+    __tablename__ = 'derived_assets'
+    __table_args__ = (
+        Index('ix_derived_assets_last_used_at', 'last_used_at'),
+    )
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    image_id: Mapped[str] = mapped_column(String(255), nullable=False)
+    output_format: Mapped[str] = mapped_column(String(10), nullable=False)
+    url: Mapped[str] = mapped_column(String(500), nullable=False)
+    public_id: Mapped[str] = mapped_column(String(500), nullable=True)
+    size: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    created_at: Mapped[date] = mapped_column('created_at', DateTime, default=func.now())
+    last_used_at: Mapped[date] = mapped_column('last_used_at', DateTime, default=func.now())
+
+
+class OutboxEmail(Base):
+    """
+    An email waiting to be sent. It is written in the transaction of the change that causes it,
+    so no email is lost when the sender fails and none is sent for a change that was rolled back.
+    """
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        Index('ix_email_outbox_next_attempt_at', 'next_attempt_at', postgresql_where=text('sent_at IS NULL')),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    recipient: Mapped[str] = mapped_column(String(150), nullable=False)
+    subject: Mapped[str] = mapped_column(String(255), nullable=False)
+    template: Mapped[str] = mapped_column(String(50), nullable=False)
+    context: Mapped[dict] = mapped_column(JSON, nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    last_error: Mapped[str] = mapped_column(String(500), nullable=True)
+    created_at: Mapped[date] = mapped_column('created_at', DateTime, default=func.now())
+    next_attempt_at: Mapped[date] = mapped_column('next_attempt_at', DateTime, default=func.now())
+    sent_at: Mapped[date] = mapped_column('sent_at', DateTime, nullable=True)
+
+
+class StoredJob(Base):
+    """
+    A job of the job queue that could not be enqueued because Redis was unreachable.
+    The workers move it to its queue once Redis is back, see JobQueue.enqueue_or_store.
+    """
+    __tablename__ = 'stored_jobs'
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(String(100), nullable=False)
+    args: Mapped[list] = mapped_column(JSON, nullable=False)
+    kwargs: Mapped[dict] = mapped_column(JSON, nullable=False)
+    key: Mapped[str] = mapped_column(String(255), nullable=True)
+    created_at: Mapped[date] = mapped_column('created_at', DateTime, default=func.now())
 
 
 mapper_registry.configure()
@@ -1,12 +1,45 @@
-from select import select
-
 from fastapi import HTTPException
 
-from sqlalchemy.orm import selectinload
+from typing import List, Tuple
+
+from sqlalchemy import select, delete
 from sqlalchemy.ext.asyncio import AsyncSession
 from src.schemas.comment import CreateCommentModel, CommentUpdateModel, CommentDeleteModel
-from src.entity.models import User, Comment, CommentToPost
+from src.entity.models import User, Comment
+from src.repository.loaders import COMMENT_RESPONSE, POST_COMMENT_RESPONSE
+from src.repository.pagination import paginate, COMMENTS_BY_DATE
 from src.conf import messages
+from src.services.cache import cache_service
+
+
+async def get_comment(comment_id, db: AsyncSession):
+    """
+    The get_comment function returns a comment together with its author and the commented post,
+    which is everything CommentResponse needs.
+
+    :param comment_id: Identify the comment
+    :param db: AsyncSession: Access the database
+    :return: A comment object or none
+    """
+    stmt = select(Comment).options(*COMMENT_RESPONSE).filter(Comment.id == comment_id)
+    comment = await db.execute(stmt)
+    return comment.scalars().first()
+
+
+async def get_post_comments(post_id: int, limit: int, cursor: str | None,
+                            db: AsyncSession) -> Tuple[List[Comment], str | None]:
+    """
+    The get_post_comments function returns a page of the comments of a post, the oldest first.
+    The page is read from the index on comments(post_id, created_at, id).
+
+    :param post_id: int: The id of the post
+    :param limit: int: The page size
+    :param cursor: str | None: The cursor of the previous page or None for the first page
+    :param db: AsyncSession: Access the database
+    :return: A list of comments and the cursor of the next page
+    """
+    stmt = select(Comment).options(*POST_COMMENT_RESPONSE).filter(Comment.post_id == post_id)
+    return await paginate(stmt, COMMENTS_BY_DATE, cursor, limit, db, descending=False)
 
 
 async def create_comment(body: CreateCommentModel, current_user: User, db: AsyncSession):
@@ -22,13 +55,11 @@ async def create_comment(body: CreateCommentModel, current_user: User, db: Async
     """
     comment = Comment(content=body.content, post_id=int(body.post_id), user_id=current_user.id)
     db.add(comment)
+    await db.flush()
+    comment_id = comment.id
     await db.commit()
-    await db.refresh(comment)
-    comments_to_posts = CommentToPost(comment_id=comment.id, post_id=body.post_id)
-    db.add(comments_to_posts)
-    await db.commit()
-    await db.refresh(comments_to_posts)
-    return comment
+    await cache_service.invalidate("profile", current_user.username)
+    return await get_comment(comment_id, db)
 
 
 async def update_comment(body: CommentUpdateModel, current_user: User, db: AsyncSession):
@@ -51,8 +82,7 @@ async def update_comment(body: CommentUpdateModel, current_user: User, db: Async
         raise HTTPException(status_code=403, detail=messages.COMMENT_NOT_PERMISSION)
     comment.content = body.content
     await db.commit()
-    await db.refresh(comment)
-    return comment
+    return await get_comment(body.comment_id, db)
 
 
 async def delete_comment(body: CommentDeleteModel, user: User, db: AsyncSession):
@@ -66,13 +96,27 @@ async def delete_comment(body: CommentDeleteModel, user: User, db: AsyncSession)
     :param body: CommentDeleteModel: Get the comment_id from the request body
     :param user: User: Check if the user is an admin or moderator
     :param db: AsyncSession: Get the database session
-    :return: The deleted comment
+    :return: None
     """
-    user_ = await db.get(User, user.id)
-    if user_.user_type_id not in (2, 3):
-        raise HTTPException(status_code=403, detail=messages.COMMENT_NOT_PERMISSION)
-    comment = await db.get(Comment, body.comment_id, options=[selectinload(Comment.comments_to_posts)])
-    if not comment:
+    if not await delete_comments([body.comment_id], user, db):
         raise HTTPException(status_code=404, detail=messages.COMMENT_NOT_FOUND)
-    await db.delete(comment)
+
+
+async def delete_comments(comment_ids: list, user: User, db: AsyncSession) -> list:
+    """
+    The delete_comments function deletes many comments with one statement, for moderators and admins.
+    Ids of comments that do not exist are ignored.
+
+    :param comment_ids: list: The ids of the comments
+    :param user: User: Check if the user is an admin or moderator
+    :param db: AsyncSession: Get the database session
+    :return: The ids of the deleted comments
+    """
+    if user.user_type_id not in (2, 3):
+        raise HTTPException(status_code=403, detail=messages.COMMENT_NOT_PERMISSION)
+    author = select(User.username).where(User.id == Comment.user_id).scalar_subquery()
+    stmt = delete(Comment).where(Comment.id.in_(comment_ids)).returning(Comment.id, author)
+    deleted = (await db.execute(stmt, execution_options={"synchronize_session": False})).all()
     await db.commit()
+    await cache_service.invalidate("profile", *{username for _, username in deleted if username})
+    return [comment_id for comment_id, _ in deleted]
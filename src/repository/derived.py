@@ -0,0 +1,119 @@
+import hashlib
+import json
+from typing import List
+
+from sqlalchemy import select, update, delete, func, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import settings
+from src.entity.models import DerivedAsset, PhotoUrl
+from src.services.jobs import job_queue
+
+URL = "url"
+QRCODE = "png"
+
+
+def asset_key(image_id: str, chain: List[str], output_format: str) -> str:
+    """
+    The asset_key function computes the content address of a derived asset.
+    Two requests for the same image, the same transformations and the same output share one key,
+    no matter in which worker they arrive.
+
+    :param image_id: str: The public id of the source image
+    :param chain: List[str]: The names of the transformations, None entries are dropped
+    :param output_format: str: url for a transformed image url, png for a QR code
+    :return: A hex sha256 digest
+    """
+    chain = [name for name in chain if name is not None]
+    raw = json.dumps([settings.MEDIA_BACKEND, image_id, chain, output_format])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+async def get_asset(key: str, db: AsyncSession):
+    """
+    The get_asset function looks up a derived asset and marks it as recently used in the same statement.
+
+    :param key: str: The key from asset_key
+    :param db: AsyncSession: Pass the database session to the function
+    :return: A row with url and public_id of the asset or None
+    """
+    stmt = (update(DerivedAsset).where(DerivedAsset.key == key).values(last_used_at=func.now())
+            .returning(DerivedAsset.url, DerivedAsset.public_id))
+    asset = await db.execute(stmt, execution_options={"synchronize_session": False})
+    asset = asset.first()
+    await db.commit()
+    return asset
+
+
+async def add_asset(key: str, image_id: str, output_format: str, url: str, public_id: str | None, size: int,
+                    db: AsyncSession):
+    """
+    The add_asset function records a new derived asset. If another worker has recorded the same key meanwhile,
+    its row is kept.
+
+    :param key: str: The key from asset_key
+    :param image_id: str: The public id of the source image
+    :param output_format: str: url or png
+    :param url: str: The url of the asset
+    :param public_id: str | None: The public id of the asset in the media storage, if it is stored there
+    :param size: int: The number of bytes the asset takes in the storage
+    :param db: AsyncSession: Pass the database session to the function
+    :return: None
+    """
+    stmt = insert(DerivedAsset).values(key=key, image_id=image_id, output_format=output_format, url=url,
+                                       public_id=public_id, size=size)
+    await db.execute(stmt.on_conflict_do_nothing(index_elements=[DerivedAsset.key]))
+    await db.commit()
+
+
+async def evict_assets(db: AsyncSession, budget: int = settings.DERIVED_CACHE_BYTES) -> List[str]:
+    """
+    The evict_assets function keeps the total size of the derived assets within the budget.
+    The least recently used assets over the budget are removed from the index and from the media storage,
+    together with the photo urls that point to them, so the next request renders them again.
+
+    :param db: AsyncSession: Pass the database session to the function
+    :param budget: int: The byte budget
+    :return: The keys of the evicted assets
+    """
+    running = func.sum(DerivedAsset.size).over(order_by=(DerivedAsset.last_used_at.desc(), DerivedAsset.key))
+    ranked = select(DerivedAsset.key, running.label("running")).subquery()
+    stale = select(ranked.c.key).where(ranked.c.running > budget)
+    stmt = (delete(DerivedAsset).where(DerivedAsset.key.in_(stale))
+            .returning(DerivedAsset.key, DerivedAsset.output_format, DerivedAsset.url, DerivedAsset.public_id))
+    evicted = (await db.execute(stmt, execution_options={"synchronize_session": False})).all()
+    if not evicted:
+        return []
+    urls = [asset.url for asset in evicted if asset.output_format == URL]
+    public_ids = [asset.public_id for asset in evicted if asset.output_format == QRCODE]
+    await db.execute(delete(PhotoUrl).where(or_(PhotoUrl.transform_url.in_(urls),
+                                                PhotoUrl.public_id_qrcode.in_(public_ids))))
+    await db.commit()
+    await _discard(evicted)
+    return [asset.key for asset in evicted]
+
+
+async def drop_assets(image_id: str, db: AsyncSession):
+    """
+    The drop_assets function removes all derived assets of a source image, e.g. when its post is removed.
+
+    :param image_id: str: The public id of the source image
+    :param db: AsyncSession: Pass the database session to the function
+    :return: None
+    """
+    stmt = (delete(DerivedAsset).where(DerivedAsset.image_id == image_id)
+            .returning(DerivedAsset.output_format, DerivedAsset.url, DerivedAsset.public_id))
+    dropped = (await db.execute(stmt, execution_options={"synchronize_session": False})).all()
+    await db.commit()
+    await _discard(dropped)
+
+
+async def _discard(assets):
+    # the files are removed by the job queue
+    public_ids = [asset.public_id for asset in assets if asset.output_format == QRCODE]
+    urls = [asset.url for asset in assets if asset.output_format != QRCODE]
+    if public_ids:
+        await job_queue.enqueue_or_store("delete_media", public_ids)
+    if urls:
+        await job_queue.enqueue_or_store("delete_renditions", urls)
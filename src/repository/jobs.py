@@ -0,0 +1,35 @@
+from typing import List
+
+from sqlalchemy import select, delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.entity.models import StoredJob
+
+
+async def store_jobs(jobs: List[dict], db: AsyncSession):
+    """
+    The store_jobs function keeps jobs in the database until they can be enqueued.
+
+    :param jobs: List[dict]: The jobs, each with name, args, kwargs and key
+    :param db: AsyncSession: Pass the database session to the function
+    :return: None
+    """
+    if jobs:
+        await db.execute(insert(StoredJob), jobs)
+        await db.commit()
+
+
+async def take_stored_jobs(limit: int, db: AsyncSession) -> List:
+    """
+    The take_stored_jobs function deletes the oldest stored jobs and returns them. It does not commit,
+    the caller commits once the jobs are enqueued, or rolls back to keep them. The rows are locked with
+    SKIP LOCKED, so two workers never take the same job.
+
+    :param limit: int: The largest number of jobs taken
+    :param db: AsyncSession: Pass the database session to the function
+    :return: Rows with name, args, kwargs and key
+    """
+    oldest = select(StoredJob.id).order_by(StoredJob.id).limit(limit).with_for_update(skip_locked=True)
+    stmt = (delete(StoredJob).where(StoredJob.id.in_(oldest.scalar_subquery()))
+            .returning(StoredJob.name, StoredJob.args, StoredJob.kwargs, StoredJob.key))
+    return (await db.execute(stmt, execution_options={"synchronize_session": False})).all()
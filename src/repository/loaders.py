@@ -0,0 +1,36 @@
+from sqlalchemy.orm import joinedload, selectinload
+
+from src.entity.models import Post, Comment, Rating
+
+# Relationships on the models are declared with lazy="raise", so every query that
+# is serialised into a response schema has to declare what it needs from this module.
+# Many-to-one links are joined, collections are loaded with a separate SELECT ... IN
+# so that tags, comments, ratings and images never multiply each other's rows.
+
+# PostResponse: user + tags + renditions for srcset
+POST_RESPONSE = (
+    joinedload(Post.user),
+    selectinload(Post.tags),
+    selectinload(Post.renditions),
+)
+
+# AdminPostResponse: ratings with the user who voted
+POST_RATINGS = (
+    selectinload(Post.ratings).joinedload(Rating.user),
+)
+
+# PhotoResponse: transformed image urls
+POST_IMAGES = (
+    selectinload(Post.all_images),
+)
+
+# CommentResponse: author + PostResponse of the commented post
+COMMENT_RESPONSE = (
+    joinedload(Comment.user),
+    joinedload(Comment.post).options(*POST_RESPONSE),
+)
+
+# PostCommentResponse: author only, the post is the one being listed
+POST_COMMENT_RESPONSE = (
+    joinedload(Comment.user),
+)
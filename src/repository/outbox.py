@@ -0,0 +1,76 @@
+from datetime import timedelta
+from typing import Dict, List
+
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import settings
+from src.entity.models import OutboxEmail
+
+
+async def add_email(email: OutboxEmail, db: AsyncSession):
+    """
+    The add_email function writes an email to the outbox.
+
+    :param email: OutboxEmail: The email
+    :param db: AsyncSession: Pass the database session to the function
+    :return: None
+    """
+    db.add(email)
+    await db.commit()
+
+
+async def claim_emails(db: AsyncSession, limit: int = settings.EMAIL_BATCH_SIZE,
+                       lease: int = settings.EMAIL_LEASE) -> List:
+    """
+    The claim_emails function takes the oldest due emails of the outbox for one sender.
+    The rows are locked with SKIP LOCKED, so concurrent senders claim different emails without waiting,
+    and leased for lease seconds, so the email of a sender that died is sent by another one afterwards.
+
+    :param db: AsyncSession: Pass the database session to the function
+    :param limit: int: The largest number of emails claimed
+    :param lease: int: Seconds until the emails may be claimed again
+    :return: Rows with id, recipient, subject, template, context and attempts
+    """
+    due = (select(OutboxEmail.id)
+           .where(OutboxEmail.sent_at.is_(None), OutboxEmail.attempts < settings.EMAIL_MAX_ATTEMPTS,
+                  OutboxEmail.next_attempt_at <= func.now())
+           .order_by(OutboxEmail.next_attempt_at).limit(limit)
+           .with_for_update(skip_locked=True))
+    stmt = (update(OutboxEmail).where(OutboxEmail.id.in_(due.scalar_subquery()))
+            .values(attempts=OutboxEmail.attempts + 1, next_attempt_at=func.now() + timedelta(seconds=lease))
+            .returning(OutboxEmail.id, OutboxEmail.recipient, OutboxEmail.subject, OutboxEmail.template,
+                       OutboxEmail.context, OutboxEmail.attempts))
+    emails = (await db.execute(stmt, execution_options={"synchronize_session": False})).all()
+    await db.commit()
+    return emails
+
+
+async def mark_sent(ids: List[int], db: AsyncSession):
+    """
+    The mark_sent function records that emails were handed over to the SMTP server.
+
+    :param ids: List[int]: The ids of the emails
+    :param db: AsyncSession: Pass the database session to the function
+    :return: None
+    """
+    if ids:
+        stmt = update(OutboxEmail).where(OutboxEmail.id.in_(ids)).values(sent_at=func.now(), last_error=None)
+        await db.execute(stmt, execution_options={"synchronize_session": False})
+        await db.commit()
+
+
+async def mark_failed(errors: Dict[int, tuple], db: AsyncSession):
+    """
+    The mark_failed function records failed attempts and when each email is due again.
+
+    :param errors: Dict[int, tuple]: Pairs of the error and the backoff in seconds by email id
+    :param db: AsyncSession: Pass the database session to the function
+    :return: None
+    """
+    for email_id, (error, backoff) in errors.items():
+        stmt = (update(OutboxEmail).where(OutboxEmail.id == email_id)
+                .values(last_error=error[:500], next_attempt_at=func.now() + timedelta(seconds=backoff)))
+        await db.execute(stmt, execution_options={"synchronize_session": False})
+    if errors:
+        await db.commit()
@@ -0,0 +1,123 @@
+import base64
+import binascii
+import json
+import uuid
+from datetime import datetime
+from typing import AsyncIterator
+
+from fastapi import HTTPException, status
+from sqlalchemy import Select, tuple_, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf import messages
+from src.entity.models import Post, Tag, Comment
+
+# Keysets used by the listing endpoints. The last column is always the primary key,
+# so every keyset is unique and pages never skip or repeat rows on ties.
+POSTS_BY_DATE = (Post.created_at, Post.id)
+POSTS_BY_RATING = (Post.rating, Post.id)
+TAGS_BY_ID = (Tag.id,)
+COMMENTS_BY_DATE = (Comment.created_at, Comment.id)
+
+STREAM_CHUNK_SIZE = 100
+
+
+def encode_cursor(values) -> str:
+    """
+    The encode_cursor function packs the keyset values of the last row on a page into an opaque,
+    url-safe string that the client sends back to get the next page.
+
+    :param values: The keyset values of the last row
+    :return: An opaque cursor string
+    """
+    raw = json.dumps([value.isoformat() if isinstance(value, datetime) else str(value) if isinstance(value, uuid.UUID)
+                      else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, keys) -> list:
+    """
+    The decode_cursor function unpacks a cursor created by encode_cursor and converts every value
+    back to the python type of the matching keyset column.
+    A malformed or foreign cursor results in HTTP 400.
+
+    :param cursor: str: The cursor received from the client
+    :param keys: The keyset columns the cursor was created for
+    :return: A list of keyset values
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError(cursor)
+        result = []
+        for key, value in zip(keys, values):
+            python_type = key.type.python_type
+            result.append(datetime.fromisoformat(value) if python_type is datetime else python_type(value))
+        return result
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=messages.INVALID_CURSOR)
+
+
+def keyset(stmt: Select, keys, cursor: str | None, descending: bool = True) -> Select:
+    """
+    The keyset function orders a statement by the keyset and, when a cursor is given,
+    restricts it to the rows that come after the cursor position.
+
+    :param stmt: Select: The statement to order
+    :param keys: The keyset columns, the primary key last
+    :param cursor: str | None: The cursor to start after or None to start from the beginning
+    :param descending: bool: Order the keyset descending
+    :return: The ordered statement
+    """
+    if cursor:
+        position = tuple_(*[literal(value, key.type) for key, value in zip(keys, decode_cursor(cursor, keys))])
+        stmt = stmt.where(tuple_(*keys) < position if descending else tuple_(*keys) > position)
+    return stmt.order_by(*[key.desc() if descending else key.asc() for key in keys])
+
+
+async def paginate(stmt: Select, keys, cursor: str | None, limit: int, db: AsyncSession,
+                   descending: bool = True):
+    """
+    The paginate function applies keyset (cursor) pagination to a select statement.
+    Instead of OFFSET it filters on the keyset of the last row of the previous page,
+    so a deep page is served by the same index range scan as the first one.
+    One extra row is fetched to find out whether there is a next page, no COUNT is issued.
+
+    :param stmt: Select: The statement to paginate, without ORDER BY and LIMIT
+    :param keys: The keyset columns, the primary key last
+    :param cursor: str | None: The cursor of the previous page or None for the first page
+    :param limit: int: The page size
+    :param db: AsyncSession: Pass the database session to the function
+    :param descending: bool: Order the keyset descending (newest / best first)
+    :return: A tuple of the rows of the page and the cursor of the next page or None
+    """
+    stmt = keyset(stmt, keys, cursor, descending).limit(limit + 1)
+    result = await db.execute(stmt)
+    rows = result.scalars().all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], key.key) for key in keys])
+    return rows, next_cursor
+
+
+async def stream(stmt: Select, keys, cursor: str | None, db: AsyncSession, descending: bool = True,
+                 chunk_size: int = STREAM_CHUNK_SIZE) -> AsyncIterator:
+    """
+    The stream function yields the rows of a keyset ordered statement one by one.
+    Rows are pulled from a server-side cursor in chunks of chunk_size,
+    so only one chunk is held in memory no matter how large the result is.
+
+    :param stmt: Select: The statement to stream, without ORDER BY and LIMIT
+    :param keys: The keyset columns, the primary key last
+    :param cursor: str | None: The cursor to start after or None to start from the beginning
+    :param db: AsyncSession: Pass the database session to the function
+    :param descending: bool: Order the keyset descending
+    :param chunk_size: int: The number of rows fetched from the server-side cursor at once
+    :return: An async iterator of rows
+    """
+    stmt = keyset(stmt, keys, cursor, descending).execution_options(yield_per=chunk_size)
+    result = await db.stream(stmt)
+    async for row in result.scalars():
+        yield row
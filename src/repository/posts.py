@@ -1,29 +1,37 @@
-import cloudinary
-import cloudinary.uploader
-from fastapi import HTTPException, UploadFile, File
+from typing import List
 
-from sqlalchemy import select
+from fastapi import HTTPException, UploadFile, File, status
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.conf.cloudinary import configure_cloudinary
+from src.conf import messages
 from src.entity.models import Post, User, TagToPost
+from src.repository import derived
+from src.repository.loaders import POST_RESPONSE
+from src.repository.pagination import paginate, POSTS_BY_DATE
 from src.routes.transformation import remove_qrcode
 
 from src.schemas.post import PostModel
-from src.repository.tags import get_or_create_tag_by_name
+from src.repository.tags import add_tags_to_post, add_tags_to_posts
 from src.schemas.tag import TagUpdate
+from src.services.cache import cache_service
+from src.services.jobs import job_queue
 
 
-async def get_posts(db: AsyncSession):
+async def get_posts(limit: int, cursor: str | None, db: AsyncSession):
     """
-    The get_posts function returns a list of the most recent 20 posts.
+    The get_posts function returns a page of the most recent posts.
 
+    :param limit: int: The page size
+    :param cursor: str | None: The cursor of the previous page or None for the first page
     :param db: AsyncSession: Pass the database session to the function
-    :return: A list of posts
+    :return: A list of posts and the cursor of the next page
     """
-    post = select(Post).order_by(Post.created_at.desc()).limit(20)
-    post = await db.execute(post)
-    return post.scalars().unique().all()
+    post = select(Post).options(*POST_RESPONSE)
+    return await paginate(post, POSTS_BY_DATE, cursor, limit, db)
 
 
 async def get_post(post_id: int, db: AsyncSession):
@@ -35,11 +43,24 @@ async def get_post(post_id: int, db: AsyncSession):
     :param db: AsyncSession: Pass in the database session to use
     :return: A single post
     """
-    post = select(Post).filter(Post.id == post_id)
+    post = select(Post).options(*POST_RESPONSE).filter(Post.id == post_id)
     post = await db.execute(post)
     return post.scalars().first()
 
 
+async def get_post_owner(post_id: int, db: AsyncSession):
+    """
+    The get_post_owner function is a light existence check for a post.
+    It selects only the id and the owner of the post, without loading any relationships.
+
+    :param post_id: int: Specify the post
+    :param db: AsyncSession: Pass in the database session to use
+    :return: A row with id and user_id or none if the post does not exist
+    """
+    post = await db.execute(select(Post.id, Post.user_id).filter(Post.id == post_id))
+    return post.first()
+
+
 async def get_user_post(post_id: int, current_user: User, db: AsyncSession):
     """
     The get_user_post function is used to get a post by its id.
@@ -53,14 +74,15 @@ async def get_user_post(post_id: int, current_user: User, db: AsyncSession):
     :param db: AsyncSession: Pass the database session to the function
     :return: A post object with the given id, if it exists
     """
-    post = select(Post).filter(Post.id == post_id).filter_by(user=current_user)
+    post = select(Post).filter(Post.id == post_id, Post.user_id == current_user.id)
     if current_user.user_type_id != 1:
         post = select(Post).filter(Post.id == post_id)
-    post = await db.execute(post)
+    post = await db.execute(post.options(*POST_RESPONSE))
     return post.scalars().first()
 
 
-async def create_post(body: PostModel, image_url: str, image_id: str, current_user: User, db: AsyncSession):
+async def create_post(body: PostModel, image_url: str, image_id: str, current_user: User, db: AsyncSession,
+                      image_hash: str | None = None):
     """
     The create_post function creates a new post in the database.
         It takes three arguments:
@@ -73,25 +95,97 @@ async def create_post(body: PostModel, image_url: str, image_id: str, current_us
     :param image_id: str: Store the image id in the database
     :param current_user: User: Get the user who is currently logged in
     :param db: AsyncSession: Pass the database session to the function
+    :param image_hash: str | None: The sha256 of the image, a user cannot post the same image twice
     :return: A post object
     """
-    post = select(Post).filter_by(user=current_user).filter(Post.name == body.name)
+    post = select(Post).filter(Post.user_id == current_user.id, Post.name == body.name)
     post = await db.execute(post)
     post = post.scalars().first()
     if post:
         raise HTTPException(status_code=400, detail="Post with this name already exists")
-    post = Post(name=body.name, content=body.content, image_url=image_url, image_id=image_id, user=current_user)
+    post = Post(name=body.name, content=body.content, image_url=image_url, image_id=image_id,
+                image_hash=image_hash, user_id=current_user.id)
     db.add(post)
-    await db.commit()
-    await db.refresh(post)
+    # flush for the id, the post and its tags are committed together
+    try:
+        await db.flush()
+    except IntegrityError:
+        # a concurrent request of the user inserted the same image first
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=messages.UPLOAD_DUPLICATE)
     post_id = post.id
-    for tag_name in body.tags:
-        tag = await get_or_create_tag_by_name(tag_name, db)
-        tag_to_post = TagToPost(post_id=post_id, tag_id=tag.id)
-        db.add(tag_to_post)
+    await add_tags_to_post(post_id, body.tags or [], db)
     await db.commit()
-    await db.refresh(post)
-    return post
+    await cache_service.invalidate("profile", current_user.username)
+    return await get_post(post_id, db)
+
+
+async def get_post_id_by_image_hash(image_hash: str, current_user: User, db: AsyncSession) -> int | None:
+    """
+    The get_post_id_by_image_hash function finds a post of the user with the same image.
+
+    :param image_hash: str: The sha256 of the image
+    :param current_user: User: The owner of the posts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The id of the post or None
+    """
+    stmt = select(Post.id).where(Post.user_id == current_user.id, Post.image_hash == image_hash).limit(1)
+    return await db.scalar(stmt)
+
+
+async def get_posted_image_hashes(image_hashes: List[str], current_user: User, db: AsyncSession) -> set:
+    """
+    The get_posted_image_hashes function finds which of the images the user has already posted.
+
+    :param image_hashes: List[str]: The sha256 of the images
+    :param current_user: User: The owner of the posts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The set of the hashes of posted images
+    """
+    stmt = select(Post.image_hash).where(Post.user_id == current_user.id, Post.image_hash.in_(image_hashes))
+    return set(await db.scalars(stmt))
+
+
+async def get_post_ids_by_name(names: List[str], current_user: User, db: AsyncSession) -> dict:
+    """
+    The get_post_ids_by_name function finds which of the given names the user already used for a post.
+
+    :param names: List[str]: The names of the posts
+    :param current_user: User: The owner of the posts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: A dict of post ids by name
+    """
+    if not names:
+        return {}
+    stmt = select(Post.id, Post.name).where(Post.user_id == current_user.id, Post.name.in_(names))
+    return {name: post_id for post_id, name in await db.execute(stmt)}
+
+
+async def create_posts(items: List[dict], current_user: User, db: AsyncSession) -> dict:
+    """
+    The create_posts function inserts many posts of a user with one multi-row insert,
+    links their tags with one more and commits everything in a single transaction.
+
+    :param items: List[dict]: The posts, each with name, content, image_url, image_id, image_hash and tags
+    :param current_user: User: The owner of the posts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: A dict of the new post ids by name
+    """
+    if not items:
+        return {}
+    stmt = insert(Post).values([{"name": item["name"], "content": item["content"], "image_url": item["image_url"],
+                                 "image_id": item["image_id"], "image_hash": item.get("image_hash"), "user_id": current_user.id}
+                                for item in items])
+    try:
+        post_ids = {name: post_id for post_id, name in await db.execute(stmt.returning(Post.id, Post.name))}
+    except IntegrityError:
+        # a concurrent request of the user inserted one of the images first
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=messages.UPLOAD_DUPLICATE)
+    await add_tags_to_posts({post_ids[item["name"]]: item["tags"] or [] for item in items}, db)
+    await db.commit()
+    await cache_service.invalidate("profile", current_user.username)
+    return post_ids
 
 
 async def update_post(post_id: int, body: PostModel, current_user: User, db: AsyncSession):
@@ -114,14 +208,11 @@ async def update_post(post_id: int, body: PostModel, current_user: User, db: Asy
         post.content = body.content
         post.image_url = post.image_url
 
-        post.tags.clear()
-
-        for tag_name in body.tags:
-            tag = await get_or_create_tag_by_name(tag_name, db)
-            tag_to_post = TagToPost(post_id=post_id, tag_id=tag.id)
-            db.add(tag_to_post)
+        await db.execute(delete(TagToPost).where(TagToPost.post_id == post_id))
+        await add_tags_to_post(post_id, body.tags or [], db)
         await db.commit()
-        await db.refresh(post)
+        await cache_service.invalidate("post", post_id)
+        post = await get_post(post_id, db)
     return post
 
 
@@ -138,7 +229,7 @@ async def add_tag_to_post(body: TagUpdate, current_user: User, db: AsyncSession)
     :param db: AsyncSession: Pass the database session to the function
     :return: A post with a new tag
     """
-    post = await db.execute(select(Post).where(Post.id == body.post_id))
+    post = await db.execute(select(Post).options(selectinload(Post.tags)).where(Post.id == body.post_id))
     post = post.scalar()
     if not post:
         raise HTTPException(status_code=400, detail="Post with this name doesn't exist")
@@ -147,18 +238,14 @@ async def add_tag_to_post(body: TagUpdate, current_user: User, db: AsyncSession)
     body_tagnames = [bod for bod in body.tags]
     post_tagnames = [tags.name for tags in post.tags]
     post__id = post.id
-    for tag_name in body.tags:
-        if tag_name in post_tagnames:
-            continue
-        if len(set(post_tagnames + body_tagnames)) > 5:
-            quantity = 5 - len(post.tags)
-            raise HTTPException(status_code=400, detail=f"Post can consists maximum 5 tags. You can add: {quantity}")
-        tag = await get_or_create_tag_by_name(tag_name, db)
-        tag_to_post = TagToPost(post_id=post__id, tag_id=tag.id)
-        db.add(tag_to_post)
+    new_tagnames = [tag_name for tag_name in dict.fromkeys(body_tagnames) if tag_name not in post_tagnames]
+    if new_tagnames and len(set(post_tagnames + body_tagnames)) > 5:
+        quantity = 5 - len(post.tags)
+        raise HTTPException(status_code=400, detail=f"Post can consists maximum 5 tags. You can add: {quantity}")
+    await add_tags_to_post(post__id, new_tagnames, db)
     await db.commit()
-    await db.refresh(post)
-    return post
+    await cache_service.invalidate("post", post__id)
+    return await get_post(post__id, db)
 
 
 async def remove_post(post_id: int, current_user: User, db: AsyncSession):
@@ -179,10 +266,17 @@ async def remove_post(post_id: int, current_user: User, db: AsyncSession):
     post = await get_user_post(post_id, current_user, db)
     post_return = post
     if post:
-        configure_cloudinary()
-        cloudinary.uploader.destroy(str(post.image_id))
+        owner = post.user.username
+        image_id = str(post.image_id)
+        renditions = [rendition.url for rendition in post.renditions]
         post.tags.clear()
         await db.commit()
         await db.delete(post)
         await db.commit()
+        await job_queue.enqueue_or_store("delete_media", [image_id])
+        if renditions:
+            await job_queue.enqueue_or_store("delete_renditions", renditions)
+        await derived.drop_assets(image_id, db)
+        await cache_service.invalidate("post", post_id)
+        await cache_service.invalidate("profile", owner)
     return post_return
@@ -4,6 +4,9 @@ from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from src.entity.models import User, Post, Comment
 from src.schemas.user import UserSchema
+from src.services.cache import cache_service
+from src.services.passwords import password_hasher
+from src.services.principals import principal_cache
 
 
 async def get_profile(user: User, db: AsyncSession) -> dict:
@@ -43,11 +46,13 @@ async def get_profile(user: User, db: AsyncSession) -> dict:
 async def update_user_profile(body: UserSchema, user: User, db: AsyncSession) -> User | None:
     """
     The update_user_profile function updates a user's profile information.
+    The password is hashed only if it changed, then the token_version of the user is increased
+    and the refresh token is dropped, so tokens issued with the old password are not accepted any more.
         Args:
             - body (UserSchema): The UserSchema object containing the new user data.
             - user (User): The User object to be updated.
 
-    :param body: UserSchema: Get the data from the request body
+    :param body: UserSchema: Get the data from the request body, with the plain password
     :param user: User: Get the user object from the database
     :param db: AsyncSession: Pass in the database session
     :return: The updated user object
@@ -56,10 +61,16 @@ async def update_user_profile(body: UserSchema, user: User, db: AsyncSession) ->
     result = await db.execute(stmt)
     user = result.scalar_one_or_none()
     if user:
+        old_username, old_email = user.username, user.email
         user.username = body.username
         user.email = body.email
-        user.password = body.password
+        if not await password_hasher.verify(body.password, user.password):
+            user.password = await password_hasher.hash(body.password)
+            user.token_version += 1
+            user.refresh_token = None
         user.updated_at = datetime.now()
         await db.commit()
         await db.refresh(user)
+        await cache_service.invalidate("profile", old_username, body.username)
+        await principal_cache.invalidate(old_email, body.email)
     return user
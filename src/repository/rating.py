@@ -1,24 +1,47 @@
-from sqlalchemy import select, func
+from typing import List
+
+from sqlalchemy import select, func, update, case, cast, or_, Float
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.entity.models import Rating, Post
+from src.repository.loaders import POST_RATINGS
+from src.services.cache import cache_service
+
+
+def rating_counters(rating_sum, rating_count) -> dict:
+    """
+    The rating_counters function builds the SET clause that stores new rating counters of a post
+    together with the average derived from them.
+    Column references on the right side of SET see the row before the update,
+    so the counters can be shifted in place without reading them first.
+
+    :param rating_sum: The new value of posts.rating_sum
+    :param rating_count: The new value of posts.rating_count
+    :return: The values for update(Post)
+    """
+    average = case((rating_count > 0, cast(rating_sum, Float) / rating_count), else_=0.0)
+    return {"rating_sum": rating_sum, "rating_count": rating_count, "rating": average}
 
 
 async def create_rating(body, postid, current_user, db):
     """
     The create_rating function creates a new rating for the post with id = postid.
         The value of the rating is given by body.value, and it is created by current_user.
+        The rating counters of the post are shifted by the new value in the same transaction,
+        so a vote is a single-row update no matter how many ratings the post already has.
 
     :param body: Get the value of the rating
     :param postid: Find the post that is being rated
     :param current_user: Get the id of the user who is currently logged in
     :param db: Access the database
-    :return: The new rating that was created
+    :return: None
     """
     new_rating = Rating(value=body.value, post_id=postid, user_id=current_user.id)
     db.add(new_rating)
+    await db.execute(update(Post).where(Post.id == postid)
+                     .values(**rating_counters(Post.rating_sum + body.value, Post.rating_count + 1)))
     await db.commit()
-    await db.refresh(new_rating)
+    await cache_service.invalidate("post", postid)
 
 
 async def get_rating(body, user, db):
@@ -50,36 +73,55 @@ async def get_postsratings(_id, db: AsyncSession):
     return post.scalars().unique().all()
 
 
-async def refresh_rating(post: Post, db: AsyncSession):
+async def get_post_with_ratings(post_id: int, db: AsyncSession):
     """
-    The refresh_rating function takes a Post object and an AsyncSession object as arguments.
-    It then uses the SQLAlchemy ORM to query the database for all ratings associated with that post,
-    and calculates their average value. It then updates the rating attribute of that post with this new value,
-    commits it to the database, and returns a refreshed version of that Post.
+    The get_post_with_ratings function returns a post together with all of its ratings
+    and the users who left them.
 
-    :param post: Post: Pass the post object to the function
+    :param post_id: int: Specify the post
     :param db: AsyncSession: Pass the database session to the function
-    :return: A post object
+    :return: A post object or none
     """
-    stmt = select(func.avg(Rating.value)).where(Rating.post_id == post.id)
-    result = await db.execute(stmt)
-    average_rating = result.scalar()
-    post.rating = average_rating
-    await db.commit()
-    await db.refresh(post)
-    return post
+    post = select(Post).options(*POST_RATINGS).where(Post.id == post_id)
+    post = await db.execute(post)
+    return post.scalars().first()
 
 
-async def delete_rating(post: Post, rating: Rating, db: AsyncSession):
+async def delete_rating(rating: Rating, db: AsyncSession):
     """
-    The delete_rating function deletes a rating from the database.
+    The delete_rating function deletes a rating from the database
+    and takes its value out of the rating counters of the post in the same transaction.
 
-    :param post: Post: Get the post that is being rated
     :param rating: Rating: Specify the rating to be deleted
     :param db: AsyncSession: Pass the database session to the function
-    :return: The post object
+    :return: None
     """
+    post_id, value = rating.post_id, rating.value
     await db.delete(rating)
+    await db.execute(update(Post).where(Post.id == post_id)
+                     .values(**rating_counters(Post.rating_sum - value, Post.rating_count - 1)))
+    await db.commit()
+    await cache_service.invalidate("post", post_id)
+
+
+async def repair_rating_counters(db: AsyncSession) -> List[int]:
+    """
+    The repair_rating_counters function recomputes the rating counters of every post from the ratings table
+    and rewrites the posts whose stored counters have drifted.
+    It is meant to be run by an administrator for drift detection, not on the request path.
+
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The ids of the posts that were repaired
+    """
+    rating_sum = select(func.coalesce(func.sum(Rating.value), 0)).where(Rating.post_id == Post.id).scalar_subquery()
+    rating_count = select(func.count(Rating.id)).where(Rating.post_id == Post.id).scalar_subquery()
+    stmt = (update(Post)
+            .where(or_(Post.rating_sum != rating_sum, Post.rating_count != rating_count))
+            .values(**rating_counters(rating_sum, rating_count))
+            .returning(Post.id)
+            .execution_options(synchronize_session=False))
+    repaired = await db.execute(stmt)
+    repaired = repaired.scalars().all()
     await db.commit()
-    await db.refresh(post)
-    return post
+    await cache_service.invalidate("post", *repaired)
+    return sorted(repaired)
@@ -0,0 +1,24 @@
+from typing import List
+
+from sqlalchemy import delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.entity.models import Rendition
+
+
+async def replace_renditions(post_id: int, renditions: List[dict], db: AsyncSession) -> List[str]:
+    """
+    The replace_renditions function records the renditions of a post in place of the previous ones
+    in a single transaction.
+
+    :param post_id: int: The id of the post
+    :param renditions: List[dict]: The renditions, each with width, format and url
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The urls of the previous renditions that are not used anymore
+    """
+    previous = await db.execute(delete(Rendition).where(Rendition.post_id == post_id).returning(Rendition.url))
+    previous = set(previous.scalars().all())
+    if renditions:
+        await db.execute(insert(Rendition).values([{"post_id": post_id, **rendition} for rendition in renditions]))
+    await db.commit()
+    return sorted(previous - {rendition["url"] for rendition in renditions})
@@ -1,18 +1,77 @@
-from sqlalchemy import select, text
+import re
+from typing import AsyncIterator, List
+
+from sqlalchemy import select, Select, Float, func, or_
+from sqlalchemy.orm import with_expression
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.conf.cloudinary import configure_cloudinary
-from src.entity.models import Post, User, TagToPost, Tag
+from src.entity.models import Post, User, TagToPost, Tag, TS_CONFIG
+from src.repository.loaders import POST_RESPONSE
+from src.repository.pagination import paginate, stream, POSTS_BY_DATE, POSTS_BY_RATING
+
+
+def order_keys(filter_by_date: bool, filter_by_rating: bool):
+    """
+    The order_keys function picks the keyset the search results are ordered and paginated by.
+    Rating wins over date when both flags are set, date is the default.
+
+    :param filter_by_date: bool: Order the posts by date
+    :param filter_by_rating: bool: Order the posts by rating
+    :return: A keyset of post columns
+    """
+    if filter_by_rating:
+        return POSTS_BY_RATING
+    return POSTS_BY_DATE
+
+
+def posts_by_tag(tag: str) -> Select:
+    """
+    The posts_by_tag function builds the statement selecting the posts that have the given tag.
+
+    :param tag: str: Filter posts by tag
+    :return: A select statement
+    """
+    return select(Post).options(*POST_RESPONSE).join(Post.tags).filter(Tag.name == tag)
+
+
+def posts_by_keyword(keyword: str) -> Select:
+    """
+    The posts_by_keyword function builds the statement selecting the posts whose name contains the keyword.
+
+    :param keyword: str: Filter the posts by name
+    :return: A select statement
+    """
+    return select(Post).options(*POST_RESPONSE).where(Post.name.like(f'%{keyword}%'))
+
+
+def posts_by_user(username: str) -> Select:
+    """
+    The posts_by_user function builds the statement selecting the posts made by the user with the given username.
 
-from src.schemas.post import PostModel
-from src.repository.tags import get_or_create_tag_by_name
-from src.schemas.tag import TagUpdate
+    :param username: str: Filter the posts by username
+    :return: A select statement
+    """
+    return select(Post).options(*POST_RESPONSE).join(Post.user).filter(User.username == username)
 
 
-from src.entity.models import Post, User, Tag
+def stream_posts(post: Select, filter_by_date: bool, filter_by_rating: bool, cursor: str | None,
+                 db: AsyncSession) -> AsyncIterator[Post]:
+    """
+    The stream_posts function streams every post matched by one of the statements above,
+    in the same order as the paginated search, starting after the cursor if one is given.
 
+    :param post: Select: The statement built by posts_by_tag, posts_by_keyword or posts_by_user
+    :param filter_by_date: bool: Order the posts by date
+    :param filter_by_rating: bool: Order the posts by rating
+    :param cursor: str | None: The cursor to start after
+    :param db: AsyncSession: Pass the database session to the function
+    :return: An async iterator of posts
+    """
+    return stream(post, order_keys(filter_by_date, filter_by_rating), cursor, db)
 
-async def get_post_by_tag(filter_by_date: bool, filter_by_rating: bool, tag: str, db: AsyncSession):
+
+async def get_post_by_tag(filter_by_date: bool, filter_by_rating: bool, tag: str, limit: int,
+                         cursor: str | None, db: AsyncSession):
     """
     The get_post_by_tag function takes in a boolean value for filtering by date,
     a boolean value for filtering by rating, a tag name string and an async database session.
@@ -21,20 +80,18 @@ async def get_post_by_tag(filter_by_date: bool, filter_by_rating: bool, tag: str
     :param filter_by_date: bool: Filter the posts by date
     :param filter_by_rating: bool: Filter the posts by rating
     :param tag: str: Filter posts by tag
+    :param limit: int: The page size
+    :param cursor: str | None: The cursor of the previous page
     :param db: AsyncSession: Pass the database session to the function
-    :return: A list of posts with the given tag
+    :return: A page of posts with the given tag and the cursor of the next page
     :doc-author: Trelent
     """
-    post = select(Post).join(Post.tags).filter(Tag.name == tag)
-    if filter_by_date:
-        post = post.order_by(Post.created_at.desc())
-    if filter_by_rating:
-        post = post.order_by(Post.rating.desc())
-    post = await db.execute(post)
-    return post.scalars().unique().all()
+    post = posts_by_tag(tag)
+    return await paginate(post, order_keys(filter_by_date, filter_by_rating), cursor, limit, db)
 
 
-async def get_post_by_keyword(filter_by_date: bool, filter_by_rating: bool, keyword: str, db: AsyncSession):
+async def get_post_by_keyword(filter_by_date: bool, filter_by_rating: bool, keyword: str, limit: int,
+                             cursor: str | None, db: AsyncSession):
 
     """
     The get_post_by_keyword function takes in a keyword, and returns all posts that contain the keyword.
@@ -44,19 +101,17 @@ async def get_post_by_keyword(filter_by_date: bool, filter_by_rating: bool, keyw
     :param filter_by_date: bool: Filter the posts by date
     :param filter_by_rating: bool: Filter the posts by rating
     :param keyword: str: Filter the posts by name
+    :param limit: int: The page size
+    :param cursor: str | None: The cursor of the previous page
     :param db: AsyncSession: Connect to the database
-    :return: A list of posts that match the keyword
+    :return: A page of posts that match the keyword and the cursor of the next page
     """
-    post = select(Post).where(Post.name.like(f'%{keyword}%'))
-    if filter_by_date:
-        post = post.order_by(Post.created_at.desc())
-    if filter_by_rating:
-        post = post.order_by(Post.rating.desc())
-    post = await db.execute(post)
-    return post.scalars().unique().all()
+    post = posts_by_keyword(keyword)
+    return await paginate(post, order_keys(filter_by_date, filter_by_rating), cursor, limit, db)
 
 
-async def get_post_by_user(filter_by_date: bool, filter_by_rating: bool, username: str, db: AsyncSession):
+async def get_post_by_user(filter_by_date: bool, filter_by_rating: bool, username: str, limit: int,
+                          cursor: str | None, db: AsyncSession):
     """
     The get_post_by_user function takes in a boolean value for filtering by date,
     a boolean value for filtering by rating, a username string and an async database session.
@@ -65,13 +120,59 @@ async def get_post_by_user(filter_by_date: bool, filter_by_rating: bool, usernam
     :param filter_by_date: bool: Determine if the posts should be filtered by date
     :param filter_by_rating: bool: Filter the posts by rating
     :param username: str: Filter the posts by username
+    :param limit: int: The page size
+    :param cursor: str | None: The cursor of the previous page
     :param db: AsyncSession: Pass the database connection to the function
-    :return: A list of posts by the user with the given username
+    :return: A page of posts by the user with the given username and the cursor of the next page
     """
-    post = select(Post).join(Post.user).filter(User.username == username)
-    if filter_by_date:
-        post = post.order_by(Post.created_at.desc())
-    if filter_by_rating:
-        post = post.order_by(Post.rating.desc())
-    post = await db.execute(post)
-    return post.scalars().unique().all()
+    post = posts_by_user(username)
+    return await paginate(post, order_keys(filter_by_date, filter_by_rating), cursor, limit, db)
+
+
+def prefix_query(query: str) -> str:
+    """
+    The prefix_query function turns free text into a to_tsquery expression where every word
+    must be present and may be the prefix of a longer word, e.g. "sun set" -> "sun:* & set:*".
+    Only word characters are kept, so the text can't inject tsquery operators.
+
+    :param query: str: The search text
+    :return: A tsquery string
+    """
+    return " & ".join(f"{word}:*" for word in re.findall(r"\w+", query))
+
+
+async def fulltext_search(query: str, tags: List[str] | None, filter_by_date: bool, filter_by_rating: bool,
+                          limit: int, cursor: str | None, db: AsyncSession):
+    """
+    The fulltext_search function searches the name and content of posts through the search_vector GIN index.
+    Posts whose name is only similar to the query (typos) are found through the pg_trgm index on name.
+    Both conditions, the tag filter and the ordering run as a single query.
+    By default the posts are ranked by ts_rank plus name similarity, filter_by_date and filter_by_rating
+    order them like the other searches.
+
+    :param query: str: The search text, every word is matched as a prefix
+    :param tags: List[str] | None: Only return posts that have all of these tags
+    :param filter_by_date: bool: Order the posts by date
+    :param filter_by_rating: bool: Order the posts by rating
+    :param limit: int: The page size
+    :param cursor: str | None: The cursor of the previous page
+    :param db: AsyncSession: Pass the database session to the function
+    :return: A page of matching posts and the cursor of the next page
+    """
+    ts_query = func.to_tsquery(TS_CONFIG, prefix_query(query))
+    rank = (func.ts_rank(Post.search_vector, ts_query, type_=Float)
+            + func.similarity(Post.name, query, type_=Float)).label("search_rank")
+    post = (select(Post)
+            .options(*POST_RESPONSE, with_expression(Post.search_rank, rank))
+            .where(or_(Post.search_vector.op("@@")(ts_query), Post.name.op("%")(query))))
+    if tags:
+        tagged = (select(TagToPost.post_id).join(Tag, Tag.id == TagToPost.tag_id)
+                  .where(Tag.name.in_(tags))
+                  .group_by(TagToPost.post_id)
+                  .having(func.count(Tag.name.distinct()) == len(set(tags))))
+        post = post.where(Post.id.in_(tagged))
+    if filter_by_date or filter_by_rating:
+        keys = order_keys(filter_by_date, filter_by_rating)
+    else:
+        keys = (rank, Post.id)
+    return await paginate(post, keys, cursor, limit, db)
@@ -1,10 +1,13 @@
-from typing import List
+from typing import List, Tuple
 
 from fastapi import HTTPException
-from sqlalchemy import select
+from sqlalchemy import insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from src.entity.models import Tag
+from src.entity.models import Tag, TagToPost
+from src.repository.pagination import paginate, TAGS_BY_ID
 from src.schemas.tag import TagModel
+from src.services.cache import cache_service
 
 
 async def create_tag(body: TagModel, db: AsyncSession) -> Tag:
@@ -28,18 +31,17 @@ async def create_tag(body: TagModel, db: AsyncSession) -> Tag:
     return tag
 
 
-async def get_all_tags(limit, offset, db: AsyncSession) -> List[Tag]:
+async def get_all_tags(limit, cursor, db: AsyncSession) -> Tuple[List[Tag], str | None]:
     """
-    The get_all_tags function returns a list of all tags in the database.
+    The get_all_tags function returns a page of tags in the database.
 
     :param limit: Limit the number of results returned
-    :param offset: Skip a certain number of rows
+    :param cursor: The cursor of the previous page or None for the first page
     :param db: AsyncSession: Pass the database session into the function
-    :return: A list of tag objects
+    :return: A list of tag objects and the cursor of the next page
     """
-    stmt = select(Tag).offset(offset).limit(limit)
-    result = await db.execute(stmt)
-    return result.scalars().unique().all()
+    stmt = select(Tag)
+    return await paginate(stmt, TAGS_BY_ID, cursor, limit, db, descending=False)
 
 
 async def get_tag(tag_name, db: AsyncSession) -> Tag:
@@ -66,18 +68,66 @@ async def get_or_create_tag_by_name(tag_name: str, db: AsyncSession) -> Tag:
     :param db: AsyncSession: Pass in the database session to the function
     :return: A tag instance
     """
-    tag = await db.execute(select(Tag).where(Tag.name == tag_name))
-    tag = tag.scalars().first()
+    tag = await get_tag(tag_name, db)
     if tag:
-        print("Exist")
         return tag
-    else:
-        print("NOT Exist")
-        new_tag = Tag(name=tag_name)
-        db.add(new_tag)
-        await db.commit()
-        await db.refresh(new_tag)
-        return new_tag
+    await upsert_tags([tag_name], db)
+    await db.commit()
+    return await get_tag(tag_name, db)
+
+
+async def upsert_tags(tag_names: List[str], db: AsyncSession) -> dict:
+    """
+    The upsert_tags function creates the missing tags of a list in one INSERT ... ON CONFLICT DO NOTHING
+    and returns the ids of all of them. The unique index on tags.name makes concurrent calls with the same
+    new name safe; the names the insert skipped are read in a second statement.
+    It does not commit, the caller owns the transaction.
+
+    :param tag_names: List[str]: The names of the tags
+    :param db: AsyncSession: Pass in the database session
+    :return: A dict of tag ids by name
+    """
+    tag_names = list(dict.fromkeys(tag_names))
+    if not tag_names:
+        return {}
+    stmt = pg_insert(Tag).values([{"name": name} for name in tag_names])
+    stmt = stmt.on_conflict_do_nothing(index_elements=[Tag.name]).returning(Tag.id, Tag.name)
+    tag_ids = {name: tag_id for tag_id, name in await db.execute(stmt)}
+    existing = [name for name in tag_names if name not in tag_ids]
+    if existing:
+        stmt = select(Tag.id, Tag.name).where(Tag.name.in_(existing))
+        tag_ids.update({name: tag_id for tag_id, name in await db.execute(stmt)})
+    return tag_ids
+
+
+async def add_tags_to_post(post_id: int, tag_names: List[str], db: AsyncSession):
+    """
+    The add_tags_to_post function links tags to a post, creating the tags that do not exist yet.
+    It does not commit, the caller owns the transaction.
+
+    :param post_id: int: The id of the post
+    :param tag_names: List[str]: The names of the tags, none of them may be linked to the post already
+    :param db: AsyncSession: Pass in the database session
+    :return: None
+    """
+    await add_tags_to_posts({post_id: tag_names}, db)
+
+
+async def add_tags_to_posts(tags_by_post: dict, db: AsyncSession):
+    """
+    The add_tags_to_posts function links tags to many posts, creating the tags that do not exist yet.
+    All tags are upserted at once and the links are written with one multi-row insert.
+    It does not commit, the caller owns the transaction.
+
+    :param tags_by_post: dict: The tag names of each post by post id
+    :param db: AsyncSession: Pass in the database session
+    :return: None
+    """
+    tag_ids = await upsert_tags([name for tag_names in tags_by_post.values() for name in tag_names], db)
+    links = [{"post_id": post_id, "tag_id": tag_ids[name]}
+             for post_id, tag_names in tags_by_post.items() for name in dict.fromkeys(tag_names)]
+    if links:
+        await db.execute(insert(TagToPost).values(links))
 
 
 async def remove_tag(tag: Tag, db: AsyncSession):
@@ -88,6 +138,8 @@ async def remove_tag(tag: Tag, db: AsyncSession):
     :param db: AsyncSession: Pass in the database session
     :return: The tag that was removed
     """
+    tag_name = tag.name
     await db.delete(tag)
     await db.commit()
+    await cache_service.invalidate("tag", tag_name)
     return tag
@@ -1,13 +1,15 @@
 from fastapi import HTTPException
 
-from sqlalchemy import select, func, or_, extract
+from sqlalchemy import select, update, func, or_, extract
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.entity.models import Post, User, TagToPost ,PhotoUrl
+from src.repository.loaders import POST_IMAGES
+from src.repository.pagination import paginate, POSTS_BY_DATE
 from src.schemas.transformation import PhotoResponse
 from src.repository.tags import get_or_create_tag_by_name
 from src.schemas.tag import TagUpdate
-from typing import List
+from typing import List, Tuple
 
 async def get_photo_info(id: int, current_user: User,  db: AsyncSession):
     """
@@ -22,7 +24,7 @@ async def get_photo_info(id: int, current_user: User,  db: AsyncSession):
     :return: Photo information
     :rtype: Post
     """
-    photo = select(Post).filter_by(user=current_user).filter(Post.id == id)
+    photo = select(Post).filter(Post.user_id == current_user.id, Post.id == id)
     photo = await db.execute(photo)
     return photo.scalars().first()
 
@@ -50,7 +52,8 @@ async def update_qr(id: int, url: str, url_qr: str , publick_qr:str, db: AsyncSe
     Checks the information about the photo transformation in the database.
     If there is no information about the link to the transformation, 
     creates a field with info in the table. Checks for the presence of information 
-    about the link to the Qrcode, if it is not there, creates a link.
+    about the link to the Qrcode, if it is not there, adds it.
+    A repeated transformation returns the existing field.
 
     :param id: Post number with photo for transformation.
     :type id: int
@@ -63,21 +66,15 @@ async def update_qr(id: int, url: str, url_qr: str , publick_qr:str, db: AsyncSe
     :return: A list of URL.
     :rtype: list
     """
-    update_url = select(PhotoUrl).filter_by(transform_url=url)
+    update_url = select(PhotoUrl).filter_by(transform_url=url, post_id=id)
     update_url = await db.execute(update_url)
     update_url = update_url.scalars().first()
     if update_url:
-        if update_url.transform_url_qr:
-            raise HTTPException(status_code=400, detail="URL and Qrcode URL with this transformation already exists")
-        else:
-            if url_qr != None:
-                update_url.transform_url = url
-                update_url.transform_url_qr = url_qr
-                update_url.public_id_qrcode = publick_qr
-                await db.commit()
-                await db.refresh(update_url)
-            else:
-                raise HTTPException(status_code=400, detail="URL  with this transformation already exists")
+        if url_qr != None and not update_url.transform_url_qr:
+            update_url.transform_url_qr = url_qr
+            update_url.public_id_qrcode = publick_qr
+            await db.commit()
+            await db.refresh(update_url)
     else:
         update_url = PhotoUrl(transform_url=url, transform_url_qr=url_qr,public_id_qrcode=publick_qr, post_id=id)
         db.add(update_url)
@@ -127,7 +124,7 @@ async def get_photo_url(id, current_user: User, db: AsyncSession) -> List[PhotoU
     :return: Photo information
     :rtype: Post
     """
-    photo = select(Post).filter_by(user=current_user).filter_by(id=id)
+    photo = select(Post).options(*POST_IMAGES).filter(Post.user_id == current_user.id).filter_by(id=id)
     photo = await db.execute(photo)
     return photo.scalars().first()
 
@@ -144,7 +141,7 @@ async def info_qrcode_url(id_, current_user: User, db: AsyncSession) -> List[Pho
     :return: Qrcode information
     :rtype: str
     """
-    photo = select(PhotoUrl.public_id_qrcode).join(Post).filter_by(user=current_user).filter(Post.id == id_)
+    photo = select(PhotoUrl.public_id_qrcode).join(Post).filter(Post.user_id == current_user.id, Post.id == id_)
     photo = await db.execute(photo)
     # if photo:
     #     await db.delete(photo)
@@ -152,24 +149,23 @@ async def info_qrcode_url(id_, current_user: User, db: AsyncSession) -> List[Pho
     return photo.scalars().all()
 
 
-async def get_all_url(limit: int, offset: int, current_user: User, db: AsyncSession) -> List[PhotoUrl]:
+async def get_all_url(limit: int, cursor: str | None, current_user: User, db: AsyncSession) -> Tuple[List[Post], str | None]:
     """
-    Retrieves a list of contacts for a specific user with specified pagination parameters.
+    Retrieves a page of posts with photo links for a specific user.
 
-    :param offset: The number of contacts to skip.
-    :type offset: int
-    :param limit: The maximum number of cntacts to return.
+    :param cursor: The cursor of the previous page or None for the first page.
+    :type cursor: str | None
+    :param limit: The maximum number of posts to return.
     :type limit: int
     :param current_user: The user to retrieve post for.
     :type current_user: User
     :param db: The database session.
     :type db: Session
-    :return: A list of URL Post.
-    :rtype: List[Post URL]
+    :return: A list of URL Post and the cursor of the next page.
+    :rtype: Tuple[List[Post], str | None]
     """
-    photo = select(Post).filter_by(user=current_user).offset(offset).limit(limit)
-    photo = await db.execute(photo)
-    return photo.scalars().unique().all()
+    photo = select(Post).options(*POST_IMAGES).filter(Post.user_id == current_user.id)
+    return await paginate(photo, POSTS_BY_DATE, cursor, limit, db)
 
 async def remove_qr(id: int, url: str, url_qr: str , publick_qr:str, db: AsyncSession):
     """
@@ -196,4 +192,40 @@ async def remove_qr(id: int, url: str, url_qr: str , publick_qr:str, db: AsyncSe
     db.add(update_url)
     await db.commit()
     await db.refresh(update_url)
-    return update_url
\ No newline at end of file
+    return update_url
+
+
+async def get_urls_without_qr(post_ids: List[int], current_user: User, db: AsyncSession):
+    """
+    Retrieves the photo transformation links of the given posts of a user that have no Qrcode yet.
+
+    :param post_ids: Post numbers with transformed photos.
+    :type post_ids: List[int]
+    :param current_user: The user to retrieve posts for.
+    :type current_user: User
+    :param db: The database session.
+    :type db: Session
+    :return: Rows with id, post_id, transform_url of the link and image_id of the post.
+    :rtype: list
+    """
+    stmt = (select(PhotoUrl.id, PhotoUrl.post_id, PhotoUrl.transform_url, Post.image_id).join(Post)
+            .filter(Post.user_id == current_user.id, Post.id.in_(post_ids),
+                    PhotoUrl.transform_url.is_not(None), PhotoUrl.transform_url_qr.is_(None))
+            .order_by(PhotoUrl.id))
+    urls = await db.execute(stmt)
+    return urls.all()
+
+
+async def save_qr_batch(qrcodes: List[dict], db: AsyncSession):
+    """
+    Stores the Qrcode links of many photo transformation links in one statement.
+
+    :param qrcodes: Dicts with id, transform_url_qr and public_id_qrcode of the links.
+    :type qrcodes: List[dict]
+    :param db: The database session.
+    :type db: Session
+    :return: None
+    """
+    if qrcodes:
+        await db.execute(update(PhotoUrl), qrcodes)
+        await db.commit()
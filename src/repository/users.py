@@ -1,13 +1,15 @@
-import redis
+import uuid
+
 from fastapi import Depends
-from libgravatar import Gravatar
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.conf.config import settings
 from src.database.db import get_db
-from src.entity.models import User
+from src.entity.models import User, OutboxEmail
 from src.schemas.user import UserSchema
+from src.services.cache import cache_service
+from src.services.principals import principal_cache
 
 
 async def get_user_by_email(email: str, db: AsyncSession = Depends(get_db)):
@@ -40,23 +42,21 @@ async def get_user_by_username(username: str, db: AsyncSession = Depends(get_db)
     return user
 
 
-async def create_user(body: UserSchema, db: AsyncSession = Depends(get_db)):
+async def create_user(body: UserSchema, db: AsyncSession = Depends(get_db), email: OutboxEmail | None = None):
     """
     The create_user function creates a new user in the database.
+    The user gets the default avatar, its Gravatar is resolved later by a job, see set_resolved_avatar.
+    An outbox email, e.g. the verification email, is written in the same transaction.
 
     :param body: UserSchema: Validate the data that is passed into the function
     :param db: AsyncSession: Get the database session
+    :param email: OutboxEmail | None: An email to send to the new user
     :return: The newly created user object
     """
-    avatar = 'https://asset.cloudinary.com/dkprmxdfc/cbcb3e506c226483c2be7155f6e3ff7c'
-    try:
-        g = Gravatar(body.email)
-        avatar = g.get_image()
-    except Exception as err:
-        print(err)
-
-    new_user = User(**body.model_dump(), avatar=avatar, user_type_id=1)
+    new_user = User(**body.model_dump(), avatar=settings.AVATAR_DEFAULT, user_type_id=1)
     db.add(new_user)
+    if email is not None:
+        db.add(email)
     await db.commit()
     await db.refresh(new_user)
     return new_user
@@ -102,14 +102,35 @@ async def update_avatar_url(email: str, url: str | None, db: AsyncSession) -> Us
     user.avatar = url
     await db.commit()
     await db.refresh(user)
+    await cache_service.invalidate("profile", user.username)
+    await principal_cache.invalidate(user.email)
     return user
 
 
+async def set_resolved_avatar(user_id: uuid.UUID, url: str, db: AsyncSession):
+    """
+    The set_resolved_avatar function replaces the default avatar of a user with its resolved Gravatar.
+    An avatar the user uploaded meanwhile is kept.
+
+    :param user_id: uuid.UUID: The id of the user
+    :param url: str: The Gravatar url
+    :param db: AsyncSession: Pass in the database session
+    :return: None
+    """
+    stmt = (update(User).where(User.id == user_id, User.avatar == settings.AVATAR_DEFAULT).values(avatar=url)
+            .returning(User.username, User.email))
+    user = (await db.execute(stmt, execution_options={"synchronize_session": False})).first()
+    await db.commit()
+    if user:
+        await cache_service.invalidate("profile", user.username)
+        await principal_cache.invalidate(user.email)
+
+
 async def ban_user(username: str, db: AsyncSession):
     """
     The ban_user function takes a username and an asyncpg database connection as arguments.
     It then queries the database for the user with that username, and if it finds one, sets their is_banned flag to True.
-    The function also deletes any refresh tokens associated with that user from Redis.
+    The principal of the user is dropped from the principal cache of every process.
 
     :param username: str: Specify the username of the user to be banned
     :param db: AsyncSession: Pass in the database session
@@ -117,15 +138,11 @@ async def ban_user(username: str, db: AsyncSession):
     """
     user = await get_user_by_username(username, db)
     if user:
-        cache = redis.Redis(
-            host=settings.REDIS_HOST,
-            port=settings.REDIS_PORT,
-            db=0,
-            password=settings.REDIS_PASSWORD,
-        )
         user.is_banned = True
         user.refresh_token = None
-        cache.delete(str(user.email))
+        user.token_version += 1
         await db.commit()
         await db.refresh(user)
+        # after the commit, a request in between would cache the principal from before the ban again
+        await principal_cache.invalidate(user.email)
         return user
@@ -5,7 +5,6 @@ from fastapi import (
     Depends,
     status,
     Security,
-    BackgroundTasks,
     Request,
     Response,
 )
@@ -20,9 +19,12 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from src.database.db import get_db
 from src.entity.models import User
 from src.repository import users as repository_users
+from src.repository import outbox as repository_outbox
 from src.schemas.user import UserSchema, TokenSchema, UserResponse, RequestEmail
 from src.services.auth import auth_service
-from src.services.email import send_email
+from src.services.email import outbox_email, deliver_later
+from src.services.gravatar import gravatar_resolver
+from src.services.principals import principal_cache
 from src.conf import messages
 
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -35,7 +37,6 @@ get_access_token = HTTPBearer()
 )
 async def signup(
         body: UserSchema,
-        bt: BackgroundTasks,
         request: Request,
         db: AsyncSession = Depends(get_db),
 ):
@@ -44,9 +45,10 @@ async def signup(
     The signup function creates a new user in the database.
         It takes a UserSchema object as input, and returns the newly created user.
         If an account with that email already exists, it raises an HTTPException.
+        The verification email is written to the outbox together with the user and sent by a worker.
+        The user starts with the default avatar, a worker replaces it with the Gravatar of the email if there is one.
 
     :param body: UserSchema: Validate the request body and convert it to a user object
-    :param bt: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base url of the server
     :param db: AsyncSession: Get the database session
     :return: A new user object
@@ -56,9 +58,11 @@ async def signup(
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT, detail=messages.ACCOUNT_EXIST
         )
-    body.password = auth_service.get_password_hash(body.password)
-    new_user = await repository_users.create_user(body, db)
-    bt.add_task(send_email, new_user.email, new_user.username, str(request.base_url))
+    body.password = await auth_service.get_password_hash(body.password)
+    email = outbox_email(body.email, body.username, str(request.base_url))
+    new_user = await repository_users.create_user(body, db, email)
+    await deliver_later()
+    await gravatar_resolver.resolve_later(new_user.id, new_user.email)
     return new_user
 
 
@@ -74,6 +78,8 @@ async def login(
     :return: A jwt, which is a json object with the following keys:
     """
     user = await repository_users.get_user_by_email(body.username, db)
+    # the password is checked first, so an unknown email is rejected as slowly as a wrong password
+    password_valid = await auth_service.verify_password(body.password, user.password if user else None)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.AUTH_INVALID_EMAIL
@@ -88,13 +94,13 @@ async def login(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=messages.USER_BANNED,
         )
-    if not auth_service.verify_password(body.password, user.password):
+    if not password_valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.AUTH_INVALID_PASSWORD
         )
     # Generate JWT
-    access_token = await auth_service.create_access_token(data={"sub": user.email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
+    access_token = await auth_service.create_access_token(data={"sub": user.email, "ver": user.token_version})
+    refresh_token = await auth_service.create_refresh_token(data={"sub": user.email, "ver": user.token_version})
     await repository_users.update_token(user, refresh_token, db)
     return {
         "access_token": access_token,
@@ -128,8 +134,8 @@ async def refresh_token(
             status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.AUTH_INVALID_REFRESH_TOKEN
         )
 
-    access_token = await auth_service.create_access_token(data={"sub": email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": email})
+    access_token = await auth_service.create_access_token(data={"sub": email, "ver": user.token_version})
+    refresh_token = await auth_service.create_refresh_token(data={"sub": email, "ver": user.token_version})
     await repository_users.update_token(user, refresh_token, db)
     return {
         "access_token": access_token,
@@ -162,7 +168,6 @@ async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
 @router.post("/request_email")
 async def request_email(
         body: RequestEmail,
-        background_tasks: BackgroundTasks,
         request: Request,
         db: AsyncSession = Depends(get_db),
 ):
@@ -174,7 +179,6 @@ async def request_email(
     an email containing a link they can click on to confirm their account.
 
     :param body: RequestEmail: Validate the request body against
-    :param background_tasks: BackgroundTasks: Add a task to the background queue
     :param request: Request: Get the base url of our application
     :param db: AsyncSession: Get the database session
     :return: A message to the user
@@ -184,16 +188,14 @@ async def request_email(
     if user.confirmed:
         return {"message": "Your email is already confirmed"}
     if user:
-        background_tasks.add_task(
-            send_email, user.email, user.username, str(request.base_url)
-        )
+        await repository_outbox.add_email(outbox_email(user.email, user.username, str(request.base_url)), db)
+        await deliver_later()
     return {"message": "Check your email for confirmation."}
 
 
 @router.post("/reset_password")
 async def reset_password(
         body: RequestEmail,
-        bt: BackgroundTasks,
         request: Request,
         db: AsyncSession = Depends(get_db),
 ):
@@ -201,7 +203,6 @@ async def reset_password(
     The reset_password function is used to reset a user's password.
 
     :param body: RequestEmail: Get the email from the request body
-    :param bt: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base url of the application
     :param db: AsyncSession: Get the database session
     :return: A message
@@ -212,13 +213,9 @@ async def reset_password(
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT, detail=messages.AUTH_ALREADY_EXISTS
         )
-    bt.add_task(
-        send_email,
-        user.email,
-        user.username,
-        str(request.base_url),
-        type="reset_password",
-    )
+    await repository_outbox.add_email(outbox_email(user.email, user.username, str(request.base_url),
+                                                   type="reset_password"), db)
+    await deliver_later()
     return {"message": messages.AUTH_CHECK_EMAIL}
 
 
@@ -248,8 +245,12 @@ async def confirmed_reset_password(
         )
     email = await auth_service.get_email_from_token(token)
     user = await repository_users.get_user_by_email(email, db)
-    user.password = auth_service.get_password_hash(password1)
+    user.password = await auth_service.get_password_hash(password1)
+    # tokens issued with the old password are not accepted any more
+    user.token_version += 1
+    user.refresh_token = None
     await repository_users.confirmed_email(email, db)
+    await principal_cache.invalidate(email)
     return {"message": "Your password changed"}
 
 
@@ -259,7 +260,7 @@ async def logout(
         db: AsyncSession = Depends(get_db),
 ):
     """
-    The logout function is used to invalidate the access token and refresh token by adding them to the blacklist.
+    The logout function is used to revoke the access token and refresh token until they expire.
 
     :param credentials: HTTPBearer: Get the access token from the request header
     :param db: AsyncSession: Get the database session
@@ -269,16 +270,9 @@ async def logout(
     email = await auth_service.get_email_from_token(access_token)
     user_hash = str(email)
 
-    # Add the access token to the blacklist
-    auth_service.cache.set(user_hash + "_blacklist_access", access_token)
-    auth_service.cache.expire(user_hash + "_blacklist_access", 300)
-
-    # Optionally, add the refresh token to the blacklist if it's present
+    # Revoke the access token and, if it's present, the refresh token
     user = await repository_users.get_user_by_email(email, db)
-    if user.refresh_token:
-        auth_service.cache.set(user.email + "_blacklist_refresh", user.refresh_token)
-        auth_service.cache.expire(user.refresh_token + "_blacklist_refresh", 604800)
+    await auth_service.revoke_tokens(user_hash, access_token, user.refresh_token)
 
-    user.refresh_token = None
-    user.access_token = None
+    await repository_users.update_token(user, None, db)
     return {"message": messages.AUTH_LOGOUT}
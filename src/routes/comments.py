@@ -2,7 +2,8 @@ from fastapi import APIRouter, HTTPException, Depends, status, Query, Path
 from sqlalchemy.ext.asyncio import AsyncSession
 from src.database.db import get_db
 from src.entity.models import User
-from src.schemas.comment import CreateCommentModel, CommentResponse, CommentUpdateModel, CommentDeleteModel
+from src.schemas.comment import CreateCommentModel, CommentResponse, CommentUpdateModel, CommentDeleteModel, \
+    CommentBulkDeleteModel, CommentBulkDeleteResponse
 from src.repository import comments
 from src.services.auth import auth_service
 
@@ -61,3 +62,20 @@ async def delete_comment(
     :return: A dict with the following keys:
     """
     return await comments.delete_comment(body, current_user, db)
+
+
+@router.delete("/", response_model=CommentBulkDeleteResponse, status_code=status.HTTP_200_OK)
+async def delete_comments(
+        body: CommentBulkDeleteModel,
+        current_user: User = Depends(auth_service.get_current_user),
+        db: AsyncSession = Depends(get_db)):
+    """
+    The delete_comments function deletes many comments at once with one statement.
+        Only moderators and admins may delete comments. Ids of comments that do not exist are ignored.
+
+    :param body: CommentBulkDeleteModel: Get the ids of the comments from the request body
+    :param current_user: User: Get the current user
+    :param db: AsyncSession: Get the database session
+    :return: The ids of the deleted comments
+    """
+    return {"deleted": await comments.delete_comments(body.comment_ids, current_user, db)}
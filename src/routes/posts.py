@@ -1,43 +1,56 @@
+import asyncio
+import hashlib
 import uuid
+import zipfile
+import zlib
 from typing import List
 
-from fastapi import APIRouter, HTTPException, Depends, status, Path, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, Depends, status, Path, Query, Request, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
 from fastapi.encoders import jsonable_encoder
 from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
-import cloudinary
-import cloudinary.uploader
-
 from src.conf import messages
-from src.conf.cloudinary import configure_cloudinary
-from src.database.db import get_db
+from src.conf.config import settings
+from src.database.db import get_db, get_read_db
 from src.entity.models import User
-from src.schemas.post import PostModel, PostResponse, PostDeletedResponse
+from src.schemas.post import PostModel, PostResponse, PostDeletedResponse, IngestManifest, IngestResult
+from src.schemas.comment import PostCommentResponse
+from src.schemas.pagination import CursorPage
 from src.repository import posts as repository_posts
+from src.repository import comments as repository_comments
 from src.schemas.tag import TagUpdate
 from src.services.auth import auth_service
+from src.services.cache import cache_service
+from src.services.media import media_storage
+from src.services.jobs import job_queue
+from src.services.uploads import (SNIFF_SIZE, check_mime, check_size, check_upload_file, file_sha256,
+                                  stream_upload)
 
 router = APIRouter(prefix='/posts', tags=["posts"])
 
 
-@router.get("/", response_model=List[PostResponse])
-async def get_posts(current_user: User = Depends(auth_service.get_current_user),
-                    db: AsyncSession = Depends(get_db)):
+@router.get("/", response_model=CursorPage[PostResponse])
+async def get_posts(limit: int = Query(20, ge=1, le=100), cursor: str | None = Query(None),
+                    current_user: User = Depends(auth_service.get_current_user),
+                    db: AsyncSession = Depends(get_read_db)):
     """
-    The get_posts function returns a list of posts.
+    The get_posts function returns a page of the newest posts.
+    Pass next_cursor of the response as cursor to get the following page.
 
+    :param limit: int: The page size
+    :param cursor: str | None: The cursor of the previous page
     :param current_user: User: Get the current user
     :param db: AsyncSession: Get the database session
-    :return: All posts in the database
+    :return: A page of posts and the cursor of the next page
     """
-    post = await repository_posts.get_posts(db)
-    return post
+    posts, next_cursor = await repository_posts.get_posts(limit, cursor, db)
+    return {"items": posts, "next_cursor": next_cursor}
 
 
 @router.get("/{post_id}", response_model=PostResponse)
 async def get_post(post_id: int = Path(ge=1),
-                   current_user: User = Depends(auth_service.get_current_user),
-                   db: AsyncSession = Depends(get_db)):
+                   current_user: User = Depends(auth_service.get_current_user)):
     """
     The get_post function is used to retrieve a single post from the database.
     It takes an integer as its only argument, which represents the ID of the post
@@ -45,15 +58,41 @@ async def get_post(post_id: int = Path(ge=1),
 
     :param post_id: int: Specify the type of the parameter, and it is also used to specify that
     :param current_user: User: Get the current user from the auth_service
-    :param db: AsyncSession: Get a database connection
     :return: A post object
     """
-    post = await repository_posts.get_post(post_id, db)
+    async def load(session: AsyncSession):
+        post = await repository_posts.get_post(post_id, session)
+        return PostResponse.model_validate(post).model_dump(mode="json") if post else None
+
+    post = await cache_service.get_or_load("post", post_id, load)
     if post is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post is not found")
     return post
 
 
+@router.get("/{post_id}/comments", response_model=CursorPage[PostCommentResponse])
+async def get_post_comments(post_id: int = Path(ge=1), limit: int = Query(20, ge=1, le=100),
+                            cursor: str | None = Query(None),
+                            current_user: User = Depends(auth_service.get_current_user),
+                            db: AsyncSession = Depends(get_read_db)):
+    """
+    The get_post_comments function returns a page of the comments of a post, the oldest first.
+    Pass next_cursor of the response as cursor to get the following page.
+
+    :param post_id: int: The id of the post
+    :param limit: int: The page size
+    :param cursor: str | None: The cursor of the previous page
+    :param current_user: User: Get the current user
+    :param db: AsyncSession: Get the database session
+    :return: A page of comments and the cursor of the next page
+    """
+    result, next_cursor = await repository_comments.get_post_comments(post_id, limit, cursor, db)
+    # only an empty page needs to tell a post without comments from a missing post
+    if not result and await repository_posts.get_post_owner(post_id, db) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post is not found")
+    return {"items": result, "next_cursor": next_cursor}
+
+
 def checker(data: str = Form(...)):
     """
     The checker function is a custom validator that will be used to validate the
@@ -84,8 +123,9 @@ async def create_post(body: PostModel = Depends(checker), file: UploadFile = Fil
     """
     The create_post function creates a new post in the database.
         It takes in a PostModel object, an UploadFile object, and the current_user as arguments.
-        The function then uploads the file to cloudinary using its unique path (which is generated by uuid4).
+        The function then uploads the file to the media storage using its unique path (which is generated by uuid4).
         Then it generates an image url for that file and saves it to our database.
+        A user cannot post the same image twice, a duplicate is rejected before the upload.
 
     :param body: PostModel: Validate the request body
     :param file: UploadFile: Get the file from the request and
@@ -93,13 +133,191 @@ async def create_post(body: PostModel = Depends(checker), file: UploadFile = Fil
     :param db: AsyncSession: Pass the database session to the repository layer
     :return: The created post with the new id
     """
-    configure_cloudinary()
+    await check_upload_file(file)
+    image_hash = await run_in_threadpool(file_sha256, file.file)
+    if await repository_posts.get_post_id_by_image_hash(image_hash, current_user, db):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=messages.UPLOAD_DUPLICATE)
+    # give the connection back to the pool during the upload
+    await db.rollback()
     unique_path = uuid.uuid4()
-    r = cloudinary.uploader.upload(file.file, public_id=f'Photoshare_app/{current_user.username}/{unique_path}')
-    image_url = cloudinary.CloudinaryImage(f'Photoshare_app/{current_user.username}/{unique_path}') \
-        .build_url(width=250, height=250, crop='fill', version=r.get('version'))
     image_id = f'Photoshare_app/{current_user.username}/{unique_path}'
-    return await repository_posts.create_post(body, image_url, image_id, current_user, db)
+    r = await media_storage.put(file.file, image_id)
+    image_url = await media_storage.transform(image_id, width=250, height=250, crop='fill', version=r.get('version'))
+    try:
+        post = await repository_posts.create_post(body, image_url, image_id, current_user, db, image_hash=image_hash)
+    except HTTPException:
+        await job_queue.enqueue_or_store("delete_media", [image_id])
+        raise
+    await job_queue.enqueue_or_store("render_renditions", post.id, image_id, r.get('width'), r.get('version'))
+    return post
+
+
+@router.post("/create/stream", response_model=PostResponse)
+async def create_post_stream(request: Request, name: str = Query(max_length=200),
+                             content: str = Query(max_length=5000), tags: List[str] = Query([], max_length=5),
+                             sha256: str | None = Query(None, pattern="^[0-9a-f]{64}$"),
+                             current_user: User = Depends(auth_service.get_current_user),
+                             db: AsyncSession = Depends(get_db)):
+    """
+    The create_post_stream function creates a new post from an image sent as the raw request body.
+        The image is streamed to the media storage while it is received, its size and type are checked
+        from the Content-Length header and the first bytes, and its sha256 is computed on the way.
+        A user cannot post the same image twice. With the sha256 of the image in the query a duplicate
+        is rejected before the body is read, a client that sends Expect: 100-continue does not transfer it at all.
+
+    :param request: Request: The request with the image as its body
+    :param name: str: The name of the post
+    :param content: str: The content of the post
+    :param tags: List[str]: The tags of the post
+    :param sha256: str | None: The hex sha256 of the image
+    :param current_user: User: Get the user who is currently logged in
+    :param db: AsyncSession: Pass the database session to the repository layer
+    :return: The created post with the new id
+    """
+    body = PostModel(name=name, content=content, tags=tags)
+    if sha256 is not None and await repository_posts.get_post_id_by_image_hash(sha256, current_user, db):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=messages.UPLOAD_DUPLICATE)
+    # give the connection back to the pool while the body is received
+    await db.rollback()
+    image_id = f'Photoshare_app/{current_user.username}/{uuid.uuid4()}'
+    r = await stream_upload(request, image_id)
+    if sha256 is not None and r["sha256"] != sha256:
+        await job_queue.enqueue_or_store("delete_media", [image_id])
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=messages.UPLOAD_HASH_MISMATCH)
+    if sha256 is None and await repository_posts.get_post_id_by_image_hash(r["sha256"], current_user, db):
+        await job_queue.enqueue_or_store("delete_media", [image_id])
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=messages.UPLOAD_DUPLICATE)
+    image_url = await media_storage.transform(image_id, width=250, height=250, crop='fill', version=r.get('version'))
+    try:
+        post = await repository_posts.create_post(body, image_url, image_id, current_user, db, image_hash=r["sha256"])
+    except HTTPException:
+        # the name is taken or a concurrent request posted the same image first
+        await job_queue.enqueue_or_store("delete_media", [image_id])
+        raise
+    await job_queue.enqueue_or_store("render_renditions", post.id, image_id, r.get('width'), r.get('version'))
+    return post
+
+
+def manifest_checker(manifest: str = Form(...)):
+    """
+    The manifest_checker function validates the JSON manifest of a batch ingest sent as a form field.
+
+    :param manifest: str: The manifest as JSON, an object with a list of items
+    :return: The validated manifest
+    """
+    try:
+        return IngestManifest.model_validate_json(manifest)
+    except ValidationError as e:
+        raise HTTPException(
+            detail=jsonable_encoder(e.errors()),
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+
+
+@router.post("/ingest", response_model=List[IngestResult])
+async def ingest_posts(manifest: IngestManifest = Depends(manifest_checker), files: List[UploadFile] = File(default=[]),
+                       archive: UploadFile | None = File(default=None),
+                       current_user: User = Depends(auth_service.get_current_user),
+                       db: AsyncSession = Depends(get_db)):
+    """
+    The ingest_posts function creates up to INGEST_BATCH_SIZE posts in one request.
+        The manifest lists the name, content, tags and file of every post. The files are sent as
+        multipart files, matched by their filename, or packed in a zip archive, matched by their path in it.
+        The images are hashed and uploaded at most MEDIA_WORKERS at a time, then all posts, tags and links
+        are inserted with multi-row inserts in a single transaction. If the insert fails, the uploaded images
+        are deleted by a worker.
+
+        Every item gets its own result. An item whose name the user already used for a post is not uploaded again
+        and reported as exists, so a batch that failed halfway is resumed by sending it again.
+        An item whose image the user has already posted, or that repeats an image of the batch, fails.
+
+    :param manifest: IngestManifest: The posts to create
+    :param files: List[UploadFile]: The images of the posts
+    :param archive: UploadFile | None: A zip archive with the images of the posts
+    :param current_user: User: Get the user who is currently logged in
+    :param db: AsyncSession: Pass the database session to the repository layer
+    :return: The result of every item in the order of the manifest
+    """
+    sources = {file.filename: file for file in files}
+    members = set()
+    if archive is not None:
+        try:
+            archive = await run_in_threadpool(zipfile.ZipFile, archive.file)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=messages.INGEST_BAD_ARCHIVE)
+        members = set(archive.namelist())
+
+    items = manifest.items
+    results = {}
+    existing = await repository_posts.get_post_ids_by_name([item.name for item in items], current_user, db)
+    pending, names = [], set()
+    for index, item in enumerate(items):
+        if item.name in existing:
+            results[index] = IngestResult(name=item.name, status="exists", post_id=existing[item.name])
+        elif item.name in names:
+            results[index] = IngestResult(name=item.name, status="failed", detail=messages.INGEST_DUPLICATE_NAME)
+        elif item.file not in sources and item.file not in members:
+            results[index] = IngestResult(name=item.name, status="failed", detail=messages.INGEST_FILE_MISSING)
+        else:
+            names.add(item.name)
+            pending.append(index)
+
+    uploads = asyncio.Semaphore(settings.MEDIA_WORKERS)
+
+    async def upload(item):
+        # the id depends on the owner and the name only, a resumed batch overwrites an upload it did not save
+        image_id = f"Photoshare_app/{current_user.username}/{uuid.uuid5(uuid.NAMESPACE_URL, f'{current_user.id}/{item.name}')}"
+        async with uploads:
+            source = sources.get(item.file)
+            if source is not None:
+                source = (await check_upload_file(source)).file
+                image_hash = await run_in_threadpool(file_sha256, source)
+            else:
+                check_size(archive.getinfo(item.file).file_size)
+                source = await run_in_threadpool(archive.read, item.file)
+                check_mime(source[:SNIFF_SIZE])
+                image_hash = await run_in_threadpool(lambda: hashlib.sha256(source).hexdigest())
+            r = await media_storage.put(source, image_id, overwrite=True)
+            image_url = await media_storage.transform(image_id, width=250, height=250, crop='fill',
+                                                      version=r.get('version'))
+        return {"name": item.name, "content": item.content, "tags": item.tags, "image_id": image_id,
+                "image_url": image_url, "image_hash": image_hash, "width": r.get('width'),
+                "version": r.get('version')}
+
+    uploaded = await asyncio.gather(*[upload(items[index]) for index in pending], return_exceptions=True)
+    posted = await repository_posts.get_posted_image_hashes([row["image_hash"] for row in uploaded
+                                                             if not isinstance(row, Exception)], current_user, db)
+    rows, duplicates = [], []
+    for index, row in zip(pending, uploaded):
+        if isinstance(row, HTTPException):
+            results[index] = IngestResult(name=items[index].name, status="failed", detail=row.detail)
+        elif isinstance(row, Exception):
+            # the error may tell about the storage or the database, the client only learns what failed
+            print(f"Ingest of {items[index].name} failed: {row!r}")
+            detail = (messages.INGEST_BAD_MEMBER if isinstance(row, (zipfile.BadZipFile, zlib.error))
+                      else messages.INGEST_UPLOAD_FAILED)
+            results[index] = IngestResult(name=items[index].name, status="failed", detail=detail)
+        elif row["image_hash"] in posted:
+            results[index] = IngestResult(name=row["name"], status="failed", detail=messages.UPLOAD_DUPLICATE)
+            duplicates.append(row["image_id"])
+        else:
+            posted.add(row["image_hash"])
+            rows.append((index, row))
+    if duplicates:
+        await job_queue.enqueue_or_store("delete_media", duplicates)
+    try:
+        post_ids = await repository_posts.create_posts([row for _, row in rows], current_user, db)
+    except Exception:
+        # nothing refers to the uploaded images, delete them instead of leaving them in the storage
+        await db.rollback()
+        if rows:
+            await job_queue.enqueue_or_store("delete_media", [row["image_id"] for _, row in rows])
+        raise
+    for index, row in rows:
+        results[index] = IngestResult(name=row["name"], status="created", post_id=post_ids[row["name"]])
+    await job_queue.enqueue_many_or_store("render_renditions", [(post_ids[row["name"]], row["image_id"],
+                                                                 row["width"], row["version"]) for _, row in rows])
+    return [results[index] for index in range(len(items))]
 
 
 @router.post("/add_tags", response_model=PostResponse)
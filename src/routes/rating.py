@@ -4,13 +4,15 @@ from fastapi import APIRouter, Depends, HTTPException, Path
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
+from src.database.db import get_db, get_read_db
 from src.entity.models import User, Post, Rating
-from src.repository.posts import get_post
-from src.repository.rating import create_rating, get_rating, refresh_rating, delete_rating, get_postsratings
+from src.repository.posts import get_post, get_post_owner
+from src.repository.rating import create_rating, get_rating, delete_rating, get_postsratings, \
+    get_post_with_ratings, repair_rating_counters
 from src.repository.users import get_user_by_username
 from src.schemas.post import PostResponse
-from src.schemas.rating import RateModel, RateResponse, FindRateModel, AdminRateResponse, AdminPostResponse
+from src.schemas.rating import RateModel, RateResponse, FindRateModel, AdminRateResponse, AdminPostResponse, \
+    RepairRatingResponse
 from src.services.auth import auth_service
 
 router = APIRouter(prefix='/rating', tags=["rating"])
@@ -30,7 +32,7 @@ async def rate_post(body: RateModel, current_user: User = Depends(auth_service.g
     :param db: AsyncSession: Get a database session
     :return: The rating of the post after adding a new rate
     """
-    post = await get_post(body.post_id, db)
+    post = await get_post_owner(body.post_id, db)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     if post.user_id == current_user.id:
@@ -39,7 +41,7 @@ async def rate_post(body: RateModel, current_user: User = Depends(auth_service.g
     if existed_rating:
         raise HTTPException(status_code=404, detail="Rate already exist")
     await create_rating(body, post.id, current_user, db)
-    return await refresh_rating(post, db)
+    return await get_post(body.post_id, db)
 
 
 @router.delete("/", response_model=PostResponse)
@@ -56,7 +58,7 @@ async def delete_rate(body: FindRateModel, current_user: User = Depends(auth_ser
     """
     if current_user.user_type_id == 1:
         raise HTTPException(status_code=403, detail="Only admin/moder can remove rate from post")
-    post = await get_post(body.post_id, db)
+    post = await get_post_owner(body.post_id, db)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     user = await get_user_by_username(body.user_name, db)
@@ -65,14 +67,29 @@ async def delete_rate(body: FindRateModel, current_user: User = Depends(auth_ser
     rating = await get_rating(body, user, db)
     if not rating:
         raise HTTPException(status_code=404, detail="Rate not found")
-    await delete_rating(post, rating, db)
-    await refresh_rating(post, db)
-    return post
+    await delete_rating(rating, db)
+    return await get_post(body.post_id, db)
+
+
+@router.post("/repair", response_model=RepairRatingResponse)
+async def repair_ratings(current_user: User = Depends(auth_service.get_current_user),
+                         db: AsyncSession = Depends(get_db)):
+    """
+    The repair_ratings function recomputes the rating counters of all posts from the stored ratings
+    and fixes the posts whose counters have drifted. Only an admin can run it.
+
+    :param current_user: User: Get the current user
+    :param db: AsyncSession: Get the database session
+    :return: The ids of the repaired posts
+    """
+    if current_user.user_type_id != 3:
+        raise HTTPException(status_code=403, detail="Only admin can repair ratings")
+    return {"repaired": await repair_rating_counters(db)}
 
 
 @router.get("/{post_id}", response_model=AdminPostResponse)
 async def get_ratings(post_id: int = Path(ge=1), current_user: User = Depends(auth_service.get_current_user),
-                      db: AsyncSession = Depends(get_db)):
+                      db: AsyncSession = Depends(get_read_db)):
     """
     The get_ratings function returns the ratings for a given post.
 
@@ -81,5 +98,5 @@ async def get_ratings(post_id: int = Path(ge=1), current_user: User = Depends(au
     :param db: AsyncSession: Get the database session
     :return: A post object, which contains the ratings
     """
-    post = await get_post(post_id, db)
+    post = await get_post_with_ratings(post_id, db)
     return post
@@ -1,7 +1,8 @@
 import uuid
 from typing import List
 
-from fastapi import APIRouter, HTTPException, Depends, status, Path, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, Depends, status, Path, Query, Request, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
 from fastapi.encoders import jsonable_encoder
 from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -10,21 +11,63 @@ import cloudinary.uploader
 
 from src.conf import messages
 from src.conf.cloudinary import configure_cloudinary
-from src.database.db import get_db
+from src.database.db import get_read_db, sessionmanager, READ_PRIMARY_COOKIE
 from src.entity.models import User
 from src.schemas.post import PostModel, PostResponse, PostDeletedResponse
+from src.schemas.pagination import CursorPage
 from src.repository import search as repository_search
 from src.schemas.tag import TagUpdate
 from src.services.auth import auth_service
 
 router = APIRouter(prefix='/search', tags=["search"])
 
+NDJSON = "application/x-ndjson"
+NDJSON_RESPONSE = {200: {"content": {NDJSON: {}}}}
 
-@router.get("/by_tag/{tag}", response_model=List[PostResponse])
-async def get_post_by_tag(filter_by_date: bool = True,
+
+def wants_ndjson(request: Request) -> bool:
+    """
+    The wants_ndjson function checks whether the client asked for a streamed NDJSON response
+    instead of a page.
+
+    :param request: Request: The incoming request
+    :return: True if the Accept header contains application/x-ndjson
+    """
+    return NDJSON in request.headers.get("accept", "")
+
+
+def ndjson_response(request: Request, post, filter_by_date: bool, filter_by_rating: bool,
+                    cursor: str | None) -> StreamingResponse:
+    """
+    The ndjson_response function streams every post matched by the statement as one JSON document per line.
+    The stream uses its own read session because the request session is closed before the body is sent.
+    Every post is detached from the session once it has been written, so memory stays flat.
+
+    :param request: Request: The incoming request, it decides if the stream reads from the primary
+    :param post: Select: The search statement
+    :param filter_by_date: bool: Order the posts by date
+    :param filter_by_rating: bool: Order the posts by rating
+    :param cursor: str | None: The cursor to start after
+    :return: A streaming response
+    """
+    async def lines():
+        async with sessionmanager.read_session(READ_PRIMARY_COOKIE in request.cookies) as db:
+            async for item in repository_search.stream_posts(post, filter_by_date, filter_by_rating, cursor, db):
+                yield PostResponse.model_validate(item).model_dump_json() + "\n"
+                db.expunge(item)
+
+    return StreamingResponse(lines(), media_type=NDJSON)
+
+
+@router.get("/by_tag/{tag}", response_model=CursorPage[PostResponse], responses=NDJSON_RESPONSE)
+async def get_post_by_tag(request: Request,
+                          filter_by_date: bool = True,
                           filter_by_rating: bool = False,
-                          tag: str = Path(), current_user: User = Depends(auth_service.get_current_user),
-                          db: AsyncSession = Depends(get_db)):
+                          tag: str = Path(),
+                          limit: int = Query(20, ge=1, le=100),
+                          cursor: str | None = Query(None),
+                          current_user: User = Depends(auth_service.get_current_user),
+                          db: AsyncSession = Depends(get_read_db)):
     """
     The get_post_by_tag function is used to retrieve a post by tag.
         The function takes in the following parameters:
@@ -32,23 +75,32 @@ async def get_post_by_tag(filter_by_date: bool = True,
             - filter_by_rating (bool): If true, will return posts sorted by rating. Default value is False.
             - tag (str): The name of the tag that you want to search for a post with.
 
+    :param request: Request: Check the Accept header for application/x-ndjson streaming
     :param filter_by_date: bool: Filter the posts by date
     :param filter_by_rating: bool: Filter the posts by rating
     :param tag: str: Specify the tag that we want to search for
+    :param limit: int: The page size
+    :param cursor: str | None: The cursor of the previous page
     :param current_user: User: Get the current user
     :param db: AsyncSession: Get the database session
     :return: A list of posts that match the tag
     """
-    post = await repository_search.get_post_by_tag(filter_by_date, filter_by_rating, tag, db)
-    return post
+    if wants_ndjson(request):
+        return ndjson_response(request, repository_search.posts_by_tag(tag), filter_by_date, filter_by_rating, cursor)
+    posts, next_cursor = await repository_search.get_post_by_tag(filter_by_date, filter_by_rating, tag, limit,
+                                                                 cursor, db)
+    return {"items": posts, "next_cursor": next_cursor}
 
 
-@router.get("/by_keyword/{keyword}", response_model=List[PostResponse])
-async def get_post_by_keyword(filter_by_date: bool = True,
+@router.get("/by_keyword/{keyword}", response_model=CursorPage[PostResponse], responses=NDJSON_RESPONSE)
+async def get_post_by_keyword(request: Request,
+                              filter_by_date: bool = True,
                               filter_by_rating: bool = False,
                               keyword: str = Path(),
-                              current_user: User = Depends(auth_service.get_current_user),
-                              db: AsyncSession = Depends(get_db)):
+                              limit: int = Query(20, ge=1, le=100),
+                              cursor: str | None = Query(None),
+                                  current_user: User = Depends(auth_service.get_current_user),
+                              db: AsyncSession = Depends(get_read_db)):
     """
     The get_post_by_keyword function is used to search for a post by keyword.
         The function takes in the following parameters:
@@ -56,23 +108,32 @@ async def get_post_by_keyword(filter_by_date: bool = True,
             - filter_by_rating (bool): If true, will return posts with a rating of at least 3 stars. Default value is False.
             - keyword (str): The string to be searched for in all post titles and descriptions.
 
+    :param request: Request: Check the Accept header for application/x-ndjson streaming
     :param filter_by_date: bool: Determine whether the search should be filtered by date or not
     :param filter_by_rating: bool: Filter the posts by rating
     :param keyword: str: Search for a post by keyword
+    :param limit: int: The page size
+    :param cursor: str | None: The cursor of the previous page
     :param current_user: User: Get the current user from the database
     :param db: AsyncSession: Get a database session
     :return: The post that matches the keyword
     """
-    post = await repository_search.get_post_by_keyword(filter_by_date, filter_by_rating, keyword, db)
-    return post
+    if wants_ndjson(request):
+        return ndjson_response(request, repository_search.posts_by_keyword(keyword), filter_by_date, filter_by_rating, cursor)
+    posts, next_cursor = await repository_search.get_post_by_keyword(filter_by_date, filter_by_rating, keyword, limit,
+                                                                     cursor, db)
+    return {"items": posts, "next_cursor": next_cursor}
 
 
-@router.get("/by_user/{username}", response_model=List[PostResponse])
-async def get_post_by_keyword(filter_by_date: bool = True,
+@router.get("/by_user/{username}", response_model=CursorPage[PostResponse], responses=NDJSON_RESPONSE)
+async def get_post_by_keyword(request: Request,
+                              filter_by_date: bool = True,
                               filter_by_rating: bool = False,
                               username: str = Path(),
-                              current_user: User = Depends(auth_service.get_current_user),
-                              db: AsyncSession = Depends(get_db)):
+                              limit: int = Query(20, ge=1, le=100),
+                              cursor: str | None = Query(None),
+                                  current_user: User = Depends(auth_service.get_current_user),
+                              db: AsyncSession = Depends(get_read_db)):
     """
     The get_post_by_keyword function is used to get a post by keyword.
         The function takes in the following parameters:
@@ -80,15 +141,53 @@ async def get_post_by_keyword(filter_by_date: bool = True,
             - filter_by_rating (bool): A boolean value that determines whether or not to sort posts by rating.
             - username (str): The username of the user whose post you want returned.
 
+    :param request: Request: Check the Accept header for application/x-ndjson streaming
     :param filter_by_date: bool: Filter the posts by date
     :param filter_by_rating: bool: Filter the posts by rating
     :param username: str: Get the username of the user that is being searched for
+    :param limit: int: The page size
+    :param cursor: str | None: The cursor of the previous page
     :param current_user: User: Get the user that is currently logged in
     :param db: AsyncSession: Get the database session
     :return: A list of posts that contain the keyword in their title or description
     """
-    if current_user.user_type == 1:
+    if current_user.user_type_id == 1:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail=messages.NO_PERMISSIONS)
-    post = await repository_search.get_post_by_user(filter_by_date, filter_by_rating, username, db)
-    return post
+    if wants_ndjson(request):
+        return ndjson_response(request, repository_search.posts_by_user(username), filter_by_date, filter_by_rating, cursor)
+    posts, next_cursor = await repository_search.get_post_by_user(filter_by_date, filter_by_rating, username, limit,
+                                                                  cursor, db)
+    return {"items": posts, "next_cursor": next_cursor}
+
+
+@router.get("/fulltext", response_model=CursorPage[PostResponse])
+async def fulltext_search(q: str = Query(min_length=1, max_length=200),
+                          tags: List[str] | None = Query(None, max_length=5),
+                          filter_by_date: bool = False,
+                          filter_by_rating: bool = False,
+                          limit: int = Query(20, ge=1, le=100),
+                          cursor: str | None = Query(None),
+                          current_user: User = Depends(auth_service.get_current_user),
+                          db: AsyncSession = Depends(get_read_db)):
+    """
+    The fulltext_search function searches posts by the words of their name and content.
+        The function takes in the following parameters:
+            - q (str): The search text, every word is matched as a prefix. Names with typos are found by similarity.
+            - tags (List[str]): Only return posts that have all of these tags.
+            - filter_by_date (bool): If true, will return posts sorted by date instead of relevance.
+            - filter_by_rating (bool): If true, will return posts sorted by rating instead of relevance.
+
+    :param q: str: The search text
+    :param tags: List[str] | None: Filter the posts by tags
+    :param filter_by_date: bool: Order the posts by date
+    :param filter_by_rating: bool: Order the posts by rating
+    :param limit: int: The page size
+    :param cursor: str | None: The cursor of the previous page
+    :param current_user: User: Get the current user
+    :param db: AsyncSession: Get the database session
+    :return: A page of posts ordered by relevance, date or rating
+    """
+    posts, next_cursor = await repository_search.fulltext_search(q, tags, filter_by_date, filter_by_rating, limit,
+                                                                 cursor, db)
+    return {"items": posts, "next_cursor": next_cursor}
@@ -1,11 +1,13 @@
 from typing import List
 from fastapi import APIRouter, HTTPException, Depends, status, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from src.database.db import get_db
+from src.database.db import get_db, get_read_db
 from src.entity.models import User
 from src.repository import tags as repository_tags
 from src.schemas.tag import TagResponse, TagModel, TagUpdate
+from src.schemas.pagination import CursorPage
 from src.services.auth import auth_service
+from src.services.cache import cache_service
 
 router = APIRouter(prefix="/tags", tags=["tags"])
 
@@ -25,37 +27,38 @@ async def create_tag(
     return await repository_tags.create_tag(body, db)
 
 
-@router.get("/all", response_model=list[TagResponse])
-async def get_all_tags(limit: int = Query(10, ge=10, le=500), offset: int = Query(0, ge=0),
-                       db: AsyncSession = Depends(get_db)):
+@router.get("/all", response_model=CursorPage[TagResponse])
+async def get_all_tags(limit: int = Query(10, ge=10, le=500), cursor: str | None = Query(None),
+                       db: AsyncSession = Depends(get_read_db)):
     """
-    The get_all_tags function returns a list of all tags in the database.
+    The get_all_tags function returns a page of tags in the database.
 
     :param limit: int: Limit the number of tags returned
     :param ge: Set a minimum value for the limit parameter
     :param le: Limit the number of tags returned
-    :param offset: int: Offset the query by a certain amount
-    :param ge: Specify a minimum value for the limit parameter
+    :param cursor: str | None: The cursor of the previous page
     :param db: AsyncSession: Get the database session
-    :return: A list of tags
+    :return: A page of tags and the cursor of the next page
     """
-    tags = await repository_tags.get_all_tags(limit, offset, db)
-    return tags
+    tags, next_cursor = await repository_tags.get_all_tags(limit, cursor, db)
+    return {"items": tags, "next_cursor": next_cursor}
 
 
 @router.get("/{name}", response_model=TagResponse)
-async def get_or_create_tag_by_name(name: str, db: AsyncSession = Depends(get_db)):
+async def get_or_create_tag_by_name(name: str):
     """
     The get_or_create_tag_by_name function is a helper function that will either return an existing tag
         or create a new one if it doesn't exist. This is useful for when you want to add tags to an article, but
         don't want to have duplicate tags in the database.
 
     :param name: str: Specify the name of the tag to be created
-    :param db: AsyncSession: Pass the database session to the function
     :return: A tuple of the tag object and a boolean value
     """
-    tag = await repository_tags.get_or_create_tag_by_name(name, db)
-    return tag
+    async def load(session: AsyncSession):
+        tag = await repository_tags.get_or_create_tag_by_name(name, session)
+        return TagResponse.model_validate(tag).model_dump(mode="json")
+
+    return await cache_service.get_or_load("tag", name, load)
 
 
 @router.delete("/{tag_name}", response_model=TagResponse)
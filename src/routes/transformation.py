@@ -1,13 +1,7 @@
-import io
 from PIL import Image, ImageDraw
 from typing import List
 
 import json
-import qrcode
-
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
 
 from fastapi import (
     APIRouter,
@@ -22,24 +16,22 @@ from fastapi_limiter.depends import RateLimiter
 from src.conf.config import settings
 from src.conf.transformation import TRANSFORMATIONS
 from sqlalchemy.ext.asyncio import AsyncSession
-from src.schemas.transformation import PhotoResponse, UrlResponse
-from src.database.db import get_db
+from src.schemas.transformation import PhotoResponse, UrlResponse, QrCodeBatchModel, QrCodeResponse
+from src.schemas.pagination import CursorPage
+from src.database.db import get_db, get_read_db
 from src.repository import transformation as ts
+from src.repository import derived
 from src.entity.models import User
 from src.services.auth import auth_service
+from src.services.media import media_storage
+from src.services.jobs import job_queue
 from src.repository import posts as repository_posts
 from src.schemas.post import PostModel, PostResponse, PostDeletedResponse
 
 
 router = APIRouter(prefix="/transformation", tags=["transformation"])
-cloudinary.config(
-    cloud_name=settings.CLOUDINARY_NAME,
-    api_key=settings.CLOUDINARY_API_KEY,
-    api_secret=settings.CLOUDINARY_API_SECRET,
-    secure=True,
-)
 
-async def url_qr_prefix(list_tr):
+def url_qr_prefix(list_tr):
     """
     Creates a string from the incoming transformation parameter sheet for a Qrcode URL prefix.
 
@@ -54,29 +46,6 @@ async def url_qr_prefix(list_tr):
             prefix += i
     return prefix
 
-async def create_qr(url_transform):
-    """
-    Creates a Qrcode image with a link to a photo.
-
-    :param url_transform: Link to photo.
-    :type url_transform: str
-    :return: Byte string Qrcode.
-    :rtype: class 'bytes'
-    """
-    qr = qrcode.QRCode(
-        version=None,
-        error_correction=qrcode.constants.ERROR_CORRECT_M,
-        box_size=10,
-        border=4,
-        )
-    qr.add_data(url_transform)
-    qr.make(fit=True) 
-    img = qr.make_image(fill_color="black", back_color="white")
-    imgByteArr = io.BytesIO()
-    img.save(imgByteArr, format=img.format)
-    imgByteArr = imgByteArr.getvalue()
-    return imgByteArr
-
 
 @router.get("/ping_cloudinary", dependencies=[Depends(RateLimiter(times=2, seconds=5))])
 async def ping_cloudinary():
@@ -86,7 +55,7 @@ async def ping_cloudinary():
     :return: A dict of connection status.
     :rtype: dict
     """
-    ping = cloudinary.api.ping()
+    ping = await media_storage.ping()
     print(ping)
     return ping
 
@@ -115,9 +84,12 @@ async def transformation_photo(
         user: User = Depends(auth_service.get_current_user)):
     """
     
-    Creates a link with transformation parameters for the Cloudinary service.
+    Creates a link with transformation parameters for the media storage.
+    Cloudinary renders the transformations on request, the local storage renders them once in its process pool.
     The id field is used to enter the post id.
     The create_qrcode field is used to create a qrcode for a link; to create a link you must set it to True.
+    Qrcodes are rendered and uploaded by a job of the job queue, the returned Qrcode url serves once the job is done.
+    Transformed urls and Qrcodes are content-addressed derived assets, a repeated request returns the existing ones.
     The transformation availability is entered into the transformation fields.
     For example: crop , rotate , effect , overlays , vignette , face , pixelate_faces , cartoonify, opacity.
 
@@ -152,35 +124,75 @@ async def transformation_photo(
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Transformation '{i}' not found")
    
     public_id = info_photo.image_id
-    status_cloudinary = await ping_cloudinary()
-    if status_cloudinary.get("status") != "ok":
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Service Cloudinary is unavailable")
-    all_info_photo = cloudinary.api.resource(public_id)
-    url_origin = all_info_photo.get('secure_url')
-    url_transform = cloudinary.CloudinaryImage(public_id).build_url(transformation =
-        [
-            TRANSFORMATIONS.get(transformation_1),
-            TRANSFORMATIONS.get(transformation_2),
-            TRANSFORMATIONS.get(transformation_3),
-            TRANSFORMATIONS.get(transformation_4),
-            TRANSFORMATIONS.get(transformation_5),
-            ])
-
-    prefix = url_qr_prefix(list_tr)
+    url_origin = media_storage.url(public_id)
+    cached = False
+
+    asset = await derived.get_asset(derived.asset_key(public_id, list_tr, derived.URL), db)
+    if asset:
+        url_transform = asset.url
+    else:
+        url_transform = await media_storage.transform(public_id, transformation =
+            [TRANSFORMATIONS.get(i) for i in list_tr if i != None])
+        await derived.add_asset(derived.asset_key(public_id, list_tr, derived.URL), public_id, derived.URL,
+                                url_transform, None, media_storage.rendition_size(url_transform), db)
+        cached = True
+
     url_qr = None
     publick_url_qr = None
     if create_qrcode == True:
-        img = await create_qr(url_transform)       
-        prefix = await url_qr_prefix(list_tr)
-        publick_url_qr = f"{public_id}_{prefix}_qr"
-        result = cloudinary.uploader.upload(img, public_id=publick_url_qr, owerite=True)
-        url_qr = cloudinary.CloudinaryImage(publick_url_qr).build_url(version=result.get("version"))
+        asset = await derived.get_asset(derived.asset_key(public_id, list_tr, derived.QRCODE), db)
+        if asset:
+            url_qr, publick_url_qr = asset.url, asset.public_id
+        else:
+            prefix = url_qr_prefix(list_tr)
+            publick_url_qr = f"{public_id}_{prefix}_qr"
+            url_qr = media_storage.url(publick_url_qr, format="png")
+            key = derived.asset_key(public_id, list_tr, derived.QRCODE)
+            qrcode = {"data": url_transform, "public_id": publick_url_qr, "url": url_qr, "asset_key": key,
+                      "image_id": public_id}
+            await job_queue.enqueue_or_store("upload_qrcodes", [qrcode], key=key)
+    if cached:
+        await derived.evict_assets(db)
     await ts.update_qr(id , url_transform,  url_qr, publick_url_qr, db)
     return url_origin , url_transform , url_qr
 
 
+@router.post("/create_qrcodes", response_model=List[QrCodeResponse],
+             dependencies=[Depends(RateLimiter(times=2, seconds=5))])
+async def create_qrcodes(body: QrCodeBatchModel, db: AsyncSession = Depends(get_db),
+                         user: User = Depends(auth_service.get_current_user)):
+    """
+    Creates Qrcodes for all transformation links of many posts of a registered user in one request.
+    Links that already have a Qrcode are skipped. The links are stored with one statement,
+    the Qrcodes are rendered and uploaded in one batch by a job of the job queue.
+
+    :param body: Post numbers with transformed photos.
+    :type body: QrCodeBatchModel
+    :param db: The database session.
+    :type db: Session
+    :param user: The user to retrieve posts for.
+    :type user: User
+    :return: The links that got a Qrcode.
+    :rtype: List[QrCodeResponse]
+    """
+    urls = await ts.get_urls_without_qr(body.post_ids, user, db)
+    qrcodes = []
+    for url in urls:
+        publick_url_qr = f"{url.image_id}_{url.id}_qr"
+        qrcodes.append({"id": url.id, "public_id_qrcode": publick_url_qr,
+                        "transform_url_qr": media_storage.url(publick_url_qr, format="png")})
+    await ts.save_qr_batch(qrcodes, db)
+    if qrcodes:
+        await job_queue.enqueue_or_store("upload_qrcodes", [{"data": url.transform_url,
+                                                              "public_id": qr["public_id_qrcode"],
+                                                              "url": qr["transform_url_qr"]}
+                                                             for url, qr in zip(urls, qrcodes)])
+    return [{"post_id": url.post_id, "transform_url": url.transform_url, "transform_url_qr": qr["transform_url_qr"]}
+            for url, qr in zip(urls, qrcodes)]
+
+
 @router.get("/show_photo_url",response_model=PhotoResponse,dependencies=[Depends(RateLimiter(times=2, seconds=5))])
-async def show_photo_url(id: int, user: User = Depends(auth_service.get_current_user), db: AsyncSession = Depends(get_db)):
+async def show_photo_url(id: int, user: User = Depends(auth_service.get_current_user), db: AsyncSession = Depends(get_read_db)):
     """
     Creates a database query to obtain information about a photo links of a registered user.
 
@@ -201,28 +213,25 @@ async def show_photo_url(id: int, user: User = Depends(auth_service.get_current_
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
     return result
 
-@router.get("/show_all_url",response_model=List[PhotoResponse], dependencies=[Depends(RateLimiter(times=2, seconds=5))])
-async def show_all_url(limit: int = Query(10, ge=10, le=500), offset: int = Query(0, ge=0),
-                       user: User = Depends(auth_service.get_current_user), db: AsyncSession = Depends(get_db)):
+@router.get("/show_all_url",response_model=CursorPage[PhotoResponse], dependencies=[Depends(RateLimiter(times=2, seconds=5))])
+async def show_all_url(limit: int = Query(10, ge=10, le=500), cursor: str | None = Query(None),
+                       user: User = Depends(auth_service.get_current_user), db: AsyncSession = Depends(get_read_db)):
     """
     Creates a database query to obtain information about all photo links of a registered user.
 
-    :param offset: The number of contacts to skip.
-    :type offset: int
-    :param limit: The maximum number of cntacts to return.
+    :param cursor: The cursor of the previous page.
+    :type cursor: str | None
+    :param limit: The maximum number of posts to return.
     :type limit: int
     :param user: The user to retrieve post for.
     :type user: User
     :param db: The database session.
     :type db: Session
-    :return: Links to transform photos
-    :rtype: List[PhotoResponse]
+    :return: Links to transform photos and the cursor of the next page
+    :rtype: CursorPage[PhotoResponse]
     """
-    result = await ts.get_all_url(limit,offset, user, db)
-
-    if result is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
-    return result
+    result, next_cursor = await ts.get_all_url(limit, cursor, user, db)
+    return {"items": result, "next_cursor": next_cursor}
 
 
 
@@ -241,9 +250,7 @@ async def remove_qrcode(id: int, user: User = Depends(auth_service.get_current_u
     :rtype: List[PhotoResponse]
     """
     post = await ts.info_qrcode_url(id, user, db)
-    for i in post:
-        print(i)
-        cloudinary.uploader.destroy(str(i))
     if post is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=messages.POST_NOT_FOUND)
+    await job_queue.enqueue_or_store("delete_media", [str(i) for i in post])
     return post
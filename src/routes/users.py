@@ -1,31 +1,31 @@
 from types import NoneType
 
-import cloudinary
-import cloudinary.uploader
-
 from fastapi import (
     APIRouter,
     Depends,
     HTTPException,
     UploadFile,
     File,
+    Request,
     status, Path
 )
 from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi.encoders import jsonable_encoder
 from fastapi_limiter.depends import RateLimiter
 from src.conf import messages
-from src.conf.cloudinary import configure_cloudinary
 from src.database.db import get_db
 from src.entity.models import User
 from src.repository.users import get_user_by_username, get_user_by_email
 from src.schemas.user import UserResponse, UserSchema, UserProfileResponse
 from src.services.auth import auth_service
+from src.services.cache import cache_service
+from src.services.media import media_storage
+from src.services.uploads import check_upload_file, stream_upload
 from src.repository import users as repository_users
 from src.repository import profile as repository_profile
 
 router = APIRouter(prefix="/users", tags=["users"])
-configure_cloudinary()
 
 
 @router.get(
@@ -64,31 +64,57 @@ async def get_current_user(
     :param db: AsyncSession: Get the database connection
     :return: The current user
     """
+    await check_upload_file(file)
     public_id = f"Photoshare_app/Avatars/{user.id}"
-    res = cloudinary.uploader.upload(file.file, public_id=public_id, owerite=True)
-    res_url = cloudinary.CloudinaryImage(res["public_id"]).build_url(
-        width=250, height=250, crop="fill", version=res.get("version")
-    )
+    res = await media_storage.put(file.file, public_id, overwrite=True)
+    res_url = await media_storage.transform(res["public_id"], width=250, height=250, crop="fill",
+                                            version=res.get("version"))
     user = await repository_users.update_avatar_url(user.email, res_url, db)
     return user
 
 
+@router.patch(
+    "/avatar/stream",
+    response_model=UserResponse,
+    dependencies=[Depends(RateLimiter(times=2, seconds=5))],
+)
+async def update_avatar_stream(
+        request: Request,
+        user: User = Depends(auth_service.get_current_user),
+        db: AsyncSession = Depends(get_db)):
+    """
+    The update_avatar_stream function updates the avatar of the current user from an image sent as the raw request body.
+        The image is streamed to the media storage while it is received, see src.services.uploads.
+
+    :param request: Request: The request with the image as its body
+    :param user: User: Get the current user
+    :param db: AsyncSession: Get the database connection
+    :return: The current user
+    """
+    public_id = f"Photoshare_app/Avatars/{user.id}"
+    res = await stream_upload(request, public_id, overwrite=True)
+    res_url = await media_storage.transform(res["public_id"], width=250, height=250, crop="fill",
+                                            version=res.get("version"))
+    return await repository_users.update_avatar_url(user.email, res_url, db)
+
+
 @router.get("/{username}/profile/", status_code=status.HTTP_200_OK)
 async def get_user_profile(
         username: str = Path(),
-        db: AsyncSession = Depends(get_db),
 ):
     """
     The get_user_profile function is a GET request that returns the profile of a user. The username parameter is
-    required and must be unique. The db parameter uses the get_db function to connect to the database.
+    required and must be unique.
 
     :param username: str: Get the username from the path
-    :param db: AsyncSession: Pass the database session to the function
     :return: A dict with the user's profile information
     """
-    user = await repository_users.get_user_by_username(username, db)
-    if user:
-        result = await repository_profile.get_profile(user, db)
+    async def load(session: AsyncSession):
+        user = await repository_users.get_user_by_username(username, session)
+        return jsonable_encoder(await repository_profile.get_profile(user, session)) if user else None
+
+    result = await cache_service.get_or_load("profile", username, load)
+    if result:
         return result
     raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND, detail=messages.USER_NOT_FOUND
@@ -113,8 +139,6 @@ async def update_user_profile(body: UserSchema, db: AsyncSession = Depends(get_d
     :param current_user: User: Get the current user
     :return: A user object
     """
-    body.password = auth_service.get_password_hash(body.password)
-
     if (current_user.email == body.email) and (current_user.username != body.username):
         exist_user = await get_user_by_username(body.username, db)
         if exist_user is not None:
@@ -5,7 +5,9 @@ import uuid
 
 from src.schemas.post import PostResponse
 from src.schemas.user import UserResponse
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
+
+from src.conf.config import settings
 
 
 class CreateCommentModel(BaseModel):
@@ -22,6 +24,14 @@ class CommentDeleteModel(BaseModel):
     comment_id: uuid.UUID
 
 
+class CommentBulkDeleteModel(BaseModel):
+    comment_ids: List[uuid.UUID] = Field(min_length=1, max_length=settings.COMMENT_DELETE_BATCH_SIZE)
+
+
+class CommentBulkDeleteResponse(BaseModel):
+    deleted: List[uuid.UUID]
+
+
 class CommentResponse(BaseModel):
     id: uuid.UUID
     content: str
@@ -42,6 +52,16 @@ class CommentResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class PostCommentResponse(BaseModel):
+    id: uuid.UUID
+    content: str
+    created_at: datetime
+    updated_at: datetime
+    user: UserResponse
+
+    model_config = ConfigDict(from_attributes=True)
+
+
 # user@example.com
 # string1
 #
@@ -1,7 +1,8 @@
 from datetime import datetime
-from typing import Optional, List
+from typing import Dict, Literal, Optional, List
 from pydantic import BaseModel, Field, EmailStr, PastDate, ConfigDict, field_validator
 
+from src.conf.config import settings
 from src.schemas.tag import TagModel, TagResponse
 from src.schemas.user import UserResponse
 
@@ -36,5 +37,21 @@ class PostResponse(BaseModel):
     rating: float | None
     user: UserResponse
     tags: List[TagResponse] | None
+    srcset: Dict[str, str] = {}
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class IngestItemModel(PostModel):
+    file: str = Field(max_length=255)
+
+
+class IngestManifest(BaseModel):
+    items: List[IngestItemModel] = Field(min_length=1, max_length=settings.INGEST_BATCH_SIZE)
+
+
+class IngestResult(BaseModel):
+    name: str | None
+    status: Literal["created", "exists", "failed"]
+    post_id: int | None = None
+    detail: str | None = None
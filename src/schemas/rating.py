@@ -55,3 +55,5 @@ class AdminRateResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class RepairRatingResponse(BaseModel):
+    repaired: List[int]
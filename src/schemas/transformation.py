@@ -1,6 +1,7 @@
 from typing import List, Optional ,Dict
 
 from pydantic import BaseModel, Field, ConfigDict, validator, field_validator,ConfigDict
+from src.conf.config import settings
 from src.entity.models import PhotoUrl
 
 
@@ -15,5 +16,9 @@ class PhotoResponse(BaseModel):
     all_images: List[UrlResponse] | None
 
 
-    
+class QrCodeBatchModel(BaseModel):
+    post_ids: List[int] = Field(min_length=1, max_length=settings.QR_BATCH_SIZE)
 
+
+class QrCodeResponse(UrlResponse):
+    post_id: int
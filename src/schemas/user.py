@@ -16,6 +16,17 @@ class UserResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class Principal(BaseModel):
+    id: uuid.UUID
+    email: str
+    username: str
+    avatar: str | None = None
+    user_type_id: int
+    is_banned: bool = False
+    token_version: int = 0
+    model_config = ConfigDict(from_attributes=True)
+
+
 class UserProfileResponse(BaseModel):
     id: uuid.UUID
     username: str
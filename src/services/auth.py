@@ -1,54 +1,116 @@
-import pickle
+import hashlib
+import time
+import uuid
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
 
-import redis
+from redis.asyncio import Redis
 from fastapi import Depends, HTTPException, status
-from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
+from jose.exceptions import ExpiredSignatureError
 
 from src.database.db import get_db
 from src.repository import users as repository_users
 from src.conf.config import settings
 from src.conf import messages
+from src.schemas.user import Principal
+from src.services.passwords import password_hasher
+from src.services.principals import principal_cache
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
     SECRET_KEY = settings.SECRET_KEY_JWT
     ALGORITHM = settings.ALGORITHM
-    cache = redis.Redis(
-        host=settings.REDIS_HOST,
-        port=settings.REDIS_PORT,
-        db=0,
-        password=settings.REDIS_PASSWORD,
-    )
+    cache: Redis | None = None
 
-    def verify_password(self, plain_password, hashed_password):
+    def __init__(self):
+        self._verified: OrderedDict[bytes, dict] = OrderedDict()
+
+    def init(self, redis: Redis):
+        """
+        The init function attaches the auth service to the pooled Redis connection opened in main.startup,
+        which is shared with the rate limiter, the response cache and the principal cache.
+
+        :param self: Represent the instance of the class
+        :param redis: Redis: The asyncio Redis client
+        :return: None
+        """
+        self.cache = redis
+
+    def decode_token(self, token: str) -> dict:
+        """
+        The decode_token function verifies a jwt and returns its claims.
+        Verified tokens are remembered in an LRU of TOKEN_CACHE_SIZE entries keyed by a digest of the token,
+        so a repeated token skips the signature check and the json parsing until it expires.
+
+        :param self: Represent the instance of the class
+        :param token: str: The jwt
+        :return: The claims of the token
+        """
+        digest = hashlib.blake2b(token.encode(), digest_size=16).digest()
+        payload = self._verified.get(digest)
+        if payload is not None:
+            if payload["exp"] > time.time():
+                self._verified.move_to_end(digest)
+                return payload
+            del self._verified[digest]
+            raise ExpiredSignatureError("Signature has expired.")
+        payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+        self._verified[digest] = payload
+        while len(self._verified) > settings.TOKEN_CACHE_SIZE:
+            self._verified.popitem(last=False)
+        return payload
+
+    async def revoke_tokens(self, email: str, *tokens: str | None):
+        """
+        The revoke_tokens function revokes tokens of a user by their jti until they expire.
+        Tokens that are missing, invalid or already expired are skipped.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email of the user
+        :param tokens: str | None: The tokens to revoke
+        :return: None
+        """
+        revoked = {}
+        for token in tokens:
+            if token is None:
+                continue
+            try:
+                payload = self.decode_token(token)
+            except JWTError:
+                continue
+            if "jti" in payload:
+                revoked[payload["jti"]] = payload["exp"]
+        if revoked:
+            await principal_cache.revoke(str(email), revoked)
+
+    async def verify_password(self, plain_password, hashed_password):
         """
         The verify_password function takes a plain-text password and hashed
-        password as arguments. It then uses the pwd_context object to verify that the
-        plain-text password matches the hashed one.
+        password as arguments. It then uses the password hasher to verify that the
+        plain-text password matches the hashed one, off the event loop.
+        A hashed_password of None takes as long as a real check and returns False.
 
         :param self: Make the method belong to the class
         :param plain_password: Pass in the password that is entered by the user
         :param hashed_password: Compare the hashed password stored in the database to the plain text password that is entered by a user
         :return: A boolean value
         """
-        return self.pwd_context.verify(plain_password, hashed_password)
+        return await password_hasher.verify(plain_password, hashed_password)
 
-    def get_password_hash(self, password: str):
+    async def get_password_hash(self, password: str):
         """
         The get_password_hash function takes a password as input and returns the hash of that password.
-        The hash is generated using the pwd_context object, which is an instance of Flask-Bcrypt's Bcrypt class.
+        The hash is computed with bcrypt in the process pool of the password hasher.
 
         :param self: Represent the instance of the class
         :param password: str: Pass in the password that we want to hash
         :return: A hash of the password
         """
-        return self.pwd_context.hash(password)
+        return await password_hasher.hash(password)
 
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
@@ -61,6 +123,8 @@ class Auth:
             Args:
                 - data (dict): A dictionary containing the claims to be encoded in the JWT.
                 - expires_delta (Optional[float]): An optional parameter specifying how long, in seconds, the access token should last before expiring. If not specified, it defaults to 15 minutes.
+            Every token gets a unique jti, so it can be revoked on its own. Pass the token_version
+            of the user as ver in data, so the token is revoked when the version is increased.
 
         :param self: Represent the instance of the class
         :param data: dict: Pass the data that you want to encode in the jwt
@@ -74,7 +138,7 @@ class Auth:
         else:
             expire = datetime.utcnow() + timedelta(minutes=15)
         to_encode.update(
-            {"iat": datetime.utcnow(), "exp": expire, "scope": "access_token"}
+            {"iat": datetime.utcnow(), "exp": expire, "scope": "access_token", "jti": uuid.uuid4().hex}
         )
         encoded_access_token = jwt.encode(
             to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM
@@ -102,7 +166,7 @@ class Auth:
         else:
             expire = datetime.utcnow() + timedelta(days=7)
         to_encode.update(
-            {"iat": datetime.utcnow(), "exp": expire, "scope": "refresh_token"}
+            {"iat": datetime.utcnow(), "exp": expire, "scope": "refresh_token", "jti": uuid.uuid4().hex}
         )
         encoded_refresh_token = jwt.encode(
             to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM
@@ -125,15 +189,11 @@ class Auth:
             headers={"WWW-Authenticate": "Bearer"},
         )
         try:
-            payload = jwt.decode(
-                refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM]
-            )
-            print(payload)
+            payload = self.decode_token(refresh_token)
             if payload["scope"] == "refresh_token":
                 email = payload["sub"]
 
-                is_blocked = self.cache.get(str(email) + "_blacklist_refresh")
-                if is_blocked is not None and is_blocked.decode('utf-8') == refresh_token:
+                if "jti" in payload and await principal_cache.is_revoked(str(email), payload["jti"]):
                     raise credentials_exception
 
                 return email
@@ -153,13 +213,15 @@ class Auth:
     ):
         """
         The get_current_user function is a dependency that will be used in the
-            protected endpoints. It takes a token as an argument and returns the user
-            object if it exists, otherwise it raises an exception.
+            protected endpoints. It takes a token as an argument and returns the principal
+            of the user if it exists, otherwise it raises an exception.
+            The principal is a compact record of the user served by the principal cache,
+            routes that need the whole user load it from the database.
 
         :param self: Access the class variables
         :param token: str: Get the token from the authorization header
         :param db: AsyncSession: Pass the database session to the function
-        :return: A user object
+        :return: A Principal
         """
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -168,7 +230,7 @@ class Auth:
         )
         try:
             # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            payload = self.decode_token(token)
             if payload["scope"] == "access_token":
                 email = payload["sub"]
                 if email is None:
@@ -178,34 +240,18 @@ class Auth:
         except JWTError as e:
             raise credentials_exception
 
-        user_hash = str(email)
-
-        # Check if the user is in the blacklist
-        is_blocked = self.cache.get(user_hash + "_blacklist_access")
-
-        if is_blocked is not None and is_blocked.decode('utf-8') == token:
-            raise credentials_exception
-
-        user = self.cache.get(user_hash)
-
-        if user is None:
+        async def load_principal():
             print(messages.AUTH_USER_NOT_IN_CACHE)
             user = await repository_users.get_user_by_email(email, db)
-            if user is None or user.is_banned:
-                raise credentials_exception
+            return Principal.model_validate(user) if user else None
 
-            # Check if user's refresh token is in the blacklist
-            if user.refresh_token is not None:
-                refresh_token_blocked = self.cache.get(user.refresh_token + "_blacklist_refresh")
-                if refresh_token_blocked is not None:
-                    raise credentials_exception
-            self.cache.set(user_hash, pickle.dumps(user))
-            self.cache.expire(user_hash, 300)
-        else:
-            print(messages.AUTH_USER_IN_CACHE)
-            user = pickle.loads(user)
+        principal, revoked = await principal_cache.get(str(email), load_principal)
 
-        return user
+        if payload.get("jti") in revoked:
+            raise credentials_exception
+        if principal is None or principal.is_banned or payload.get("ver", 0) < principal.token_version:
+            raise credentials_exception
+        return principal
 
     def create_email_token(self, data: dict):
         """
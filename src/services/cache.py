@@ -0,0 +1,165 @@
+import asyncio
+import json
+import math
+import random
+import time
+from collections import Counter
+from typing import Awaitable, Callable
+
+from redis import RedisError
+from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import settings
+from src.database.db import sessionmanager
+
+
+class Cache:
+    """
+    Read-through cache for serialised response payloads, stored as JSON in Redis.
+
+    Every entity (a post, a profile, a tag) has a version counter. The payload is stored under a key
+    that contains the current version, so invalidation is a single INCR: readers move to a new key
+    at once and a payload computed from data read before a write can only land on the old key.
+    """
+    PREFIX = "cache"
+    # the probability of an early refresh grows as the entry gets closer to its expiry (XFetch)
+    EARLY_REFRESH_BETA = 1.0
+
+    def __init__(self):
+        self.redis: Redis | None = None
+        self.stats = Counter()
+        self._flights: dict[str, asyncio.Future] = {}
+
+    def init(self, redis: Redis):
+        """
+        The init function attaches the cache to the Redis connection opened in main.startup.
+        Until it is called every read goes straight to the loader.
+
+        :param self: Represent the instance of the class
+        :param redis: Redis: The asyncio Redis client
+        :return: None
+        """
+        self.redis = redis
+
+    def _version_key(self, entity: str, key) -> str:
+        return f"{self.PREFIX}:{entity}:{key}:version"
+
+    def _ttl(self) -> float:
+        jitter = settings.CACHE_TTL * settings.CACHE_TTL_JITTER
+        return settings.CACHE_TTL + random.uniform(-jitter, jitter)
+
+    def _expired(self, entry: dict) -> bool:
+        """
+        The _expired function decides if a cached entry should be recomputed before it really expires.
+        An entry that took delta seconds to compute is refreshed early with a probability
+        that rises towards its expiry, so one request recomputes it while the others still get hits.
+
+        :param self: Represent the instance of the class
+        :param entry: dict: The cached entry with value, delta and expiry
+        :return: True if the entry has to be recomputed
+        """
+        gap = -entry["delta"] * self.EARLY_REFRESH_BETA * math.log(1.0 - random.random())
+        return time.time() + gap >= entry["expiry"]
+
+    async def get_or_load(self, entity: str, key,
+                          loader: Callable[[AsyncSession], Awaitable[dict | None]]) -> dict | None:
+        """
+        The get_or_load function returns the cached payload of an entity or computes it with the loader.
+        Concurrent misses of the same key in this process share one loader call (single-flight).
+        The loader gets a session of its own and not the session of any request, so a shared call
+        does not use the session of the first request after it is closed, or concurrently with it.
+        A None returned by the loader is not cached.
+        If Redis is not configured or fails, the loader is called directly.
+
+        :param self: Represent the instance of the class
+        :param entity: str: The kind of the entity, e.g. post or profile
+        :param key: The id of the entity
+        :param loader: Callable[[AsyncSession], Awaitable[dict | None]]: Build the JSON-serialisable payload
+            from the database with the given session
+        :return: The payload or None
+        """
+        if self.redis is None:
+            return await self._call(loader)
+        try:
+            version = await self.redis.get(self._version_key(entity, key))
+            data_key = f"{self.PREFIX}:{entity}:{key}:{int(version or 0)}"
+            cached = await self.redis.get(data_key)
+        except RedisError as err:
+            print(err)
+            self.stats[f"{entity}:error"] += 1
+            return await self._call(loader)
+        if cached is not None:
+            entry = json.loads(cached)
+            if not self._expired(entry):
+                self.stats[f"{entity}:hit"] += 1
+                return entry["value"]
+        self.stats[f"{entity}:miss"] += 1
+
+        flight = self._flights.get(data_key)
+        if flight is None:
+            flight = asyncio.ensure_future(self._load(data_key, loader))
+            self._flights[data_key] = flight
+            flight.add_done_callback(lambda _: self._flights.pop(data_key, None))
+        return await asyncio.shield(flight)
+
+    @staticmethod
+    async def _call(loader: Callable[[AsyncSession], Awaitable[dict | None]]) -> dict | None:
+        # the primary and not a replica, a lagging replica would cache data older than the version it is stored under
+        async with sessionmanager.session() as db:
+            return await loader(db)
+
+    async def _load(self, data_key: str, loader: Callable[[AsyncSession], Awaitable[dict | None]]) -> dict | None:
+        start = time.monotonic()
+        value = await self._call(loader)
+        if value is None:
+            return value
+        ttl = self._ttl()
+        entry = {"value": value, "delta": time.monotonic() - start, "expiry": time.time() + ttl}
+        try:
+            await self.redis.set(data_key, json.dumps(entry), ex=math.ceil(ttl))
+        except RedisError as err:
+            print(err)
+        return value
+
+    async def invalidate(self, entity: str, *keys):
+        """
+        The invalidate function bumps the version of the given entities, so their cached payloads are not read again.
+        It has to be called after the write is committed.
+        The version keys outlive every payload stored under an older version.
+
+        :param self: Represent the instance of the class
+        :param entity: str: The kind of the entity, e.g. post or profile
+        :param keys: The ids of the entities
+        :return: None
+        """
+        if self.redis is None or not keys:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.incr(self._version_key(entity, key))
+                    pipe.expire(self._version_key(entity, key), 2 * settings.CACHE_TTL)
+                await pipe.execute()
+        except RedisError as err:
+            print(err)
+            self.stats[f"{entity}:error"] += 1
+
+    def get_stats(self) -> dict:
+        """
+        The get_stats function returns the hit and miss counters of this process per entity.
+
+        :param self: Represent the instance of the class
+        :return: A dict of counters and hit ratio per entity
+        """
+        result = {}
+        for name, count in self.stats.items():
+            entity, kind = name.split(":")
+            result.setdefault(entity, {"hit": 0, "miss": 0, "error": 0})[kind] = count
+        for counters in result.values():
+            total = counters["hit"] + counters["miss"]
+            counters["hit_ratio"] = round(counters["hit"] / total, 4) if total else 0.0
+        return result
+
+
+cache_service = Cache()
@@ -1,63 +1,185 @@
+import asyncio
+import time
+from email.message import EmailMessage
+from email.utils import formataddr
 from pathlib import Path
+from typing import List
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
+import aiosmtplib
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 from pydantic import EmailStr
+from redis import RedisError
 
+from src.entity.models import OutboxEmail
 from src.services.auth import auth_service
+from src.services.jobs import job_queue
 from src.conf.config import settings
 
+VERIFY_EMAIL = "verify_email.html"
+RESET_PASSWORD = "reset_password.html"
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings.MAIL_USERNAME,
-    MAIL_PASSWORD=settings.MAIL_PASSWORD,
-    MAIL_FROM=settings.MAIL_USERNAME,
-    MAIL_PORT=settings.MAIL_PORT,
-    MAIL_SERVER=settings.MAIL_SERVER,
-    MAIL_FROM_NAME="Contact System",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=False,
-    TEMPLATE_FOLDER=Path(__file__).parent / "templates",
-)
+# the templates are compiled once when the module is imported, not for every email
+environment = Environment(loader=FileSystemLoader(Path(__file__).parent / "templates"),
+                          autoescape=select_autoescape(["html"]))
+TEMPLATES = {name: environment.get_template(name) for name in (VERIFY_EMAIL, RESET_PASSWORD)}
 
 
-async def send_email(
-    email: EmailStr, username: str, host: str, type: str | None = None
-):
+def outbox_email(email: EmailStr, username: str, host: str, type: str | None = None) -> OutboxEmail:
     """
-    The send_email function sends an email to the user with a link to verify their account.
-        Args:
-            - email (str): The user's email address.
-            - username (str): The username of the user who is registering for an account.
+    The outbox_email function builds the outbox entry of an email with a link to verify the account of the user,
+    or to reset the password if type is reset_password. The link token is created when the email is sent.
 
     :param email: EmailStr: Specify the email address of the recipient
     :param username: str: Pass the username to the template
     :param host: str: Pass the hostname of the server
     :param type: str | None: Determine the type of email to be sent
-    :return: A coroutine object
+    :return: An OutboxEmail to add to the session
     """
-    temp_name = "verify_email.html"
-    subj = "Confirm your email "
     if type == "reset_password":
-        subj = "Reset password"
-        temp_name = "reset_password.html"
+        return OutboxEmail(recipient=email, subject="Reset password", template=RESET_PASSWORD,
+                           context={"host": host, "username": username})
+    return OutboxEmail(recipient=email, subject="Confirm your email ", template=VERIFY_EMAIL,
+                       context={"host": host, "username": username})
+
+
+async def deliver_later():
+    """
+    The deliver_later function asks a worker to send the outbox. If Redis is down the emails stay in the outbox
+    and go out with the next delivery, so the request does not fail.
+
+    :return: None
+    """
     try:
-        token_verification = auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject=subj,
-            recipients=[email],
-            template_body={
-                "host": host,
-                "username": username,
-                "token": token_verification,
-            },
-            subtype=MessageType.html,
-        )
-
-        fm = FastMail(conf)
-
-        await fm.send_message(message, template_name=temp_name)
-    except ConnectionErrors as err:
-        print(err, "=============================")
\ No newline at end of file
+        await job_queue.enqueue("deliver_emails")
+    except RedisError as err:
+        print(err)
+
+
+def render_email(recipient: str, subject: str, template: str, context: dict) -> EmailMessage:
+    """
+    The render_email function renders an outbox entry into a message.
+
+    :param recipient: str: The email address of the recipient
+    :param subject: str: The subject
+    :param template: str: The name of the template
+    :param context: dict: The variables of the template
+    :return: The message
+    """
+    token = auth_service.create_email_token({"sub": recipient})
+    message = EmailMessage()
+    message["From"] = formataddr(("Contact System", settings.MAIL_USERNAME))
+    message["To"] = recipient
+    message["Subject"] = subject
+    message.set_content(TEMPLATES[template].render(**context, token=token), subtype="html")
+    return message
+
+
+class TokenBucket:
+    """
+    Allows rate operations per second on average and bursts of up to burst operations.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """
+        The acquire function waits until an operation is allowed.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class EmailSender:
+    """
+    Sends emails over up to EMAIL_CONNECTIONS SMTP connections that stay open between batches,
+    so the TCP and TLS handshakes and the login are paid once per connection instead of once per email.
+    Sending is limited to EMAIL_RATE_LIMIT emails per second, so a burst of signups does not hit
+    the rate limit of the provider.
+    """
+
+    def __init__(self, connections: int = settings.EMAIL_CONNECTIONS, rate: float = settings.EMAIL_RATE_LIMIT):
+        self.connections = connections
+        self.limiter = TokenBucket(rate, connections)
+        self._idle: List[aiosmtplib.SMTP] = []
+        self._slots = asyncio.Semaphore(connections)
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(hostname=settings.MAIL_SERVER, port=settings.MAIL_PORT,
+                               username=settings.MAIL_USERNAME, password=settings.MAIL_PASSWORD,
+                               use_tls=settings.MAIL_USE_SSL, start_tls=settings.MAIL_STARTTLS,
+                               validate_certs=False, timeout=settings.MAIL_TIMEOUT)
+        await smtp.connect()
+        return smtp
+
+    async def send(self, message: EmailMessage):
+        """
+        The send function sends a message over an open connection, or a new one if none is idle.
+        A connection that failed is closed and not reused.
+
+        :param self: Represent the instance of the class
+        :param message: EmailMessage: The message
+        :return: None
+        """
+        await self.limiter.acquire()
+        async with self._slots:
+            smtp = self._idle.pop() if self._idle else None
+            if smtp is None or not smtp.is_connected:
+                smtp = await self._connect()
+            try:
+                await smtp.send_message(message)
+            except Exception:
+                smtp.close()
+                raise
+            self._idle.append(smtp)
+
+    async def send_batch(self, emails: List) -> tuple:
+        """
+        The send_batch function sends claimed outbox entries concurrently over the pooled connections.
+
+        :param self: Represent the instance of the class
+        :param emails: List: Rows with id, recipient, subject, template, context and attempts
+        :return: The ids of the sent emails and a dict of the error and the backoff by id of the failed ones
+        """
+        results = await asyncio.gather(*[self.send(render_email(email.recipient, email.subject, email.template,
+                                                                email.context))
+                                         for email in emails], return_exceptions=True)
+        sent, errors = [], {}
+        for email, result in zip(emails, results):
+            if isinstance(result, Exception):
+                print(f"Email {email.id} failed, attempt {email.attempts}: {result!r}")
+                errors[email.id] = (repr(result), job_queue.backoff(email.attempts))
+            else:
+                sent.append(email.id)
+        return sent, errors
+
+    async def close(self):
+        """
+        The close function quits the idle connections.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        while self._idle:
+            smtp = self._idle.pop()
+            try:
+                await smtp.quit()
+            except aiosmtplib.SMTPException:
+                smtp.close()
+
+
+email_sender = EmailSender()
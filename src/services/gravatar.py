@@ -0,0 +1,81 @@
+import asyncio
+import urllib.error
+import urllib.request
+
+from libgravatar import Gravatar
+from redis import RedisError
+from redis.asyncio import Redis
+
+from src.conf.config import settings
+from src.services.jobs import job_queue
+
+
+class GravatarResolver:
+    """
+    Finds out whether an email has a Gravatar, outside of the signup request.
+    The image url is probed with d=404 and the answer is cached in Redis by the hash of the email
+    for GRAVATAR_TTL seconds, so users with the same email hash or a retried job do not probe again.
+    """
+    PREFIX = "gravatar"
+
+    def __init__(self, ttl: int = settings.GRAVATAR_TTL, timeout: float = settings.GRAVATAR_TIMEOUT):
+        self.ttl = ttl
+        self.timeout = timeout
+        self.redis: Redis | None = None
+
+    def init(self, redis: Redis):
+        """
+        The init function attaches the resolver to the Redis connection opened in worker.py.
+
+        :param self: Represent the instance of the class
+        :param redis: Redis: The asyncio Redis client
+        :return: None
+        """
+        self.redis = redis
+
+    def _probe(self, url: str) -> bool:
+        request = urllib.request.Request(f"{url}?d=404", method="HEAD")
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout):
+                return True
+        except urllib.error.HTTPError as err:
+            if err.code == 404:
+                return False
+            raise
+
+    async def resolve(self, email: str) -> str | None:
+        """
+        The resolve function returns the Gravatar url of an email, or None if the email has no Gravatar.
+        Errors other than a 404 of Gravatar are raised, so the job is retried.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email of the user
+        :return: The image url or None
+        """
+        gravatar = Gravatar(email)
+        key = f"{self.PREFIX}:{gravatar.email_hash}"
+        cached = await self.redis.get(key)
+        if cached is not None:
+            return cached.decode() or None
+        url = gravatar.get_image()
+        found = await asyncio.to_thread(self._probe, url)
+        await self.redis.set(key, url if found else "", ex=self.ttl)
+        return url if found else None
+
+    async def resolve_later(self, user_id, email: str):
+        """
+        The resolve_later function asks a worker to resolve the Gravatar of a new user.
+        If Redis is down the user keeps the default avatar.
+
+        :param self: Represent the instance of the class
+        :param user_id: The id of the user
+        :param email: str: The email of the user
+        :return: None
+        """
+        try:
+            await job_queue.enqueue("resolve_avatar", str(user_id), email, key=f"avatar:{user_id}")
+        except RedisError as err:
+            print(err)
+
+
+gravatar_resolver = GravatarResolver()
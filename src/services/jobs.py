@@ -0,0 +1,337 @@
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List
+
+from redis import RedisError, WatchError
+from redis.asyncio import Redis
+
+from src.conf.config import settings
+from src.database.db import sessionmanager
+from src.repository import jobs as repository_jobs
+
+
+class JobQueue:
+    """
+    Redis backed queue of side effects that do not have to finish within the request, e.g. media deletes,
+    QR code uploads, renditions and emails. The API process only enqueues, the jobs run in worker.py.
+
+    Every queue is a Redis list. A worker moves a job atomically to its own processing list while it runs,
+    so the job of a worker that died is put back by the next worker that starts. A failed job is retried
+    with exponential backoff from a sorted set scored by the time of the next attempt; after max_attempts
+    it is moved to the dead-letter list. A job enqueued with an idempotency key is dropped while another job
+    with the same key is queued or running; the key expires after JOB_KEY_TTL seconds in any case.
+    """
+    PREFIX = "jobs"
+    DEAD = "jobs:dead"
+
+    def __init__(self):
+        self.redis: Redis | None = None
+        # name: (func, queue, max_attempts)
+        self.tasks: Dict[str, tuple] = {}
+        self.worker_id = uuid.uuid4().hex
+
+    def init(self, redis: Redis):
+        """
+        The init function attaches the queue to the Redis connection opened in main.startup or worker.py.
+
+        :param self: Represent the instance of the class
+        :param redis: Redis: The asyncio Redis client
+        :return: None
+        """
+        self.redis = redis
+
+    def register(self, func: Callable[..., Awaitable], queue: str, max_attempts: int = settings.JOB_MAX_ATTEMPTS):
+        """
+        The register function makes a coroutine function available as a job under its name.
+
+        :param self: Represent the instance of the class
+        :param func: Callable[..., Awaitable]: The job, its arguments have to be JSON serializable
+        :param queue: str: The queue the job runs in, one of JOB_CONCURRENCY
+        :param max_attempts: int: How often the job is tried before it is dead-lettered
+        :return: The function
+        """
+        self.tasks[func.__name__] = (func, queue, max_attempts)
+        return func
+
+    def task(self, queue: str, max_attempts: int = settings.JOB_MAX_ATTEMPTS):
+        """
+        The task function is the decorator form of register.
+
+        :param self: Represent the instance of the class
+        :param queue: str: The queue the job runs in
+        :param max_attempts: int: How often the job is tried before it is dead-lettered
+        :return: A decorator
+        """
+        return lambda func: self.register(func, queue, max_attempts)
+
+    @staticmethod
+    def backoff(attempts: int) -> float:
+        """
+        The backoff function returns how long to wait before the next attempt of something that failed.
+        The wait doubles with every attempt up to JOB_BACKOFF_MAX and is jittered,
+        so jobs that failed together are not retried together.
+
+        :param attempts: int: The number of failed attempts
+        :return: The wait in seconds
+        """
+        backoff = min(settings.JOB_BACKOFF_MAX, settings.JOB_BACKOFF_BASE * 2 ** (attempts - 1))
+        return backoff * random.uniform(0.5, 1)
+
+    def _ready(self, queue: str) -> str:
+        return f"{self.PREFIX}:{queue}"
+
+    def _delayed(self, queue: str) -> str:
+        return f"{self.PREFIX}:{queue}:delayed"
+
+    def _processing(self, queue: str, worker_id: str) -> str:
+        return f"{self.PREFIX}:{queue}:processing:{worker_id}"
+
+    def _heartbeat(self, worker_id: str) -> str:
+        return f"{self.PREFIX}:workers:{worker_id}"
+
+    def _key(self, key: str) -> str:
+        return f"{self.PREFIX}:key:{key}"
+
+    def _job(self, name: str, args: tuple, kwargs: dict, key: str | None) -> tuple:
+        task = self.tasks.get(name)
+        if task is None:
+            raise ValueError(f"Unknown job {name}")
+        job = {"id": uuid.uuid4().hex, "name": name, "args": list(args), "kwargs": kwargs, "key": key,
+               "attempts": 0}
+        return task, json.dumps(job)
+
+    async def enqueue(self, name: str, *args, key: str | None = None, delay: float = 0, **kwargs) -> str | None:
+        """
+        The enqueue function schedules a job.
+
+        :param self: Represent the instance of the class
+        :param name: str: The name of a registered job
+        :param args: Positional arguments of the job
+        :param key: str | None: The idempotency key of the job
+        :param delay: float: Seconds to wait before the job runs
+        :param kwargs: Keyword arguments of the job
+        :return: The id of the job or None if a job with the same key was enqueued already
+        """
+        task, raw = self._job(name, args, kwargs, key)
+        if key is not None and not await self.redis.set(self._key(key), 1, nx=True, ex=settings.JOB_KEY_TTL):
+            return None
+        try:
+            if delay > 0:
+                await self.redis.zadd(self._delayed(task[1]), {raw: time.time() + delay})
+            else:
+                await self.redis.lpush(self._ready(task[1]), raw)
+        except RedisError:
+            if key is not None:
+                await self.redis.delete(self._key(key))
+            raise
+        return json.loads(raw)["id"]
+
+    async def enqueue_many(self, name: str, calls: List[tuple]):
+        """
+        The enqueue_many function schedules a job once for each tuple of arguments in one round trip.
+
+        :param self: Represent the instance of the class
+        :param name: str: The name of a registered job
+        :param calls: List[tuple]: The positional arguments of each job
+        :return: None
+        """
+        if not calls:
+            return
+        jobs = [self._job(name, args, {}, None) for args in calls]
+        await self.redis.lpush(self._ready(jobs[0][0][1]), *[raw for _, raw in jobs])
+
+    async def enqueue_or_store(self, name: str, *args, key: str | None = None, **kwargs):
+        """
+        The enqueue_or_store function schedules a job after a commit. While Redis is unreachable the job is
+        stored in the database and the workers enqueue it once Redis is back, so the request that committed
+        does not fail and the job is not lost.
+
+        :param self: Represent the instance of the class
+        :param name: str: The name of a registered job
+        :param args: Positional arguments of the job
+        :param key: str | None: The idempotency key of the job
+        :param kwargs: Keyword arguments of the job
+        :return: None
+        """
+        try:
+            await self.enqueue(name, *args, key=key, **kwargs)
+            return
+        except RedisError as err:
+            print(err)
+        await self._store([{"name": name, "args": list(args), "kwargs": kwargs, "key": key}])
+
+    async def enqueue_many_or_store(self, name: str, calls: List[tuple]):
+        """
+        The enqueue_many_or_store function is enqueue_many with the fallback of enqueue_or_store.
+
+        :param self: Represent the instance of the class
+        :param name: str: The name of a registered job
+        :param calls: List[tuple]: The positional arguments of each job
+        :return: None
+        """
+        try:
+            await self.enqueue_many(name, calls)
+            return
+        except RedisError as err:
+            print(err)
+        await self._store([{"name": name, "args": list(args), "kwargs": {}, "key": None} for args in calls])
+
+    async def _store(self, jobs: List[dict]):
+        async with sessionmanager.session() as db:
+            await repository_jobs.store_jobs(jobs, db)
+
+    async def restore(self) -> int:
+        """
+        The restore function enqueues the jobs that were stored while Redis was unreachable.
+        Every job is taken, enqueued and deleted from the database in a transaction of its own, so a job that
+        fails to enqueue stays stored without holding back the others and no job is enqueued twice.
+        A job that is not registered any more is moved to the dead-letter list.
+
+        :param self: Represent the instance of the class
+        :return: The number of restored jobs
+        """
+        restored = 0
+        async with sessionmanager.session() as db:
+            while jobs := await repository_jobs.take_stored_jobs(1, db):
+                job = jobs[0]
+                try:
+                    await self.enqueue(job.name, *job.args, key=job.key, **job.kwargs)
+                    restored += 1
+                except ValueError as err:
+                    print(err)
+                    await self.redis.lpush(self.DEAD, json.dumps({
+                        "id": uuid.uuid4().hex, "name": job.name, "args": job.args, "kwargs": job.kwargs,
+                        "key": job.key, "attempts": 0, "error": repr(err)}))
+                await db.commit()
+        return restored
+
+    async def dead_letters(self, limit: int = 100) -> List[dict]:
+        """
+        The dead_letters function returns the newest jobs that failed max_attempts times, with their last error.
+
+        :param self: Represent the instance of the class
+        :param limit: int: The largest number of jobs returned
+        :return: A list of jobs
+        """
+        return [json.loads(raw) for raw in await self.redis.lrange(self.DEAD, 0, limit - 1)]
+
+    async def _run(self, raw: bytes):
+        job = json.loads(raw)
+        task = self.tasks.get(job["name"])
+        try:
+            if task is None:
+                raise LookupError(f"Unknown job {job['name']}")
+            await task[0](*job["args"], **job["kwargs"])
+        except Exception as err:
+            job["attempts"] += 1
+            job["error"] = repr(err)
+            print(f"Job {job['name']} {job['id']} failed, attempt {job['attempts']}: {err!r}")
+        else:
+            if job["key"] is not None:
+                await self.redis.delete(self._key(job["key"]))
+            return
+        if task is None or job["attempts"] >= task[2]:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.lpush(self.DEAD, json.dumps(job))
+                if job["key"] is not None:
+                    pipe.delete(self._key(job["key"]))
+                await pipe.execute()
+            return
+        await self.redis.zadd(self._delayed(task[1]), {json.dumps(job): time.time() + self.backoff(job["attempts"])})
+
+    async def _consume(self, queue: str):
+        ready, processing = self._ready(queue), self._processing(queue, self.worker_id)
+        while True:
+            try:
+                raw = await self.redis.blmove(ready, processing, settings.JOB_POLL_INTERVAL, "RIGHT", "LEFT")
+                if raw is None:
+                    continue
+                await self._run(raw)
+                await self.redis.lrem(processing, 1, raw)
+            except RedisError as err:
+                print(err)
+                await asyncio.sleep(settings.JOB_POLL_INTERVAL)
+
+    async def _promote(self, queue: str):
+        """
+        The _promote function moves the retries that are due from the delayed set back to the queue.
+        The move is a transaction watched on the delayed set, so two workers never move the same job.
+
+        :param self: Represent the instance of the class
+        :param queue: str: The name of the queue
+        :return: None
+        """
+        delayed = self._delayed(queue)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            await pipe.watch(delayed)
+            due = await pipe.zrangebyscore(delayed, "-inf", time.time(), start=0, num=100)
+            if not due:
+                await pipe.unwatch()
+                return
+            pipe.multi()
+            pipe.zrem(delayed, *due)
+            pipe.lpush(self._ready(queue), *due)
+            try:
+                await pipe.execute()
+            except WatchError:
+                pass
+
+    async def recover(self):
+        """
+        The recover function puts the jobs of workers that stopped sending heartbeats back to their queues.
+
+        :param self: Represent the instance of the class
+        :return: The number of recovered jobs
+        """
+        recovered = 0
+        async for processing in self.redis.scan_iter(match=f"{self.PREFIX}:*:processing:*"):
+            _, queue, _, worker_id = processing.decode().split(":", 3)
+            if worker_id == self.worker_id or await self.redis.exists(self._heartbeat(worker_id)):
+                continue
+            while await self.redis.lmove(processing, self._ready(queue), "RIGHT", "RIGHT") is not None:
+                recovered += 1
+        return recovered
+
+    async def _maintain(self, queues: List[str]):
+        restored_at = 0.0
+        while True:
+            try:
+                await self.redis.set(self._heartbeat(self.worker_id), 1, ex=settings.JOB_HEARTBEAT_TTL)
+                for queue in queues:
+                    await self._promote(queue)
+                if random.random() < settings.JOB_POLL_INTERVAL / settings.JOB_HEARTBEAT_TTL:
+                    await self.recover()
+                if time.monotonic() - restored_at >= settings.JOB_RESTORE_INTERVAL:
+                    restored_at = time.monotonic()
+                    await self.restore()
+            except Exception as err:
+                # e.g. Redis or the database is unreachable, the next round tries again
+                print(err)
+            await asyncio.sleep(settings.JOB_POLL_INTERVAL)
+
+    async def work(self, concurrency: Dict[str, int]):
+        """
+        The work function runs jobs until it is cancelled, with at most concurrency[queue] jobs of each queue at a time.
+
+        :param self: Represent the instance of the class
+        :param concurrency: Dict[str, int]: The number of concurrent jobs by queue name
+        :return: None
+        """
+        await self.redis.set(self._heartbeat(self.worker_id), 1, ex=settings.JOB_HEARTBEAT_TTL)
+        print(f"Recovered {await self.recover()} jobs")
+        workers = [asyncio.create_task(self._maintain(list(concurrency)))]
+        for queue, count in concurrency.items():
+            workers += [asyncio.create_task(self._consume(queue)) for _ in range(count)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await self.redis.delete(self._heartbeat(self.worker_id))
+
+
+job_queue = JobQueue()
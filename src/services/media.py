@@ -0,0 +1,294 @@
+import asyncio
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator
+
+from fastapi import HTTPException, status
+
+from src.conf import messages
+from src.conf.config import settings
+from src.services.storage import StorageBackend, get_storage_backend
+
+
+class ChunkReader:
+    """
+    A file-like object that hands chunks fed from the event loop to a blocking reader in another thread.
+    At most maxsize chunks wait in the queue, so a slow backend slows down the upload instead of buffering it.
+    """
+
+    def __init__(self, maxsize: int, timeout: float):
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize)
+        self._buffer = bytearray()
+        self._eof = False
+        self._closed = threading.Event()
+
+    def feed(self, chunk: bytes) -> bool:
+        """
+        The feed function queues a chunk if there is room for it, it never blocks.
+
+        :param self: Represent the instance of the class
+        :param chunk: bytes: The chunk
+        :return: True if the chunk was queued or the reader is closed, False if the queue is full
+        """
+        if self._closed.is_set():
+            return True
+        try:
+            self._queue.put_nowait(chunk)
+        except queue.Full:
+            return False
+        return True
+
+    def put(self, chunk):
+        """
+        The put function queues a chunk, waiting for room until the reader is closed. None marks the end of the data.
+
+        :param self: Represent the instance of the class
+        :param chunk: The chunk, None or an exception to raise in the reader
+        :return: None
+        """
+        while not self._closed.is_set():
+            try:
+                self._queue.put(chunk, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def fail(self, err: BaseException):
+        """
+        The fail function makes the next read raise err, so the reader gives up on the data.
+
+        :param self: Represent the instance of the class
+        :param err: BaseException: The error to raise
+        :return: None
+        """
+        if not self._closed.is_set():
+            self.put(err)
+
+    def close(self):
+        """
+        The close function stops accepting chunks, it is called once the reader is done.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        self._closed.set()
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            try:
+                chunk = self._queue.get(timeout=self.timeout)
+            except queue.Empty:
+                raise TimeoutError("No data received")
+            if chunk is None:
+                self._eof = True
+            elif isinstance(chunk, BaseException):
+                raise ValueError("Upload aborted") from chunk
+            else:
+                self._buffer += chunk
+        size = len(self._buffer) if size < 0 else min(size, len(self._buffer))
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+class MediaStorage:
+    """
+    Async facade over the configured storage backend (see src.services.storage).
+
+    Every blocking call runs in a dedicated thread pool of MEDIA_WORKERS threads, so a slow upload
+    never blocks the event loop. At most MEDIA_WORKERS + MEDIA_QUEUE_SIZE calls may be in flight;
+    a call over that limit is rejected with 503 instead of queueing without bound.
+    A call that does not finish in MEDIA_TIMEOUT seconds is answered with 504, its thread keeps
+    its slot until the backend returns, so a hanging backend cannot be flooded with more work.
+    """
+
+    def __init__(self, backend: StorageBackend, workers: int = settings.MEDIA_WORKERS,
+                 queue_size: int = settings.MEDIA_QUEUE_SIZE, timeout: float = settings.MEDIA_TIMEOUT):
+        self.backend = backend
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="media")
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def _submit(self, func, *args, **kwargs) -> Future:
+        """
+        The _submit function starts a blocking backend call in the media thread pool if there is a free slot.
+
+        :param self: Represent the instance of the class
+        :param func: The blocking function to call
+        :param args: Positional arguments of the call
+        :param kwargs: Keyword arguments of the call
+        :return: The future of the call
+        """
+        if not self._slots.acquire(blocking=False):
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=messages.MEDIA_BUSY,
+                                headers={"Retry-After": "1"})
+        try:
+            future = self._executor.submit(partial(func, *args, **kwargs))
+        except RuntimeError:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    async def _wait(self, future: Future):
+        """
+        The _wait function waits for a backend call without blocking the loop.
+
+        :param self: Represent the instance of the class
+        :param future: Future: The future returned by _submit
+        :return: The result of the call
+        """
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=messages.MEDIA_TIMEOUT)
+        except ValueError as err:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(err))
+
+    async def _run(self, func, *args, **kwargs):
+        """
+        The _run function runs a blocking backend call in the media thread pool and waits for it without blocking the loop.
+
+        :param self: Represent the instance of the class
+        :param func: The blocking function to call
+        :param args: Positional arguments of the call
+        :param kwargs: Keyword arguments of the call
+        :return: The result of the call
+        """
+        return await self._wait(self._submit(func, *args, **kwargs))
+
+    async def put(self, file, public_id: str, **options) -> dict:
+        """
+        The put function stores a file or bytes under the given public id.
+
+        :param self: Represent the instance of the class
+        :param file: A file-like object, bytes or a memoryview
+        :param public_id: str: The id of the stored image
+        :param options: Extra upload options of the backend
+        :return: The upload result with public_id and version
+        """
+        return await self._run(self.backend.put, file, public_id, **options)
+
+    async def put_stream(self, chunks: AsyncIterator[bytes], public_id: str, size: int, **options) -> dict:
+        """
+        The put_stream function stores an image that arrives in chunks, e.g. the body of a request,
+        without holding the whole image in memory. The backend reads the chunks from a bounded queue
+        in the media thread pool while they are received. When the chunks fail, e.g. because an upload
+        is too large, the backend call is aborted with the same error.
+
+        :param self: Represent the instance of the class
+        :param chunks: AsyncIterator[bytes]: The content of the image
+        :param public_id: str: The id of the stored image
+        :param size: int: The total size of the image in bytes
+        :param options: Extra upload options of the backend
+        :return: The upload result with public_id and version
+        """
+        reader = ChunkReader(settings.UPLOAD_QUEUE_SIZE, self.timeout)
+        future = self._submit(self.backend.put_stream, reader, public_id, size, **options)
+        future.add_done_callback(lambda _: reader.close())
+        try:
+            async for chunk in chunks:
+                if future.done():
+                    break
+                if not reader.feed(chunk):
+                    await asyncio.to_thread(reader.put, chunk)
+            if not reader.feed(None):
+                await asyncio.to_thread(reader.put, None)
+        except BaseException as err:
+            if not reader.feed(err):
+                # the queue is full, wait for the backend to take a chunk or to give up in a thread, not on the loop
+                asyncio.get_running_loop().run_in_executor(None, reader.fail, err)
+            raise
+        return await self._wait(future)
+
+    async def delete(self, public_id: str) -> dict:
+        """
+        The delete function removes an image from the storage.
+
+        :param self: Represent the instance of the class
+        :param public_id: str: The id of the stored image
+        :return: The result of the removal
+        """
+        return await self._run(self.backend.delete, public_id)
+
+    async def info(self, public_id: str) -> dict:
+        """
+        The info function returns the stored details of an image, e.g. its secure_url.
+
+        :param self: Represent the instance of the class
+        :param public_id: str: The id of the stored image
+        :return: A dict of image details
+        """
+        return await self._run(self.backend.info, public_id)
+
+    async def ping(self) -> dict:
+        """
+        The ping function checks the connection to the storage.
+
+        :param self: Represent the instance of the class
+        :return: A dict with the status of the connection
+        """
+        return await self._run(self.backend.ping)
+
+    def url(self, public_id: str, **options) -> str:
+        """
+        The url function builds the delivery url of a stored original.
+        It is computed locally, so it does not go through the thread pool.
+
+        :param self: Represent the instance of the class
+        :param public_id: str: The id of the stored image
+        :param options: Url options, e.g. version
+        :return: The url of the image
+        """
+        return self.backend.url(public_id, **options)
+
+    async def transform(self, public_id: str, transformation: list | None = None, **options) -> str:
+        """
+        The transform function returns the url of a derived rendition of an image.
+        Backends that render on request only build the url, the others render the rendition in the thread pool.
+
+        :param self: Represent the instance of the class
+        :param public_id: str: The id of the stored image
+        :param transformation: list | None: A chain of transformation steps
+        :param options: A single transformation step, e.g. width, height and crop
+        :return: The url of the rendition
+        """
+        if self.backend.renders_on_demand:
+            return self.backend.transform(public_id, transformation, **options)
+        return await self._run(self.backend.transform, public_id, transformation, **options)
+
+    def rendition_size(self, url: str) -> int:
+        """
+        The rendition_size function returns the number of bytes a rendition returned by transform takes in the storage.
+
+        :param self: Represent the instance of the class
+        :param url: str: The url of the rendition
+        :return: The size in bytes, 0 for renditions the backend renders on request
+        """
+        return self.backend.rendition_size(url)
+
+    async def delete_rendition(self, url: str):
+        """
+        The delete_rendition function removes a rendition returned by transform from the storage.
+
+        :param self: Represent the instance of the class
+        :param url: str: The url of the rendition
+        :return: None
+        """
+        await self._run(self.backend.delete_rendition, url)
+
+    def shutdown(self):
+        """
+        The shutdown function stops the thread pool, waits for the running calls to finish and closes the backend.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        self._executor.shutdown(wait=True)
+        self.backend.close()
+
+
+media_storage = MediaStorage(get_storage_backend())
@@ -0,0 +1,125 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from src.conf import messages
+from src.conf.config import settings
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# a hash of a random password with the default cost, verified instead of a real hash when the user is unknown
+DUMMY_HASH = "$2b$12$IQCRYeQjiRQJAxWivQfWEOqeMrXSycWAuaWsaXkDw/JzGj2AlYR22"
+
+
+def hash_password(password: str) -> str:
+    """
+    The hash_password function hashes a password with bcrypt. It runs in a worker process.
+
+    :param password: str: The plain-text password
+    :return: The hash of the password
+    """
+    return pwd_context.hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """
+    The verify_password function checks a plain-text password against a bcrypt hash. It runs in a worker process.
+
+    :param plain_password: str: The plain-text password
+    :param hashed_password: str: The stored hash
+    :return: True if the password matches
+    """
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt in a pool of PASSWORD_WORKERS processes, so a burst of logins costs CPU of the workers
+    instead of freezing the event loop. At most PASSWORD_WORKERS + PASSWORD_QUEUE_SIZE calls may be in flight;
+    a call over that limit is rejected with 503 right away instead of slowing down every endpoint.
+    """
+
+    def __init__(self, workers: int = settings.PASSWORD_WORKERS, queue_size: int = settings.PASSWORD_QUEUE_SIZE):
+        self.workers = workers
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    async def _run(self, func, *args):
+        """
+        The _run function runs a bcrypt call in the process pool if there is a free slot.
+
+        :param self: Represent the instance of the class
+        :param func: The function to call
+        :param args: Arguments of the call
+        :return: The result of the call
+        """
+        if not self._slots.acquire(blocking=False):
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=messages.PASSWORD_BUSY,
+                                headers={"Retry-After": "1"})
+        try:
+            future = self._pool().submit(func, *args)
+        except (RuntimeError, BrokenProcessPool):
+            self._slots.release()
+            with self._lock:
+                self._executor = None
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            # a crashed worker breaks the whole pool, start a new one for the next call
+            with self._lock:
+                self._executor = None
+            raise
+
+    async def hash(self, password: str) -> str:
+        """
+        The hash function hashes a password in the process pool.
+
+        :param self: Represent the instance of the class
+        :param password: str: The plain-text password
+        :return: The hash of the password
+        """
+        return await self._run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str | None) -> bool:
+        """
+        The verify function checks a password in the process pool.
+        Without a hash it verifies against DUMMY_HASH and returns False, so an unknown user
+        takes as long to reject as a wrong password.
+
+        :param self: Represent the instance of the class
+        :param plain_password: str: The plain-text password
+        :param hashed_password: str | None: The stored hash or None if the user is unknown
+        :return: True if the password matches
+        """
+        if hashed_password is None:
+            await self._run(verify_password, plain_password, DUMMY_HASH)
+            return False
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def shutdown(self):
+        """
+        The shutdown function stops the worker processes.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,199 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from redis import RedisError
+from redis.asyncio import Redis
+
+from src.conf.config import settings
+from src.schemas.user import Principal
+
+
+class PrincipalCache:
+    """
+    Two-tier cache of the authenticated principals (see src.schemas.user.Principal), keyed by email.
+
+    The first tier is a per-process LRU of PRINCIPAL_LOCAL_SIZE entries that live PRINCIPAL_LOCAL_TTL seconds,
+    so most requests are authenticated without any network I/O. The second tier is a Redis hash per principal
+    that lives PRINCIPAL_TTL seconds. A change of a user deletes the hash and is published on CHANNEL,
+    every process drops its local entry when it receives the message.
+
+    Together with the principal an entry keeps the ids (jti) of the revoked tokens of the user,
+    stored in Redis as a sorted set scored by the expiry of each token, so a logged out token
+    is rejected from the local tier too and is forgotten when it would have expired anyway.
+    """
+    PREFIX = "principal"
+    CHANNEL = "principal:invalidate"
+
+    def __init__(self, size: int = settings.PRINCIPAL_LOCAL_SIZE, local_ttl: float = settings.PRINCIPAL_LOCAL_TTL,
+                 ttl: int = settings.PRINCIPAL_TTL):
+        self.size = size
+        self.local_ttl = local_ttl
+        self.ttl = ttl
+        self.redis: Redis | None = None
+        self._local: OrderedDict[str, tuple] = OrderedDict()
+        self._listener: asyncio.Task | None = None
+
+    def init(self, redis: Redis):
+        """
+        The init function attaches the cache to the Redis connection opened in main.startup
+        and starts listening for invalidations of the other processes.
+
+        :param self: Represent the instance of the class
+        :param redis: Redis: The asyncio Redis client
+        :return: None
+        """
+        self.redis = redis
+        self._listener = asyncio.create_task(self._listen())
+
+    async def close(self):
+        """
+        The close function stops listening for invalidations.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def _listen(self):
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.CHANNEL)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._local.pop(message["data"].decode(), None)
+            except RedisError as err:
+                # messages may have been missed while disconnected
+                print(err)
+                self._local.clear()
+                await asyncio.sleep(1)
+
+    def _key(self, email: str) -> str:
+        return f"{self.PREFIX}:{email}"
+
+    def _revoked_key(self, email: str) -> str:
+        return f"{self.PREFIX}:{email}:revoked"
+
+    def _remember(self, email: str, principal: Principal, revoked: frozenset):
+        self._local[email] = (time.monotonic() + self.local_ttl, principal, revoked)
+        self._local.move_to_end(email)
+        while len(self._local) > self.size:
+            self._local.popitem(last=False)
+
+    async def get(self, email: str, loader: Callable[[], Awaitable[Principal | None]]) -> tuple:
+        """
+        The get function returns the principal of a user and the ids of its revoked tokens.
+        It reads the local tier first, then the Redis hash together with the revoked ids in one round trip,
+        and calls the loader only if both miss.
+        While Redis is unreachable the principal is loaded from the database and nothing is cached.
+        The revoked ids are not known then, so a logged out access token is accepted until it expires;
+        bans, password resets and password changes still apply, they bump token_version in the database.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email of the user
+        :param loader: Callable[[], Awaitable[Principal | None]]: Loads the principal from the database
+        :return: A tuple of the principal or None and a frozenset of revoked token ids
+        """
+        entry = self._local.get(email)
+        if entry is not None and entry[0] > time.monotonic():
+            self._local.move_to_end(email)
+            return entry[1], entry[2]
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.zrangebyscore(self._revoked_key(email), time.time(), "+inf")
+                pipe.hgetall(self._key(email))
+                revoked, fields = await pipe.execute()
+        except RedisError as err:
+            print(err)
+            return await loader(), frozenset()
+        revoked = frozenset(jti.decode() for jti in revoked)
+        if fields:
+            principal = Principal.model_validate({key.decode(): value.decode() for key, value in fields.items()})
+        else:
+            principal = await loader()
+            if principal is None:
+                return None, revoked
+            mapping = {key: str(int(value) if isinstance(value, bool) else value)
+                       for key, value in principal.model_dump().items() if value is not None}
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.hset(self._key(email), mapping=mapping)
+                    pipe.expire(self._key(email), self.ttl)
+                    await pipe.execute()
+            except RedisError as err:
+                print(err)
+        self._remember(email, principal, revoked)
+        return principal, revoked
+
+    async def revoke(self, email: str, tokens: dict):
+        """
+        The revoke function adds token ids to the revoked tokens of a user and drops its principal in all processes.
+        Ids of expired tokens are removed and the whole set expires with the last of its tokens.
+        While Redis is unreachable the ids are not stored, a logged out refresh token is still rejected
+        because the logout clears the refresh token of the user in the database.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email of the user
+        :param tokens: dict: The expiry timestamps of the revoked tokens by their jti
+        :return: None
+        """
+        key = self._revoked_key(email)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.zadd(key, tokens)
+                pipe.zremrangebyscore(key, "-inf", time.time())
+                pipe.zrange(key, -1, -1, withscores=True)
+                *_, last = await pipe.execute()
+            if last:
+                await self.redis.expireat(key, int(last[0][1]) + 1)
+        except RedisError as err:
+            print(err)
+        await self.invalidate(email)
+
+    async def is_revoked(self, email: str, jti: str) -> bool:
+        """
+        The is_revoked function checks a single token id against Redis, e.g. for a refresh token.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email of the user
+        :param jti: str: The id of the token
+        :return: True if the token is revoked, False if it is not or Redis is unreachable
+        """
+        try:
+            return await self.redis.zscore(self._revoked_key(email), jti) is not None
+        except RedisError as err:
+            # the refresh token is still compared with the one stored for the user
+            print(err)
+            return False
+
+    async def invalidate(self, *emails: str):
+        """
+        The invalidate function drops the principals of the given users in all processes.
+
+        :param self: Represent the instance of the class
+        :param emails: str: The emails of the users
+        :return: None
+        """
+        for email in emails:
+            self._local.pop(email, None)
+        if self.redis is None:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.delete(*[self._key(email) for email in emails])
+                for email in emails:
+                    pipe.publish(self.CHANNEL, email)
+                await pipe.execute()
+        except RedisError as err:
+            print(err)
+
+
+principal_cache = PrincipalCache()
@@ -0,0 +1,124 @@
+import asyncio
+import io
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import qrcode
+from qrcode.constants import ERROR_CORRECT_H, ERROR_CORRECT_L, ERROR_CORRECT_M, ERROR_CORRECT_Q
+
+from src.conf.config import settings
+
+ERROR_CORRECTION = {"L": ERROR_CORRECT_L, "M": ERROR_CORRECT_M, "Q": ERROR_CORRECT_Q, "H": ERROR_CORRECT_H}
+
+
+def render_qr(data: str, error_correction: str = "M") -> bytes:
+    """
+    The render_qr function encodes data as a QR code PNG. It runs in a worker process.
+    Nothing else references the buffer, so BytesIO.getvalue returns it without a copy. The PNG is still copied
+    when it is pickled back to the parent process and once more when the parent unpickles it.
+
+    :param data: str: The text to encode, usually a url
+    :param error_correction: str: The error correction level, L, M, Q or H
+    :return: The PNG bytes
+    """
+    qr = qrcode.QRCode(version=None, error_correction=ERROR_CORRECTION[error_correction], box_size=10, border=4)
+    qr.add_data(data)
+    qr.make(fit=True)
+    buffer = io.BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffer)
+    return buffer.getvalue()
+
+
+def render_qr_batch(items: list) -> list:
+    """
+    The render_qr_batch function renders several QR codes in one call, so a batch pays the process round trip once.
+
+    :param items: list: Pairs of data and error correction level
+    :return: The PNG bytes in the order of the items
+    """
+    return [render_qr(data, error_correction) for data, error_correction in items]
+
+
+class QrService:
+    """
+    Renders QR codes in a pool of worker processes, so encoding never runs on the event loop.
+    The PNGs are memoised by data and error correction level in a bounded LRU. Callers get read-only
+    memoryviews of the memoised bytes, so neither a render nor a hit copies a PNG in the parent.
+    """
+
+    def __init__(self, workers: int = settings.QR_WORKERS, memo_size: int = settings.QR_MEMO_SIZE):
+        self.workers = workers
+        self.memo_size = memo_size
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._memo: OrderedDict[tuple, bytes] = OrderedDict()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _recall(self, key: tuple) -> bytes | None:
+        png = self._memo.get(key)
+        if png is not None:
+            self._memo.move_to_end(key)
+        return png
+
+    def _remember(self, key: tuple, png: bytes):
+        self._memo[key] = png
+        self._memo.move_to_end(key)
+        while len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+
+    async def _submit(self, func, *args):
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool(), func, *args)
+        except BrokenProcessPool:
+            # a crashed worker breaks the whole pool, start a new one for the next render
+            with self._lock:
+                self._executor = None
+            raise
+
+    async def render_many(self, data: list, error_correction: str = "M") -> list:
+        """
+        The render_many function returns the QR code PNGs of many texts.
+        The memo misses are split into one chunk per worker process, so all cores render in parallel.
+
+        :param self: Represent the instance of the class
+        :param data: list: The texts to encode
+        :param error_correction: str: The error correction level, L, M, Q or H
+        :return: Memoryviews of the PNGs in the order of data
+        """
+        pngs = {}
+        for item in data:
+            png = self._recall((item, error_correction))
+            if png is not None:
+                pngs[item] = png
+        missing = [(item, error_correction) for item in dict.fromkeys(data) if item not in pngs]
+        if missing:
+            size = -(-len(missing) // self.workers)
+            chunks = [missing[i:i + size] for i in range(0, len(missing), size)]
+            rendered = await asyncio.gather(*[self._submit(render_qr_batch, chunk) for chunk in chunks])
+            for chunk, chunk_pngs in zip(chunks, rendered):
+                for key, png in zip(chunk, chunk_pngs):
+                    self._remember(key, png)
+                    pngs[key[0]] = png
+        return [memoryview(pngs[item]) for item in data]
+
+    def shutdown(self):
+        """
+        The shutdown function stops the worker processes.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+
+qr_service = QrService()
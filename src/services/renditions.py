@@ -0,0 +1,62 @@
+from typing import List
+
+from PIL import Image
+
+from src.conf.config import settings
+from src.database.db import sessionmanager
+from src.repository import renditions as repository_renditions
+from src.services.cache import cache_service
+from src.services.media import media_storage
+
+
+def rendition_formats(formats: List[str] = settings.RENDITION_FORMATS) -> List[str]:
+    """
+    The rendition_formats function returns the formats renditions are made in.
+    Backends that render on request support them all, the local backend only those the installed Pillow can write.
+
+    :param formats: List[str]: The configured formats
+    :return: The usable formats
+    """
+    if media_storage.backend.renders_on_demand:
+        return list(formats)
+    Image.init()
+    return [fmt for fmt in formats if fmt.upper() in Image.SAVE]
+
+
+def rendition_widths(width: int | None, widths: List[int] = settings.RENDITION_WIDTHS) -> List[int]:
+    """
+    The rendition_widths function returns the widths renditions of an image are made in.
+    Widths an image does not reach are replaced by its own width, so no rendition is an enlargement.
+
+    :param width: int | None: The width of the original, None if unknown
+    :param widths: List[int]: The configured widths
+    :return: The widths in ascending order
+    """
+    if width is None:
+        return sorted(widths)
+    smaller = sorted(w for w in widths if w < width)
+    return smaller + [width] if width <= max(widths) else smaller
+
+
+async def render_renditions(post_id: int, image_id: str, width: int | None = None, version=None):
+    """
+    The render_renditions function renders all renditions of the image of a post and records them,
+    replacing the renditions of a previous image. It runs as a job of the renditions queue.
+
+    :param post_id: int: The id of the post
+    :param image_id: str: The public id of the image
+    :param width: int | None: The width of the image, from the upload result
+    :param version: The version of the image, from the upload result
+    :return: None
+    """
+    renditions = []
+    for fmt in rendition_formats():
+        for rendition_width in rendition_widths(width):
+            url = await media_storage.transform(image_id, width=rendition_width, crop="limit", format=fmt,
+                                                version=version)
+            renditions.append({"width": rendition_width, "format": fmt, "url": url})
+    async with sessionmanager.session() as db:
+        unused = await repository_renditions.replace_renditions(post_id, renditions, db)
+    for url in unused:
+        await media_storage.delete_rendition(url)
+    await cache_service.invalidate("post", post_id)
@@ -0,0 +1,255 @@
+import glob
+import hashlib
+import io
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+import cloudinary
+import cloudinary.api
+import cloudinary.uploader
+import cloudinary.utils
+from PIL import Image
+
+from src.conf.cloudinary import configure_cloudinary
+from src.conf.config import settings
+from src.services.transform import FORMAT_EXTENSIONS, TransformEngine, output_format
+
+BASE_DIR = Path(__file__).resolve().parents[2]
+
+
+class StorageBackend:
+    """
+    Interface of a media storage backend. All methods except url are blocking
+    and are called from the media thread pool by MediaStorage.
+    """
+    # True when transform only builds a url and the backend renders it on request,
+    # such renditions are not stored by the app, so their size is 0 and they are never deleted
+    renders_on_demand = False
+
+    def put(self, file, public_id: str, **options) -> dict:
+        raise NotImplementedError
+
+    def put_stream(self, stream, public_id: str, size: int, **options) -> dict:
+        # stream only has read(size), backends that can upload in parts should not read it all at once
+        return self.put(stream.read(), public_id, **options)
+
+    def delete(self, public_id: str) -> dict:
+        raise NotImplementedError
+
+    def info(self, public_id: str) -> dict:
+        raise NotImplementedError
+
+    def ping(self) -> dict:
+        raise NotImplementedError
+
+    def url(self, public_id: str, **options) -> str:
+        raise NotImplementedError
+
+    def transform(self, public_id: str, transformation: list | None = None, **options) -> str:
+        raise NotImplementedError
+
+    def rendition_size(self, url: str) -> int:
+        return 0
+
+    def delete_rendition(self, url: str):
+        pass
+
+    def close(self):
+        pass
+
+
+class CloudinaryStorage(StorageBackend):
+    """
+    Backend that keeps images on Cloudinary. Transformations are encoded in the url and rendered by Cloudinary.
+    """
+    renders_on_demand = True
+
+    def __init__(self):
+        configure_cloudinary()
+
+    def put(self, file, public_id: str, **options) -> dict:
+        return cloudinary.uploader.upload(file, public_id=public_id, **options)
+
+    def put_stream(self, stream, public_id: str, size: int, **options) -> dict:
+        # the chunked upload of the SDK, upload_large, seeks the file to learn its size, a stream cannot seek
+        upload_id = cloudinary.utils.random_public_id()
+        options["public_id"] = public_id
+        offset, result = 0, None
+        chunk = stream.read(settings.UPLOAD_CHUNK_SIZE)
+        while chunk:
+            headers = {"Content-Range": f"bytes {offset}-{offset + len(chunk) - 1}/{size}",
+                       "X-Unique-Upload-Id": upload_id}
+            result = cloudinary.uploader.upload_large_part((Path(public_id).name, chunk), http_headers=headers,
+                                                           **options)
+            offset += len(chunk)
+            chunk = stream.read(settings.UPLOAD_CHUNK_SIZE)
+        return result
+
+    def delete(self, public_id: str) -> dict:
+        return cloudinary.uploader.destroy(public_id)
+
+    def info(self, public_id: str) -> dict:
+        return cloudinary.api.resource(public_id)
+
+    def ping(self) -> dict:
+        return cloudinary.api.ping()
+
+    def url(self, public_id: str, **options) -> str:
+        return cloudinary.CloudinaryImage(public_id).build_url(**options)
+
+    def transform(self, public_id: str, transformation: list | None = None, **options) -> str:
+        if transformation is not None:
+            options["transformation"] = transformation
+        return self.url(public_id, **options)
+
+
+class LocalStorage(StorageBackend):
+    """
+    Backend that keeps images on the local disk under MEDIA_ROOT and serves them from MEDIA_URL,
+    which is either the StaticFiles mount of the app or a CDN prefix in front of the same directory.
+    Originals are stored under originals/, derived renditions under derived/ with a name that is a hash of
+    the original version and the transformation, so every rendition is computed only once.
+    Renditions are rendered by the TransformEngine, which supports the whole TRANSFORMATIONS catalogue.
+    """
+
+    def __init__(self, root: str = settings.MEDIA_ROOT, base_url: str = settings.MEDIA_URL,
+                 workers: int = settings.TRANSFORM_WORKERS):
+        self.root = (BASE_DIR / root).resolve()
+        self.base_url = base_url.rstrip("/")
+        self.engine = TransformEngine(workers)
+
+    def _path(self, *parts: str) -> Path:
+        path = self.root.joinpath(*parts).resolve()
+        if not path.is_relative_to(self.root):
+            raise ValueError(f"Invalid public id: {parts[-1]}")
+        return path
+
+    def _original(self, public_id: str) -> Path | None:
+        stem = self._path("originals", public_id)
+        if stem.parent.is_dir():
+            for path in stem.parent.glob(f"{glob.escape(stem.name)}.*"):
+                return path
+        return None
+
+    def _url(self, path: Path) -> str:
+        return f"{self.base_url}/{path.relative_to(self.root).as_posix()}"
+
+    def put(self, file, public_id: str, **options) -> dict:
+        return self.put_stream(io.BytesIO(file) if isinstance(file, (bytes, bytearray, memoryview)) else file, public_id, None,
+                               **options)
+
+    def put_stream(self, stream, public_id: str, size: int | None, **options) -> dict:
+        stem = self._path("originals", public_id)
+        stem.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = stem.with_name(f".{stem.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp_path, "wb") as tmp_file:
+                shutil.copyfileobj(stream, tmp_file, settings.UPLOAD_CHUNK_SIZE)
+            try:
+                with Image.open(tmp_path) as image:
+                    image_format, width, height = image.format.lower(), image.width, image.height
+            except (OSError, SyntaxError):
+                raise ValueError("Unsupported image file")
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        previous = self._original(public_id)
+        path = stem.with_name(f"{stem.name}.{image_format}")
+        os.replace(tmp_path, path)
+        if previous is not None and previous != path:
+            previous.unlink(missing_ok=True)
+        version = int(time.time())
+        return {"public_id": public_id, "version": version, "format": image_format, "width": width,
+                "height": height, "bytes": path.stat().st_size, "secure_url": self._url(path)}
+
+    def delete(self, public_id: str) -> dict:
+        path = self._original(public_id)
+        if path is None:
+            return {"result": "not found"}
+        path.unlink(missing_ok=True)
+        return {"result": "ok"}
+
+    def info(self, public_id: str) -> dict:
+        path = self._original(public_id)
+        if path is None:
+            raise ValueError(f"Image {public_id} not found")
+        return {"public_id": public_id, "format": path.suffix[1:], "bytes": path.stat().st_size,
+                "secure_url": self._url(path)}
+
+    def ping(self) -> dict:
+        self.root.mkdir(parents=True, exist_ok=True)
+        return {"status": "ok" if os.access(self.root, os.W_OK) else "error"}
+
+    def url(self, public_id: str, **options) -> str:
+        path = self._original(public_id)
+        if path:
+            url = self._url(path)
+        else:
+            # the url of an image that is not stored yet, e.g. a Qrcode uploaded by a job
+            url = f"{self.base_url}/originals/{public_id}"
+            if options.get("format"):
+                url = f"{url}.{options['format']}"
+        version = options.get("version")
+        return f"{url}?v={version}" if version else url
+
+    def transform(self, public_id: str, transformation: list | None = None, **options) -> str:
+        options.pop("version", None)
+        chain = [step for step in [options, *(transformation or [])] if step]
+        source = self._original(public_id)
+        if source is None:
+            raise ValueError(f"Image {public_id} not found")
+        assets = {}
+        for step in chain:
+            if "overlay" in step:
+                # cloudinary addresses overlays in folders as folder:name
+                overlay = self._original(step["overlay"].replace(":", "/"))
+                if overlay is None:
+                    raise ValueError(f"Overlay {step['overlay']} not found")
+                assets[step["overlay"]] = str(overlay)
+        stat = source.stat()
+        key = hashlib.sha256(json.dumps([public_id, stat.st_mtime_ns, stat.st_size, chain],
+                                        sort_keys=True).encode()).hexdigest()
+        with Image.open(source) as image:
+            extension = FORMAT_EXTENSIONS[output_format(image.format, chain)]
+        path = self._path("derived", key[:2], f"{key}{extension}")
+        self.engine.render(str(source), chain, str(path), assets)
+        return self._url(path)
+
+    def _rendition(self, url: str) -> Path | None:
+        prefix = f"{self.base_url}/derived/"
+        return self._path(url[len(self.base_url) + 1:]) if url.startswith(prefix) else None
+
+    def rendition_size(self, url: str) -> int:
+        path = self._rendition(url)
+        return path.stat().st_size if path and path.exists() else 0
+
+    def delete_rendition(self, url: str):
+        path = self._rendition(url)
+        if path:
+            path.unlink(missing_ok=True)
+
+    def close(self):
+        self.engine.shutdown()
+
+
+STORAGE_BACKENDS = {
+    "cloudinary": CloudinaryStorage,
+    "local": LocalStorage,
+}
+
+
+def get_storage_backend(name: str = settings.MEDIA_BACKEND) -> StorageBackend:
+    """
+    The get_storage_backend function creates the media storage backend configured in settings.MEDIA_BACKEND.
+
+    :param name: str: The name of the backend, cloudinary or local
+    :return: A storage backend
+    """
+    try:
+        return STORAGE_BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown media backend: {name}")
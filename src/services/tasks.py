@@ -0,0 +1,103 @@
+import uuid
+from typing import List
+
+from src.conf.config import settings
+from src.database.db import sessionmanager
+from src.repository import derived
+from src.repository import outbox as repository_outbox
+from src.repository import users as repository_users
+from src.services.email import email_sender
+from src.services.gravatar import gravatar_resolver
+from src.services.jobs import job_queue
+from src.services.media import media_storage
+from src.services.qr import qr_service
+from src.services.renditions import render_renditions
+
+# The jobs of the job queue. main and worker.py import this module, so both processes know every job by name.
+
+job_queue.register(render_renditions, queue="renditions")
+
+
+@job_queue.task(queue="media")
+async def delete_media(public_ids: List[str]):
+    """
+    The delete_media function removes images from the media storage.
+
+    :param public_ids: List[str]: The ids of the stored images
+    :return: None
+    """
+    for public_id in public_ids:
+        await media_storage.delete(public_id)
+
+
+@job_queue.task(queue="media")
+async def delete_renditions(urls: List[str]):
+    """
+    The delete_renditions function removes renditions returned by media_storage.transform from the storage.
+
+    :param urls: List[str]: The urls of the renditions
+    :return: None
+    """
+    for url in urls:
+        await media_storage.delete_rendition(url)
+
+
+@job_queue.task(queue="media")
+async def upload_qrcodes(items: List[dict]):
+    """
+    The upload_qrcodes function renders Qrcodes and stores them under the public ids their urls were built from.
+    Items with an asset_key are recorded as derived assets of their image_id once they are stored.
+
+    :param items: List[dict]: The Qrcodes, each with data, public_id, url and optionally asset_key and image_id
+    :return: None
+    """
+    pngs = await qr_service.render_many([item["data"] for item in items])
+    for item, png in zip(items, pngs):
+        await media_storage.put(png, item["public_id"], overwrite=True)
+    assets = [(item, png) for item, png in zip(items, pngs) if item.get("asset_key")]
+    if assets:
+        async with sessionmanager.session() as db:
+            for item, png in assets:
+                await derived.add_asset(item["asset_key"], item["image_id"], derived.QRCODE, item["url"],
+                                        item["public_id"], len(png), db)
+
+
+@job_queue.task(queue="email")
+async def deliver_emails():
+    """
+    The deliver_emails function sends the due emails of the outbox in batches of EMAIL_BATCH_SIZE.
+    Failed emails are due again after a backoff, a delayed delivery is scheduled for the earliest of them.
+
+    :return: None
+    """
+    async with sessionmanager.session() as db:
+        while True:
+            emails = await repository_outbox.claim_emails(db)
+            if not emails:
+                return
+            sent, errors = await email_sender.send_batch(emails)
+            await repository_outbox.mark_sent(sent, db)
+            await repository_outbox.mark_failed(errors, db)
+            attempts = {email.id: email.attempts for email in emails}
+            retries = [backoff for email_id, (_, backoff) in errors.items()
+                       if attempts[email_id] < settings.EMAIL_MAX_ATTEMPTS]
+            if retries:
+                await job_queue.enqueue("deliver_emails", key="deliver_emails:retry", delay=min(retries))
+            if len(emails) < settings.EMAIL_BATCH_SIZE:
+                return
+
+
+@job_queue.task(queue="media")
+async def resolve_avatar(user_id: str, email: str):
+    """
+    The resolve_avatar function sets the Gravatar of a new user as its avatar, if the email has one.
+
+    :param user_id: str: The id of the user
+    :param email: str: The email of the user
+    :return: None
+    """
+    url = await gravatar_resolver.resolve(email)
+    if url is None:
+        return
+    async with sessionmanager.session() as db:
+        await repository_users.set_resolved_avatar(uuid.UUID(user_id), url, db)
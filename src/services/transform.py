@@ -0,0 +1,221 @@
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image, ImageChops, ImageEnhance, ImageFilter, ImageOps
+
+# This module is imported by the worker processes, keep it free of application imports.
+
+# where the subject of a photo usually is, used for gravity "face" and pixelate_faces,
+# the engine has no face detector
+FACE_CENTERING = (0.5, 0.35)
+FORMAT_EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp", "AVIF": ".avif"}
+# values of the format option of a step, as in cloudinary urls
+OUTPUT_FORMATS = {"jpg": "JPEG", "jpeg": "JPEG", "png": "PNG", "webp": "WEBP", "avif": "AVIF"}
+
+
+def output_format(source_format: str, chain: list) -> str:
+    """
+    The output_format function picks the format a rendition is saved in.
+    A format option of a step wins, steps that produce transparency need PNG,
+    otherwise the format of the original is kept if it is a web format.
+
+    :param source_format: str: The Pillow format of the original, e.g. JPEG
+    :param chain: list: The transformation steps
+    :return: A Pillow format name
+    """
+    for step in reversed(chain):
+        if "format" in step:
+            if step["format"] not in OUTPUT_FORMATS:
+                raise ValueError(f"Format {step['format']} is not supported")
+            return OUTPUT_FORMATS[step["format"]]
+    if any("opacity" in step or "overlay" in step for step in chain):
+        return "PNG"
+    return source_format if source_format in FORMAT_EXTENSIONS else "PNG"
+
+
+def _resize(image: Image.Image, width, height, crop: str, gravity: str | None) -> Image.Image:
+    if not (width or height):
+        return image
+    size = (width or round(image.width * height / image.height),
+            height or round(image.height * width / image.width))
+    centering = FACE_CENTERING if gravity == "face" else (0.5, 0.5)
+    if crop in ("fill", "thumb", "crop"):
+        return ImageOps.fit(image, size, centering=centering)
+    if crop == "pad":
+        return ImageOps.pad(image, size, centering=centering)
+    if crop == "fit":
+        return ImageOps.contain(image, size)
+    if crop == "limit":
+        # like fit, but never enlarges
+        return image if image.width <= size[0] and image.height <= size[1] else ImageOps.contain(image, size)
+    return image.resize(size)
+
+
+def _art(image: Image.Image, style: str) -> Image.Image:
+    image = ImageEnhance.Color(image).enhance(1.4)
+    return ImageEnhance.Contrast(image).enhance(1.2)
+
+
+def _vignette(image: Image.Image, strength: str) -> Image.Image:
+    strength = int(strength or 20)
+    mask = Image.radial_gradient("L").resize(image.size)
+    mask = mask.point(lambda value: min(255, value * strength // 40))
+    return Image.composite(Image.new(image.mode, image.size, "black"), image, mask)
+
+
+def _pixelate(image: Image.Image, size: str) -> Image.Image:
+    size = max(1, int(size or 10))
+    small = image.resize((max(1, image.width // size), max(1, image.height // size)), Image.Resampling.NEAREST)
+    return small.resize(image.size, Image.Resampling.NEAREST)
+
+
+def _pixelate_faces(image: Image.Image, size: str) -> Image.Image:
+    # without a face detector the region around FACE_CENTERING is pixelated
+    width, height = image.width // 2, image.height // 2
+    left = round((image.width - width) * FACE_CENTERING[0])
+    top = round((image.height - height) * FACE_CENTERING[1])
+    box = (left, top, left + width, top + height)
+    image = image.copy()
+    image.paste(_pixelate(image.crop(box), size), box)
+    return image
+
+
+def _cartoonify(image: Image.Image, argument: str) -> Image.Image:
+    flat = ImageOps.posterize(image.convert("RGB").filter(ImageFilter.SMOOTH_MORE), 3)
+    edges = image.convert("L").filter(ImageFilter.FIND_EDGES)
+    edges = ImageOps.invert(edges).point(lambda value: 255 if value > 200 else 0).convert("RGB")
+    result = ImageChops.multiply(flat, edges)
+    return result.convert(image.mode) if image.mode != "RGB" else result
+
+
+EFFECTS = {
+    "art": _art,
+    "vignette": _vignette,
+    "pixelate": _pixelate,
+    "pixelate_faces": _pixelate_faces,
+    "cartoonify": _cartoonify,
+}
+
+
+def apply_step(image: Image.Image, step: dict, assets: dict) -> Image.Image:
+    """
+    The apply_step function renders one Cloudinary style transformation step.
+    Supported keys are width, height, crop, gravity, angle, effect, overlay and opacity.
+    The format key is accepted too, it is applied by render.
+
+    :param image: Image.Image: The image to transform
+    :param step: dict: The transformation options
+    :param assets: dict: Paths of the overlay images by overlay id
+    :return: The transformed image
+    """
+    step = dict(step)
+    width, height = step.pop("width", None), step.pop("height", None)
+    crop, gravity = step.pop("crop", "scale"), step.pop("gravity", None)
+    angle, effect = step.pop("angle", None), step.pop("effect", None)
+    overlay, opacity = step.pop("overlay", None), step.pop("opacity", None)
+    step.pop("format", None)
+    if step:
+        raise ValueError(f"Transformation {', '.join(step)} is not supported")
+    image = _resize(image, width, height, crop, gravity)
+    if angle:
+        image = image.rotate(-angle, expand=True)
+    if effect:
+        name, _, argument = effect.partition(":")
+        if name not in EFFECTS:
+            raise ValueError(f"Effect {name} is not supported")
+        image = EFFECTS[name](image, argument)
+    if overlay:
+        with Image.open(assets[overlay]) as layer:
+            layer = ImageOps.contain(layer.convert("RGBA"), image.size)
+            image = image.convert("RGBA")
+            image.alpha_composite(layer, ((image.width - layer.width) // 2, (image.height - layer.height) // 2))
+    if opacity is not None:
+        image = image.convert("RGBA")
+        image.putalpha(image.getchannel("A").point(lambda value: value * int(opacity) // 100))
+    return image
+
+
+def render(source: str, chain: list, target: str, assets: dict) -> str:
+    """
+    The render function applies a chain of transformation steps to an original and saves the result.
+    It runs in a worker process and writes the file atomically, so a reader never sees a partial rendition.
+
+    :param source: str: The path of the original
+    :param chain: list: The transformation steps
+    :param target: str: The path of the rendition
+    :param assets: dict: Paths of the overlay images by overlay id
+    :return: The path of the rendition
+    """
+    with Image.open(source) as image:
+        image_format = output_format(image.format, chain)
+        image = image.convert("RGBA" if "A" in image.getbands() or image.mode == "P" else "RGB")
+        for step in chain:
+            image = apply_step(image, step, assets)
+    if image_format == "JPEG":
+        image = image.convert("RGB")
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_target = f"{target}.{uuid.uuid4().hex}.tmp"
+    image.save(tmp_target, format=image_format)
+    os.replace(tmp_target, target)
+    return target
+
+
+class TransformEngine:
+    """
+    Renders transformation chains in a pool of worker processes, so CPU heavy filters
+    never hold the GIL of the application process. Concurrent requests for the same rendition share one render.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._pending: dict[str, Future] = {}
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def render(self, source: str, chain: list, target: str, assets: dict | None = None) -> str:
+        """
+        The render function returns the path of a rendition, rendering it in the process pool if it does not exist yet.
+        It blocks the calling thread until the rendition is ready.
+
+        :param self: Represent the instance of the class
+        :param source: str: The path of the original
+        :param chain: list: The transformation steps
+        :param target: str: The path of the rendition
+        :param assets: dict | None: Paths of the overlay images by overlay id
+        :return: The path of the rendition
+        """
+        if os.path.exists(target):
+            return target
+        with self._lock:
+            future = self._pending.get(target)
+            if future is None:
+                future = self._pool().submit(render, source, chain, target, assets or {})
+                self._pending[target] = future
+                future.add_done_callback(lambda _: self._pending.pop(target, None))
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            # a crashed worker breaks the whole pool, start a new one for the next render
+            with self._lock:
+                self._executor = None
+            raise
+
+    def shutdown(self):
+        """
+        The shutdown function stops the worker processes.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
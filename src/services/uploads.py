@@ -0,0 +1,149 @@
+import hashlib
+from typing import AsyncIterator, BinaryIO
+
+from fastapi import HTTPException, Request, UploadFile, status
+
+from src.conf import messages
+from src.conf.config import settings
+from src.services.media import media_storage
+
+# enough bytes to tell every supported type apart
+SNIFF_SIZE = 12
+
+
+def sniff_mime(head: bytes) -> str | None:
+    """
+    The sniff_mime function detects the type of an image from its first bytes, the declared content type is not trusted.
+
+    :param head: bytes: The first SNIFF_SIZE bytes of the file
+    :return: The MIME type or None if the type is unknown
+    """
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def check_mime(head: bytes, mime_types: list = settings.UPLOAD_MIME_TYPES) -> str:
+    """
+    The check_mime function rejects a file whose first bytes are not of an allowed type.
+
+    :param head: bytes: The first bytes of the file
+    :param mime_types: list: The allowed MIME types
+    :return: The MIME type
+    """
+    mime = sniff_mime(head)
+    if mime not in mime_types:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=messages.UPLOAD_UNSUPPORTED_TYPE)
+    return mime
+
+
+def check_size(size: int | None, max_size: int = settings.UPLOAD_MAX_SIZE):
+    """
+    The check_size function rejects a file larger than max_size.
+
+    :param size: int | None: The size of the file in bytes, None if unknown
+    :param max_size: int: The largest allowed size in bytes
+    :return: None
+    """
+    if size is not None and size > max_size:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=messages.UPLOAD_TOO_LARGE)
+
+
+async def check_upload_file(file: UploadFile) -> UploadFile:
+    """
+    The check_upload_file function applies the size limit and the type check to a multipart file
+    before it is handed to the storage.
+
+    :param file: UploadFile: The uploaded file
+    :return: The file, positioned at its start
+    """
+    check_size(file.size)
+    check_mime(await file.read(SNIFF_SIZE))
+    await file.seek(0)
+    return file
+
+
+def file_sha256(file: BinaryIO, chunk_size: int = settings.UPLOAD_CHUNK_SIZE) -> str:
+    """
+    The file_sha256 function computes the sha256 of a file chunk by chunk, it blocks and runs in a thread.
+
+    :param file: BinaryIO: The file, read from its start and positioned at its start again afterwards
+    :param chunk_size: int: The size of the chunks read
+    :return: The hex digest of the content
+    """
+    digest = hashlib.sha256()
+    file.seek(0)
+    while chunk := file.read(chunk_size):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+class UploadStream:
+    """
+    Reads the body of a request as it arrives. The size limit is enforced from the Content-Length header
+    and again while reading, the type is checked from the first bytes and the sha256 of the content
+    is computed on the fly, so nothing is buffered beyond the chunk in hand.
+    """
+
+    def __init__(self, request: Request, max_size: int = settings.UPLOAD_MAX_SIZE):
+        length = request.headers.get("content-length")
+        if length is None or not length.isdigit():
+            raise HTTPException(status_code=status.HTTP_411_LENGTH_REQUIRED, detail=messages.UPLOAD_LENGTH_REQUIRED)
+        self.size = int(length)
+        check_size(self.size, max_size)
+        self.request = request
+        self.max_size = max_size
+        self.received = 0
+        self.mime: str | None = None
+        self._hash = hashlib.sha256()
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        """
+        The chunks function yields the body of the request chunk by chunk.
+
+        :param self: Represent the instance of the class
+        :return: An async iterator of chunks
+        """
+        head = b""
+        async for chunk in self.request.stream():
+            self.received += len(chunk)
+            check_size(self.received, self.max_size)
+            if self.mime is None:
+                head += chunk
+                if len(head) < SNIFF_SIZE:
+                    continue
+                self.mime = check_mime(head)
+                chunk, head = head, b""
+            if chunk:
+                self._hash.update(chunk)
+                yield chunk
+        if self.mime is None:
+            self.mime = check_mime(head)
+            self._hash.update(head)
+            yield head
+
+
+async def stream_upload(request: Request, public_id: str, **options) -> dict:
+    """
+    The stream_upload function stores the body of a request in the media storage while it is received.
+    Memory use does not depend on the size of the file.
+
+    :param request: Request: The request with the image as its body
+    :param public_id: str: The id of the stored image
+    :param options: Extra upload options of the backend
+    :return: The upload result with an extra sha256 key, the hex digest of the content
+    """
+    upload = UploadStream(request)
+    result = await media_storage.put_stream(upload.chunks(), public_id, upload.size, **options)
+    return {**result, "sha256": upload.sha256}
@@ -0,0 +1,148 @@
+import asyncio
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from fastapi_limiter.depends import RateLimiter
+from sqlalchemy import UUID, event
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.pool import NullPool
+
+import main
+from src.database.db import get_db, sessionmanager
+from src.entity.models import Base, Comment, Post, Rating, Tag, TagToPost, User, UserType
+from src.services.auth import auth_service
+
+
+# the models are written for PostgreSQL, SQLite stores these types as text and to_tsvector returns its input
+@compiles(TSVECTOR, "sqlite")
+def compile_tsvector(type_, compiler, **kw):
+    return "TEXT"
+
+
+@compiles(UUID, "sqlite")
+def compile_uuid(type_, compiler, **kw):
+    return "CHAR(32)"
+
+
+class Statements(list):
+    """
+    The SQL statements executed since the last reset and the number of rows each of them returned,
+    collected by an after_cursor_execute listener.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.rows = []
+
+    def reset(self):
+        self.clear()
+        self.rows.clear()
+
+    def touching(self, table: str) -> list:
+        return [statement for statement in self if f"FROM {table} " in statement or f"JOIN {table} " in statement]
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}", poolclass=NullPool)
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def register_functions(dbapi_connection, connection_record):
+        dbapi_connection.create_function("to_tsvector", 2, lambda config, text: text, deterministic=True)
+
+    async def create_all():
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+    asyncio.run(create_all())
+    yield engine
+    asyncio.run(engine.dispose())
+
+
+@pytest.fixture
+def session_maker(engine, monkeypatch):
+    session_maker = async_sessionmaker(engine, expire_on_commit=True)
+    monkeypatch.setattr(sessionmanager, "_session_maker", session_maker)
+    return session_maker
+
+
+@pytest.fixture
+def statements(engine):
+    collected = Statements()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def collect(conn, cursor, statement, parameters, context, executemany):
+        collected.append(statement)
+        # the aiosqlite adapter fetches the whole result on execute, rowcount is -1 for a SELECT
+        collected.rows.append(len(cursor._rows) if cursor.description else max(cursor.rowcount, 0))
+
+    return collected
+
+
+@pytest.fixture
+def users(session_maker):
+    """
+    An admin and 30 users, the first of them is the current user.
+    """
+    async def create():
+        async with session_maker() as db:
+            db.add_all([UserType(id=1, type="User"), UserType(id=2, type="Moderator"), UserType(id=3, type="Admin")])
+            users = [User(id=uuid.uuid4(), username=f"user{i}", email=f"user{i}@example.com", password="secret",
+                          avatar="avatar", user_type_id=3 if i == 0 else 1, confirmed=True) for i in range(31)]
+            ids = [user.id for user in users]
+            db.add_all(users)
+            await db.commit()
+            return ids
+
+    return asyncio.run(create())
+
+
+@pytest.fixture
+def post(session_maker, users):
+    """
+    A post of the admin with 5 tags, 20 comments and 30 ratings.
+    """
+    async def create():
+        async with session_maker() as db:
+            db.add(Post(id=1, name="post", content="content", image_url="url", image_id="image", user_id=users[0]))
+            db.add_all([Tag(id=i + 1, name=f"tag{i}") for i in range(5)])
+            await db.flush()
+            db.add_all([TagToPost(post_id=1, tag_id=i + 1) for i in range(5)])
+            db.add_all([Comment(content=f"comment{i}", post_id=1, user_id=users[0]) for i in range(20)])
+            db.add_all([Rating(value=i % 5 + 1, post_id=1, user_id=users[i + 1]) for i in range(30)])
+            await db.commit()
+        return 1
+
+    return asyncio.run(create())
+
+
+@pytest.fixture
+def current_user(users):
+    return {"id": users[0]}
+
+
+@pytest.fixture
+def client(session_maker, current_user):
+    async def override_db():
+        async with session_maker() as db:
+            yield db
+
+    async def override_user():
+        async with session_maker() as db:
+            return await db.get(User, current_user["id"])
+
+    async def no_limit():
+        return None
+
+    overrides = {get_db: override_db, auth_service.get_current_user: override_user}
+    for route in main.app.routes:
+        for dependency in getattr(route, "dependencies", None) or []:
+            if isinstance(dependency.dependency, RateLimiter):
+                overrides[dependency.dependency] = no_limit
+    main.app.dependency_overrides.update(overrides)
+    # not entered as a context manager, so the startup of main does not connect to Redis
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
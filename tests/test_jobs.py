@@ -0,0 +1,124 @@
+import asyncio
+import json
+
+import fakeredis
+from sqlalchemy import update
+
+from src.conf.config import settings
+from src.entity.models import StoredJob
+from src.services.jobs import JobQueue
+
+
+class Flaky:
+    """
+    A job that fails on its first failures calls.
+    """
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = []
+
+    async def __call__(self, *args):
+        self.calls.append(args)
+        if len(self.calls) <= self.failures:
+            raise RuntimeError(f"failure {len(self.calls)}")
+
+
+def queue_with(job: Flaky, redis=None) -> JobQueue:
+    queue = JobQueue()
+    queue.init(redis or fakeredis.FakeAsyncRedis())
+    job.__name__ = "flaky"
+    queue.register(job, "test", max_attempts=3)
+    return queue
+
+
+async def run_next(queue: JobQueue) -> bool:
+    """
+    Runs the next ready job, after making every delayed retry due.
+    """
+    delayed = await queue.redis.zrange(queue._delayed("test"), 0, -1)
+    if delayed:
+        await queue.redis.zadd(queue._delayed("test"), {raw: 0 for raw in delayed})
+        await queue._promote("test")
+    raw = await queue.redis.rpop(queue._ready("test"))
+    if raw is None:
+        return False
+    await queue._run(raw)
+    return True
+
+
+def test_retry_until_success():
+    job = Flaky(failures=2)
+
+    async def run():
+        queue = queue_with(job)
+        await queue.enqueue("flaky", 1, key="once")
+        assert await queue.enqueue("flaky", 1, key="once") is None
+        while await run_next(queue):
+            pass
+        assert await queue.redis.exists(queue._key("once")) == 0
+        assert await queue.dead_letters() == []
+
+    asyncio.run(run())
+    assert job.calls == [(1,), (1,), (1,)]
+
+
+def test_dead_letter_after_max_attempts():
+    job = Flaky(failures=10)
+
+    async def run():
+        queue = queue_with(job)
+        await queue.enqueue("flaky", 1, key="once")
+        while await run_next(queue):
+            pass
+        dead = await queue.dead_letters()
+        assert [(job["name"], job["attempts"], job["error"]) for job in dead] == [
+            ("flaky", 3, repr(RuntimeError("failure 3")))]
+        # the key is released with the dead letter, so the job can be enqueued again
+        assert await queue.enqueue("flaky", 1, key="once") is not None
+
+    asyncio.run(run())
+    assert len(job.calls) == 3
+
+
+def test_backoff_is_capped():
+    assert settings.JOB_BACKOFF_BASE / 2 <= JobQueue.backoff(1) <= settings.JOB_BACKOFF_BASE
+    assert settings.JOB_BACKOFF_MAX / 2 <= JobQueue.backoff(100) <= settings.JOB_BACKOFF_MAX
+
+
+def test_stored_while_redis_is_down(session_maker):
+    job = Flaky(failures=0)
+
+    async def run():
+        queue = queue_with(job, fakeredis.FakeAsyncRedis(connected=False))
+        await queue.enqueue_or_store("flaky", 1, key="once")
+        await queue.enqueue_many_or_store("flaky", [(2,), (3,)])
+        queue.init(fakeredis.FakeAsyncRedis())
+        assert await queue.restore() == 3
+        assert await queue.restore() == 0
+        ready = await queue.redis.lrange(queue._ready("test"), 0, -1)
+        assert sorted(json.loads(raw)["args"] for raw in ready) == [[1], [2], [3]]
+
+    asyncio.run(run())
+
+
+def test_unknown_stored_job_is_dead_lettered(session_maker):
+    job = Flaky(failures=0)
+
+    async def run():
+        queue = queue_with(job, fakeredis.FakeAsyncRedis(connected=False))
+        await queue.enqueue_or_store("flaky", 1)
+        await queue.enqueue_or_store("flaky", 2)
+        await queue.enqueue_or_store("flaky", 3)
+        queue.init(fakeredis.FakeAsyncRedis())
+        # the second job was removed from the code while it was stored
+        async with session_maker() as db:
+            await db.execute(update(StoredJob).where(StoredJob.id == 2).values(name="removed"))
+            await db.commit()
+        assert await queue.restore() == 2
+        assert await queue.restore() == 0
+        ready = await queue.redis.lrange(queue._ready("test"), 0, -1)
+        assert sorted(json.loads(raw)["args"] for raw in ready) == [[1], [3]]
+        assert [(job["name"], job["args"]) for job in await queue.dead_letters()] == [("removed", [2])]
+
+    asyncio.run(run())
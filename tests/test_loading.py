@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from src.entity.models import Comment, PhotoUrl, Rating
+
+POST_FIELDS = {"id", "name", "content", "created_at", "updated_at", "image_url", "rating", "user", "tags", "srcset"}
+TAGS = [{"id": i + 1, "name": f"tag{i}"} for i in range(5)]
+
+
+@pytest.fixture
+def crowded_post(session_maker, post, users):
+    """
+    The post with 5 tags, 200 comments, 500 ratings and 5 transformed images.
+    """
+    async def create():
+        async with session_maker() as db:
+            db.add_all([Comment(content=f"comment{i}", post_id=post, user_id=users[0]) for i in range(20, 200)])
+            db.add_all([Rating(value=i % 5 + 1, post_id=post, user_id=users[i % 30 + 1]) for i in range(30, 500)])
+            db.add_all([PhotoUrl(transform_url=f"url{i}", post_id=post) for i in range(5)])
+            await db.commit()
+        return post
+
+    return asyncio.run(create())
+
+
+def check_post(post: dict):
+    assert set(post) == POST_FIELDS
+    assert post["id"] == 1
+    assert post["user"]["username"] == "user0"
+    assert sorted(post["tags"], key=lambda tag: tag["id"]) == TAGS
+
+
+@pytest.mark.parametrize("path", [
+    "/api/posts/",
+    "/api/search/by_tag/tag1",
+    "/api/search/by_user/user0",
+    "/api/posts/1",
+])
+def test_post(client, crowded_post, statements, path):
+    statements.reset()
+    response = client.get(path)
+    assert response.status_code == 200
+    body = response.json()
+    if "items" in body:
+        assert len(body["items"]) == 1
+        body = body["items"][0]
+    check_post(body)
+    # the current user, the post with its author, its 5 tags and its renditions,
+    # the 200 comments and 500 ratings are not loaded at all
+    assert len(statements) == 4
+    assert statements.rows == [1, 1, 5, 0]
+    assert not statements.touching("comments")
+    assert not statements.touching("ratings")
+
+
+def test_all_url(client, crowded_post, statements):
+    statements.reset()
+    response = client.get("/api/transformation/show_all_url")
+    assert response.status_code == 200
+    page = response.json()
+    assert [post["name"] for post in page["items"]] == ["post"]
+    assert [image["transform_url"] for image in page["items"][0]["all_images"]] == [f"url{i}" for i in range(5)]
+    # the current user, the post and its 5 images
+    assert len(statements) == 3
+    assert statements.rows == [1, 1, 5]
+    assert not statements.touching("comments")
+    assert not statements.touching("ratings")
+
+
+def test_profile(client, crowded_post, statements):
+    statements.reset()
+    response = client.get("/api/users/user0/profile/")
+    assert response.status_code == 200
+    profile = response.json()
+    assert set(profile) == {"username", "email", "avatar", "comments_count", "posts_count", "created_at"}
+    assert (profile["posts_count"], profile["comments_count"]) == (1, 200)
+    # the user and the two counts, the posts and comments themselves are not loaded
+    assert len(statements) == 3
+    assert statements.rows == [1, 1, 1]
+    assert not statements.touching("ratings")
+
+
+def test_tag(client, crowded_post, statements):
+    statements.reset()
+    response = client.get("/api/tags/tag1")
+    assert response.status_code == 200
+    assert response.json() == {"id": 2, "name": "tag1"}
+    assert len(statements) == 1
+    assert statements.rows == [1]
@@ -0,0 +1,43 @@
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import select
+
+from src.conf.config import settings
+from src.entity.models import OutboxEmail
+from src.repository import outbox as repository_outbox
+
+
+def email(number: int, **fields) -> OutboxEmail:
+    return OutboxEmail(id=number, recipient=f"user{number}@example.com", subject="Confirm your email ",
+                       template="verify_email.html", context={"host": "http://test/", "username": f"user{number}"},
+                       **fields)
+
+
+def test_claim_due_emails(session_maker):
+    async def run():
+        async with session_maker() as db:
+            db.add_all([
+                email(1, next_attempt_at=datetime(2024, 1, 3)),
+                email(2, next_attempt_at=datetime(2024, 1, 1)),
+                email(3, next_attempt_at=datetime(2024, 1, 2)),
+                email(4, next_attempt_at=datetime(2024, 1, 1), sent_at=datetime(2024, 1, 1)),
+                email(5, next_attempt_at=datetime(2024, 1, 1), attempts=settings.EMAIL_MAX_ATTEMPTS),
+                email(6, next_attempt_at=datetime(2999, 1, 1)),
+            ])
+            await db.commit()
+            claimed = await repository_outbox.claim_emails(db, limit=2)
+            # the longest due first, sent, exhausted and future emails are not claimed
+            assert [(row.id, row.attempts, row.recipient) for row in claimed] == [
+                (2, 1, "user2@example.com"), (3, 1, "user3@example.com")]
+
+            await repository_outbox.mark_sent([2], db)
+            await repository_outbox.mark_failed({3: ("SMTPServerDisconnected()", 60)}, db)
+            # next_attempt_at is left out, SQLite has no interval arithmetic to compute the lease with
+            stmt = select(OutboxEmail.id, OutboxEmail.attempts, OutboxEmail.sent_at, OutboxEmail.last_error)
+            rows = {row.id: row for row in await db.execute(stmt)}
+            assert rows[2].sent_at is not None and rows[2].last_error is None
+            assert rows[3].sent_at is None and rows[3].last_error == "SMTPServerDisconnected()"
+            assert [rows[number].attempts for number in (1, 4, 6)] == [0, 0, 0]
+
+    asyncio.run(run())
@@ -0,0 +1,71 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from src.entity.models import Post, TagToPost
+from src.repository.pagination import POSTS_BY_DATE, COMMENTS_BY_DATE, decode_cursor, encode_cursor
+
+
+@pytest.fixture
+def posts(session_maker, post, users):
+    """
+    46 more posts with tag1, two of them at every created_at, so the pages have to break ties by id.
+    """
+    async def create():
+        start = datetime(2024, 1, 1)
+        async with session_maker() as db:
+            db.add_all([Post(id=i, name=f"post{i}", content="content", image_url="url", image_id="image",
+                             user_id=users[0], rating=i % 3, created_at=start + timedelta(minutes=i // 2))
+                        for i in range(2, 48)])
+            await db.flush()
+            db.add_all([TagToPost(post_id=i, tag_id=2) for i in range(2, 48)])
+            await db.commit()
+        return list(range(1, 48))
+
+    return asyncio.run(create())
+
+
+def walk(client, path: str, limit: int, **params) -> list:
+    ids, cursor = [], None
+    while True:
+        response = client.get(path, params={"limit": limit, **params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page["items"]) <= limit
+        ids += [item["id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 1, 1, 12, 30, 15, 123456)
+    assert decode_cursor(encode_cursor([created_at, 42]), POSTS_BY_DATE) == [created_at, 42]
+    comment_id = uuid.uuid4()
+    assert decode_cursor(encode_cursor([created_at, comment_id]), COMMENTS_BY_DATE) == [created_at, comment_id]
+
+
+@pytest.mark.parametrize("cursor", ["garbage!!", encode_cursor([1]), encode_cursor(["not a date", 1])])
+def test_invalid_cursor(cursor):
+    with pytest.raises(HTTPException) as err:
+        decode_cursor(cursor, POSTS_BY_DATE)
+    assert err.value.status_code == 400
+
+
+def test_invalid_cursor_response(client):
+    response = client.get("/api/posts/", params={"cursor": "garbage!!"})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("path, params", [
+    ("/api/posts/", {}),
+    ("/api/search/by_tag/tag1", {}),
+    ("/api/search/by_tag/tag1", {"filter_by_rating": True}),
+    ("/api/search/by_user/user0", {}),
+])
+def test_pages_cover_every_post_once(client, posts, path, params):
+    ids = walk(client, path, 7, **params)
+    assert sorted(ids) == posts
@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+
+from src.entity.models import User
+from src.services.passwords import hash_password
+
+
+@pytest.fixture
+def stored_user(session_maker, users):
+    def read() -> User:
+        async def select():
+            async with session_maker() as db:
+                return await db.get(User, users[0])
+
+        return asyncio.run(select())
+
+    async def set_password():
+        async with session_maker() as db:
+            user = await db.get(User, users[0])
+            user.password = hash_password("secret")
+            user.refresh_token = "refresh"
+            await db.commit()
+
+    asyncio.run(set_password())
+    return read
+
+
+def test_password_change_revokes_tokens(client, stored_user):
+    body = {"username": "user0", "email": "user0@example.com", "password": "secret"}
+    assert client.put("/api/users/user0/profile/update", json=body).status_code == 200
+    before = stored_user()
+    assert (before.token_version, before.refresh_token) == (0, "refresh")
+
+    body["password"] = "changed"
+    assert client.put("/api/users/user0/profile/update", json=body).status_code == 200
+    after = stored_user()
+    assert (after.token_version, after.refresh_token) == (1, None)
+    assert after.password != before.password
@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+from src.entity.models import Post
+
+
+@pytest.fixture
+def counters(session_maker):
+    def read(post_id: int) -> tuple:
+        async def select():
+            async with session_maker() as db:
+                post = await db.get(Post, post_id)
+                return post.rating_sum, post.rating_count, post.rating
+
+        return asyncio.run(select())
+
+    return read
+
+
+def test_rate_and_delete(client, post, users, current_user, counters):
+    # the seeded ratings are inserted without their counters, repair them first
+    assert client.post("/api/rating/repair").json() == {"repaired": [post]}
+    assert counters(post) == (90, 30, 3.0)
+    assert client.post("/api/rating/repair").json() == {"repaired": []}
+
+    current_user["id"] = users[0]
+    response = client.request("DELETE", "/api/rating/", json={"post_id": post, "user_name": "user5"})
+    assert response.status_code == 200
+    assert counters(post) == (85, 29, pytest.approx(85 / 29))
+
+    current_user["id"] = users[5]
+    response = client.post("/api/rating/", json={"post_id": post, "value": 5})
+    assert response.status_code == 200
+    assert response.json()["rating"] == 3.0
+    assert counters(post) == (90, 30, 3.0)
+    assert client.post("/api/rating/", json={"post_id": post, "value": 5}).status_code == 404
+
+
+def test_own_post_cannot_be_rated(client, post, counters):
+    assert client.post("/api/rating/", json={"post_id": post, "value": 5}).status_code == 403
+    assert counters(post) == (0, 0, 0.0)
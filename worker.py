@@ -0,0 +1,64 @@
+import asyncio
+import sys
+
+import redis.asyncio as redis
+
+import src.services.tasks  # noqa: F401, registers the jobs
+from src.conf.config import settings
+from src.database.db import sessionmanager
+from src.services.cache import cache_service
+from src.services.email import email_sender
+from src.services.gravatar import gravatar_resolver
+from src.services.jobs import job_queue
+from src.services.media import media_storage
+from src.services.principals import principal_cache
+from src.services.qr import qr_service
+
+
+async def main(queues: list):
+    """
+    The main function runs the jobs of the given queues until the process is stopped.
+    Every queue runs JOB_CONCURRENCY[queue] jobs at a time, without arguments all queues are worked.
+
+    Usage: python worker.py [queue ...]
+
+    :param queues: list: The names of the queues
+    :return: None
+    """
+    pool = redis.BlockingConnectionPool(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        db=0,
+        password=settings.REDIS_PASSWORD,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        timeout=settings.REDIS_POOL_TIMEOUT,
+    )
+    r = redis.Redis(connection_pool=pool)
+    cache_service.init(r)
+    principal_cache.init(r)
+    gravatar_resolver.init(r)
+    job_queue.init(r)
+    sessionmanager.start()
+    if "email" in queues:
+        # send what is left in the outbox, e.g. emails whose delivery could not be enqueued
+        await job_queue.enqueue("deliver_emails")
+    try:
+        await job_queue.work({queue: settings.JOB_CONCURRENCY[queue] for queue in queues})
+    finally:
+        await email_sender.close()
+        await principal_cache.close()
+        media_storage.shutdown()
+        qr_service.shutdown()
+        await sessionmanager.close()
+        await r.aclose()
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(settings.JOB_CONCURRENCY)
+    unknown = [name for name in names if name not in settings.JOB_CONCURRENCY]
+    if unknown:
+        sys.exit(f"Unknown queues: {', '.join(unknown)}")
+    try:
+        asyncio.run(main(names))
+    except KeyboardInterrupt:
+        pass